@@ -1,6 +1,6 @@
 import os
 from pathlib import Path
-from decouple import config
+from decouple import Choices, config
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -22,6 +22,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'loans.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -51,18 +52,136 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'credit_system.wsgi.application'
 
+# Route check-eligibility and the loan views to their async versions; set
+# when serving credit_system.asgi with an ASGI server such as uvicorn
+ASYNC_VIEWS = config('ASYNC_VIEWS', default=False, cast=bool)
+
 # Database
+# DB_POOL_MODE=pgbouncer targets a PgBouncer in transaction pooling mode
+# (DB_HOST/DB_PORT pointing at it): server-side cursors cannot outlive a
+# transaction there, so they are disabled
+DB_POOL_MODE = config('DB_POOL_MODE', default='none', cast=Choices(['none', 'pgbouncer']))
+# sqlite3 (DB_NAME being the file) is only meant for local experiments
+DB_ENGINE = config('DB_ENGINE', default='postgresql', cast=Choices(['postgresql', 'sqlite3']))
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': f'django.db.backends.{DB_ENGINE}',
         'NAME': config('DB_NAME', default='credit_approval'),
         'USER': config('DB_USER', default='postgres'),
         'PASSWORD': config('DB_PASSWORD', default='postgres'),
         'HOST': config('DB_HOST', default='db'),
         'PORT': config('DB_PORT', default='5432'),
+        # Seconds a worker keeps its connection open between requests. Async
+        # views do not reuse connections across requests, so under ASGI pool
+        # with PgBouncer instead
+        'CONN_MAX_AGE': config('DB_CONN_MAX_AGE', default=0 if ASYNC_VIEWS else 60, cast=int),
+        # Check a reused connection is still alive before handing it out
+        'CONN_HEALTH_CHECKS': config('DB_CONN_HEALTH_CHECKS', default=True, cast=bool),
+        'DISABLE_SERVER_SIDE_CURSORS': DB_POOL_MODE == 'pgbouncer',
     }
 }
 
+# Optional read replica (DB_REPLICA_HOST, or DB_REPLICA_NAME for a second
+# database on the same server or a second SQLite file). The loan views and
+# eligibility checks read from it, except for customers written within the
+# last REPLICA_STICKY_SECONDS, which should exceed the replication lag
+DB_REPLICA_HOST = config('DB_REPLICA_HOST', default='')
+DB_REPLICA_NAME = config('DB_REPLICA_NAME', default='')
+
+if DB_REPLICA_HOST or DB_REPLICA_NAME:
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': DB_REPLICA_NAME or DATABASES['default']['NAME'],
+        'HOST': DB_REPLICA_HOST or DATABASES['default']['HOST'],
+        'PORT': config('DB_REPLICA_PORT', default=DATABASES['default']['PORT']),
+        # Tests run against the primary's test database only
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['loans.routers.ReplicaRouter']
+REPLICA_STICKY_SECONDS = config('REPLICA_STICKY_SECONDS', default=5, cast=int)
+
+# Cache: Redis when configured, in-process memory otherwise (tests, local runs)
+REDIS_CACHE_URL = config('REDIS_CACHE_URL', default='')
+
+if REDIS_CACHE_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_CACHE_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Seconds a cached credit score stays valid (capped at the end of the year)
+CREDIT_SCORE_CACHE_TTL = config('CREDIT_SCORE_CACHE_TTL', default=3600, cast=int)
+
+# Maximum number of quotes accepted by /check-eligibility/batch
+ELIGIBILITY_BATCH_MAX_SIZE = config('ELIGIBILITY_BATCH_MAX_SIZE', default=1000, cast=int)
+
+# Page sizes of /view-loans when paginated with ?page_size / ?cursor
+VIEW_LOANS_PAGE_SIZE = config('VIEW_LOANS_PAGE_SIZE', default=100, cast=int)
+VIEW_LOANS_MAX_PAGE_SIZE = config('VIEW_LOANS_MAX_PAGE_SIZE', default=1000, cast=int)
+
+# Rows fetched per database round trip by /view-loans?stream=true
+VIEW_LOANS_STREAM_CHUNK_SIZE = config('VIEW_LOANS_STREAM_CHUNK_SIZE', default=2000, cast=int)
+
+# Seconds /view-loan and /view-loans responses are kept in the server-side
+# response cache, keyed by ETag (0 disables it; conditional GETs still work)
+LOAN_RESPONSE_CACHE_TTL = config('LOAN_RESPONSE_CACHE_TTL', default=0, cast=int)
+
+# Seconds a loan's customer stays cached for /view-loan ETags, and a
+# customer's cache version (or the global generation) is kept after it is
+# set or bumped. Both are re-derived when they expire
+# (a new version only invalidates), so keys do not pile up for every loan
+# and customer ever seen
+LOAN_OWNER_CACHE_TTL = config('LOAN_OWNER_CACHE_TTL', default=86400, cast=int)
+CACHE_VERSION_TTL = config('CACHE_VERSION_TTL', default=7 * 86400, cast=int)
+
+# Customers per Celery task of a bulk scoring job
+SCORING_CHUNK_SIZE = config('SCORING_CHUNK_SIZE', default=1000, cast=int)
+SCORING_MAX_CHUNK_SIZE = 10000
+
+# Columnar (Arrow) copies of ingested spreadsheets, keyed by file hash
+INGEST_CACHE_DIR = config('INGEST_CACHE_DIR', default=os.path.join(BASE_DIR, '.ingest_cache'))
+
+# Directory the /ingestion-jobs API may load files from
+INGEST_DATA_DIR = config('INGEST_DATA_DIR', default=str(BASE_DIR))
+
+# Request metrics served at /metrics. METRICS_SAMPLE_RATE is the share of
+# requests whose queries, database time and spans are recorded (and sent in
+# a Server-Timing header); queries of sampled requests slower than
+# SLOW_QUERY_MS are logged to loans.slow_queries
+METRICS_ENABLED = config('METRICS_ENABLED', default=True, cast=bool)
+METRICS_SAMPLE_RATE = config('METRICS_SAMPLE_RATE', default=0.1, cast=float)
+SLOW_QUERY_MS = config('SLOW_QUERY_MS', default=200, cast=float)
+
+# Seconds /portfolio results stay cached, and how often the celery beat
+# schedule recomputes them (keep it below the TTL so requests never miss)
+PORTFOLIO_CACHE_TTL = config('PORTFOLIO_CACHE_TTL', default=900, cast=int)
+PORTFOLIO_REFRESH_SECONDS = config('PORTFOLIO_REFRESH_SECONDS', default=300, cast=int)
+
+# Idempotency-Key handling of POST /register and /create-loan. Responses are
+# replayed to retries for IDEMPOTENCY_KEY_TTL seconds; a duplicate arriving
+# while the first request runs waits up to IDEMPOTENCY_WAIT_SECONDS (never
+# longer than IDEMPOTENCY_LOCK_SECONDS) and replays its response, or gets 409
+# when it is still running (keep it short: the wait holds a worker), and a
+# request that died without a response releases its key after
+# IDEMPOTENCY_LOCK_SECONDS. IDEMPOTENCY_CACHE also keeps stored responses in
+# the cache (on by default with Redis) so retries skip the database.
+# Celery beat deletes expired keys every IDEMPOTENCY_PURGE_SECONDS.
+IDEMPOTENCY_KEY_TTL = config('IDEMPOTENCY_KEY_TTL', default=86400, cast=int)
+IDEMPOTENCY_WAIT_SECONDS = config('IDEMPOTENCY_WAIT_SECONDS', default=5.0, cast=float)
+IDEMPOTENCY_LOCK_SECONDS = config('IDEMPOTENCY_LOCK_SECONDS', default=60, cast=int)
+IDEMPOTENCY_CACHE = config('IDEMPOTENCY_CACHE', default=bool(REDIS_CACHE_URL), cast=bool)
+IDEMPOTENCY_PURGE_SECONDS = config('IDEMPOTENCY_PURGE_SECONDS', default=3600, cast=int)
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
@@ -88,6 +207,18 @@ CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'UTC'
+# Run tasks in-process (no broker needed), e.g. for local runs
+CELERY_TASK_ALWAYS_EAGER = config('CELERY_TASK_ALWAYS_EAGER', default=False, cast=bool)
+CELERY_BEAT_SCHEDULE = {
+    'refresh-portfolio': {
+        'task': 'loans.tasks.refresh_portfolio',
+        'schedule': PORTFOLIO_REFRESH_SECONDS,
+    },
+    'purge-idempotency-keys': {
+        'task': 'loans.tasks.purge_idempotency_keys',
+        'schedule': IDEMPOTENCY_PURGE_SECONDS,
+    },
+}
 
 # REST Framework Configuration
 REST_FRAMEWORK = {
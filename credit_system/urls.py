@@ -1,7 +1,8 @@
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include
 
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path('', include('loans.urls')),
+    path('', include('loans.async_urls' if settings.ASYNC_VIEWS else 'loans.urls')),
 ]
@@ -1,5 +1,9 @@
 from django.contrib import admin
-from .models import Customer, Loan
+from django.db import transaction
+from .models import (
+    Customer, Loan, CustomerCreditProfile, IdempotencyKey, IngestedFile, IngestionJob, ScoringJob, CustomerScore
+)
+from .tasks import run_ingestion_job
 
 
 @admin.register(Customer)
@@ -15,3 +19,59 @@ class LoanAdmin(admin.ModelAdmin):
     search_fields = ['customer__first_name', 'customer__last_name']
     list_filter = ['start_date', 'interest_rate']
     raw_id_fields = ['customer']
+
+
+@admin.register(CustomerCreditProfile)
+class CustomerCreditProfileAdmin(admin.ModelAdmin):
+    list_display = ['customer', 'loan_count', 'total_loan_amount', 'total_monthly_repayment', 'updated_at']
+    raw_id_fields = ['customer']
+    readonly_fields = ['updated_at']
+
+
+@admin.register(IngestedFile)
+class IngestedFileAdmin(admin.ModelAdmin):
+    list_display = ['file_name', 'file_hash', 'rows', 'ingested_at']
+    search_fields = ['file_name', 'file_hash']
+
+
+@admin.register(ScoringJob)
+class ScoringJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'status', 'total_customers', 'scored_customers', 'created_at', 'finished_at']
+    list_filter = ['status']
+    readonly_fields = ['created_at', 'started_at', 'finished_at']
+
+
+@admin.register(CustomerScore)
+class CustomerScoreAdmin(admin.ModelAdmin):
+    list_display = ['customer', 'score', 'job', 'scored_at']
+    raw_id_fields = ['customer', 'job']
+
+
+@admin.register(IngestionJob)
+class IngestionJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'status', 'rows_done', 'total_rows', 'rows_per_second', 'created_at', 'finished_at']
+    list_filter = ['status']
+    actions = ['resume_jobs']
+
+    def has_add_permission(self, request):
+        # Jobs are created through POST /ingestion-jobs or ingest_data --background
+        return False
+
+    def get_readonly_fields(self, request, obj=None):
+        return [field.name for field in self.model._meta.fields]
+
+    @admin.action(description='Resume selected jobs (also restarts jobs left running by a stopped worker)')
+    def resume_jobs(self, request, queryset):
+        jobs = list(queryset.exclude(status=IngestionJob.COMPLETED).values_list('pk', flat=True))
+        IngestionJob.objects.filter(pk__in=jobs).update(status=IngestionJob.PENDING)
+        for job_id in jobs:
+            transaction.on_commit(lambda job_id=job_id: run_ingestion_job.delay(job_id))
+        self.message_user(request, f'Queued {len(jobs)} ingestion jobs')
+
+
+@admin.register(IdempotencyKey)
+class IdempotencyKeyAdmin(admin.ModelAdmin):
+    list_display = ['key', 'scope', 'status_code', 'created_at', 'expires_at']
+    list_filter = ['scope', 'status_code']
+    search_fields = ['key']
+    readonly_fields = ['created_at']
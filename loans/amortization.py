@@ -0,0 +1,112 @@
+from dataclasses import dataclass
+from decimal import Decimal
+import numpy as np
+
+
+def as_float_array(values):
+    """Convert a sequence of numbers (Decimals included) to a float64 array"""
+    if isinstance(values, np.ndarray):
+        return values.astype(np.float64)
+    return np.fromiter(map(float, values), dtype=np.float64, count=len(values))
+
+
+@dataclass(frozen=True)
+class AmortizationSchedule:
+    """
+    Installments of many loans as (loans x months) int64 arrays in paise.
+    balance is the principal outstanding after each installment.
+    """
+    months: np.ndarray
+    payment: np.ndarray
+    principal: np.ndarray
+    interest: np.ndarray
+    balance: np.ndarray
+
+
+def _balances(principal, rate, installment, tenure, paid):
+    """
+    Principal outstanding, in paise, after `paid` installments (broadcast
+    against the other arrays): P(1 + r)^k - EMI((1 + r)^k - 1) / r, rounded
+    to the paisa, never negative and zero once the tenure is over
+    """
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        # (1 + r)^k - 1 via expm1/log1p keeps precision for small rates
+        growth = np.expm1(paid * np.log1p(rate))
+        balance = np.where(
+            rate == 0,
+            principal - installment * paid,
+            principal + principal * growth - installment * growth / rate,
+        )
+    balance = np.round(np.nan_to_num(balance)).clip(min=0)
+    balance = np.where(paid >= tenure, 0, balance)
+    balance = np.where(paid <= 0, principal, balance)
+    return balance.astype(np.int64)
+
+
+def _loan_columns(loan_amounts, interest_rates, installments, tenures):
+    return (
+        np.round(as_float_array(loan_amounts) * 100),
+        as_float_array(interest_rates) / 12 / 100,
+        np.round(as_float_array(installments) * 100),
+        as_float_array(tenures),
+    )
+
+
+def amortization_schedules(loan_amounts, interest_rates, installments, tenures, months):
+    """
+    Vectorized amortization of many loans over the same installment numbers
+    (1-based `months`). Each installment pays the loan's stored monthly
+    installment, split into the interest accrued on the opening balance and
+    principal; the installment that clears the loan (at the latest the
+    last one) pays the remaining principal plus its interest, and
+    installments past the tenure are zero.
+    """
+    principal, rate, installment, tenure = (
+        column[:, None] for column in _loan_columns(loan_amounts, interest_rates, installments, tenures)
+    )
+    months = np.asarray(months, dtype=np.int64)
+    k = months[None, :].astype(np.float64)
+
+    opening = _balances(principal, rate, installment, tenure, k - 1)
+    closing = _balances(principal, rate, installment, tenure, k)
+    principal_paid = opening - closing
+    regular = (closing > 0) & (k < tenure)
+    interest = np.where(
+        regular,
+        installment.astype(np.int64) - principal_paid,
+        np.round(opening * rate).astype(np.int64),
+    )
+    return AmortizationSchedule(
+        months=months,
+        payment=principal_paid + interest,
+        principal=principal_paid,
+        interest=interest,
+        balance=closing,
+    )
+
+
+def outstanding_principal_cents(loan_amounts, interest_rates, installments, tenures, paid):
+    """
+    Principal outstanding, in paise, of each loan after its `paid`
+    installments, as an int64 array
+    """
+    principal, rate, installment, tenure = _loan_columns(loan_amounts, interest_rates, installments, tenures)
+    return _balances(principal, rate, installment, tenure, as_float_array(paid))
+
+
+def outstanding_principal(loan_amount, interest_rate, installment, tenure, paid):
+    """Scalar outstanding_principal_cents returning a Decimal"""
+    cents = outstanding_principal_cents([loan_amount], [interest_rate], [installment], [tenure], [paid])
+    return Decimal(int(cents[0])).scaleb(-2)
+
+
+def installment_due_dates(start_date, months):
+    """
+    Due dates of installments `months` (1-based) of a loan starting on
+    start_date: the same day of the month, or the month's last day when
+    it is shorter
+    """
+    due_months = np.datetime64(start_date, 'M') + np.asarray(months, dtype=np.int64)
+    first_days = due_months.astype('datetime64[D]')
+    month_lengths = ((due_months + 1).astype('datetime64[D]') - first_days).astype(np.int64)
+    return (first_days + np.minimum(start_date.day, month_lengths) - 1).tolist()
@@ -0,0 +1,15 @@
+from django.urls import path
+from . import async_views
+from .urls import urlpatterns as sync_urlpatterns
+
+ASYNC_VIEWS = {
+    'check-eligibility': async_views.check_eligibility,
+    'view-loan': async_views.view_loan,
+    'view-loans': async_views.view_loans_by_customer,
+}
+
+# The sync routes, with the endpoints that have async versions swapped in
+urlpatterns = [
+    path(str(pattern.pattern), ASYNC_VIEWS.get(pattern.name, pattern.callback), name=pattern.name)
+    for pattern in sync_urlpatterns
+]
@@ -0,0 +1,180 @@
+# Async versions of the read-heavy endpoints, routed through async_urls.py
+# when ASYNC_VIEWS is set and served under ASGI. DRF's APIView cannot run
+# async handlers, so these are plain Django views that validate with the
+# same serializers and render with the same renderers; responses are
+# byte-for-byte those of the sync views.
+import json
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from .cache import (
+    aget_loan_owner, aremember_loan_owner, aresponse_etag, aget_cached_response, acache_response
+)
+from .models import Customer, Loan
+from .pagination import LoanCursorPagination
+from .renderers import FastJSONRenderer
+from .routers import areplica_alias, read_from
+from .serializers import (
+    CheckEligibilitySerializer, LoanListQuerySerializer,
+    LOAN_DETAIL_VALUES, LOAN_LIST_VALUES, loan_detail_row, loan_list_row
+)
+from .utils import acheck_loan_eligibility
+from .views import eligibility_response_data, etag_matches
+
+
+def json_response(data, status_code=status.HTTP_200_OK, renderer=None, etag=None):
+    response = HttpResponse(
+        (renderer or JSONRenderer()).render(data), status=status_code, content_type='application/json'
+    )
+    if etag is not None:
+        response['ETag'] = etag
+    return response
+
+
+def method_not_allowed(request, allowed):
+    response = json_response(
+        {'detail': f'Method "{request.method}" not allowed.'}, status.HTTP_405_METHOD_NOT_ALLOWED
+    )
+    response['Allow'] = allowed
+    return response
+
+
+def not_found():
+    return json_response({'detail': 'Not found.'}, status.HTTP_404_NOT_FOUND)
+
+
+def not_modified(etag):
+    response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+    response['ETag'] = etag
+    return response
+
+
+async def check_eligibility(request):
+    """
+    Check loan eligibility based on credit score
+    """
+    if request.method != 'POST':
+        return method_not_allowed(request, 'POST, OPTIONS')
+
+    try:
+        payload = json.loads(request.body)
+    except ValueError as exc:
+        return json_response({'detail': f'JSON parse error - {exc}'}, status.HTTP_400_BAD_REQUEST)
+
+    serializer = CheckEligibilitySerializer(data=payload)
+    if not serializer.is_valid():
+        return json_response(serializer.errors, status.HTTP_400_BAD_REQUEST)
+
+    data = serializer.validated_data
+
+    with read_from(await areplica_alias(data['customer_id'])):
+        try:
+            customer = await Customer.objects.select_related('credit_profile').aget(
+                customer_id=data['customer_id']
+            )
+        except Customer.DoesNotExist:
+            return json_response({'error': 'Customer not found'}, status.HTTP_404_NOT_FOUND)
+
+        approval, corrected_rate, monthly_installment, message = await acheck_loan_eligibility(
+            customer, data['loan_amount'], data['interest_rate'], data['tenure']
+        )
+
+    return json_response(eligibility_response_data(
+        customer, approval, data['interest_rate'], corrected_rate, data['tenure'], monthly_installment
+    ))
+
+
+# CSRF checks do not apply to this JSON API (DRF's api_view exempts them too)
+check_eligibility.csrf_exempt = True
+
+
+async def view_loan(request, loan_id):
+    """
+    View loan details by loan_id
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return method_not_allowed(request, 'GET, HEAD, OPTIONS')
+
+    owner = await aget_loan_owner(loan_id)
+    etag = None
+    if owner is not None:
+        etag = await aresponse_etag(owner, request.build_absolute_uri())
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        data = await aget_cached_response(etag)
+        if data is not None:
+            return json_response(data, renderer=FastJSONRenderer(), etag=etag)
+
+    with read_from(await areplica_alias(owner)):
+        try:
+            loan = await Loan.objects.values(*LOAN_DETAIL_VALUES).aget(loan_id=loan_id)
+        except Loan.DoesNotExist:
+            return not_found()
+    data = loan_detail_row(loan)
+
+    if owner != loan['customer__customer_id']:
+        await aremember_loan_owner(loan_id, loan['customer__customer_id'])
+        return json_response(data, renderer=FastJSONRenderer())
+
+    await acache_response(etag, data)
+    return json_response(data, renderer=FastJSONRenderer(), etag=etag)
+
+
+async def view_loans_by_customer(request, customer_id):
+    """
+    View all loans for a customer, paginated with ?page_size / ?cursor or
+    streamed as NDJSON with ?stream=true
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return method_not_allowed(request, 'GET, HEAD, OPTIONS')
+
+    query = LoanListQuerySerializer(data=request.GET)
+    if not query.is_valid():
+        return json_response(query.errors, status.HTTP_400_BAD_REQUEST)
+
+    etag = await aresponse_etag(customer_id, request.build_absolute_uri())
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    alias = await areplica_alias(customer_id)
+    if query.validated_data['stream']:
+        if not await Customer.objects.using(alias).filter(customer_id=customer_id).aexists():
+            return not_found()
+        rows = Loan.objects.using(alias).filter(customer_id=customer_id).values(*LOAN_LIST_VALUES).order_by(
+            'loan_id'
+        ).aiterator(chunk_size=settings.VIEW_LOANS_STREAM_CHUNK_SIZE)
+        response = StreamingHttpResponse(
+            ndjson_lines(rows), content_type='application/x-ndjson'
+        )
+        response['ETag'] = etag
+        return response
+
+    data = await aget_cached_response(etag)
+    if data is None:
+        if not await Customer.objects.using(alias).filter(customer_id=customer_id).aexists():
+            return not_found()
+        loans = Loan.objects.using(alias).filter(customer_id=customer_id).values(*LOAN_LIST_VALUES)
+        if 'cursor' in query.validated_data or 'page_size' in query.validated_data:
+            data = await sync_to_async(paginate_loans)(loans, Request(request))
+        else:
+            data = [loan_list_row(row) async for row in loans]
+        await acache_response(etag, data)
+
+    return json_response(data, renderer=FastJSONRenderer(), etag=etag)
+
+
+async def ndjson_lines(rows):
+    renderer = FastJSONRenderer()
+    async for row in rows:
+        yield renderer.render(loan_list_row(row)) + b'\n'
+
+
+def paginate_loans(loans, request):
+    """Run the (sync) cursor paginator, returning the response envelope"""
+    paginator = LoanCursorPagination()
+    page = paginator.paginate_queryset(loans, request)
+    return paginator.get_paginated_response([loan_list_row(row) for row in page]).data
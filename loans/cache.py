@@ -0,0 +1,227 @@
+import hashlib
+import threading
+import time
+from datetime import datetime
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .routers import stick_to_primary
+
+
+CUSTOMER_VERSION_KEY = 'credit:version:{customer_id}'
+GENERATION_KEY = 'credit:generation'
+LOAN_OWNER_KEY = 'loans:owner:{loan_id}'
+RESPONSE_KEY = 'loans:response:{etag}'
+
+_stats_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0}
+
+
+def _new_version():
+    """
+    Versions are timestamps so a version evicted from the cache is never
+    handed out again for different data
+    """
+    return time.time_ns()
+
+
+def _get_or_init(key, value):
+    """Return the stored value for key, initialising it when absent"""
+    if cache.add(key, value, timeout=settings.CACHE_VERSION_TTL):
+        return value
+    return cache.get(key, value)
+
+
+def get_customer_version(customer_id):
+    """
+    Return the current cache version of a customer's credit data. It changes
+    whenever the customer or one of their loans changes, and whenever the
+    global generation is bumped after bulk loads.
+    """
+    version_key = CUSTOMER_VERSION_KEY.format(customer_id=customer_id)
+    values = cache.get_many([version_key, GENERATION_KEY])
+
+    version = values.get(version_key)
+    if version is None:
+        version = _get_or_init(version_key, _new_version())
+
+    generation = values.get(GENERATION_KEY)
+    if generation is None:
+        generation = _get_or_init(GENERATION_KEY, _new_version())
+
+    return f'{generation}.{version}'
+
+
+async def _aget_or_init(key, value):
+    if await cache.aadd(key, value, timeout=settings.CACHE_VERSION_TTL):
+        return value
+    return await cache.aget(key, value)
+
+
+async def aget_customer_version(customer_id):
+    """Async variant of get_customer_version"""
+    version_key = CUSTOMER_VERSION_KEY.format(customer_id=customer_id)
+    values = await cache.aget_many([version_key, GENERATION_KEY])
+
+    version = values.get(version_key)
+    if version is None:
+        version = await _aget_or_init(version_key, _new_version())
+
+    generation = values.get(GENERATION_KEY)
+    if generation is None:
+        generation = await _aget_or_init(GENERATION_KEY, _new_version())
+
+    return f'{generation}.{version}'
+
+
+def get_customer_versions(customer_ids):
+    """
+    Return {customer_id: version} for many customers in one cache round trip
+    """
+    version_keys = {
+        customer_id: CUSTOMER_VERSION_KEY.format(customer_id=customer_id)
+        for customer_id in customer_ids
+    }
+    values = cache.get_many(list(version_keys.values()) + [GENERATION_KEY])
+
+    generation = values.get(GENERATION_KEY)
+    if generation is None:
+        generation = _get_or_init(GENERATION_KEY, _new_version())
+
+    versions = {}
+    for customer_id, version_key in version_keys.items():
+        version = values.get(version_key)
+        if version is None:
+            version = _get_or_init(version_key, _new_version())
+        versions[customer_id] = f'{generation}.{version}'
+    return versions
+
+
+def bump_customer_version(customer_id):
+    """
+    Invalidate every cached entry of a customer. The bump is repeated once
+    the surrounding transaction commits, so an entry recomputed from
+    not-yet-committed data in the meantime is invalidated as well. The
+    customer's reads also stay on the primary while the replica catches up.
+    """
+    stick_to_primary(customer_id)
+    version_key = CUSTOMER_VERSION_KEY.format(customer_id=customer_id)
+    cache.set(version_key, _new_version(), settings.CACHE_VERSION_TTL)
+    transaction.on_commit(lambda: cache.set(version_key, _new_version(), settings.CACHE_VERSION_TTL))
+
+
+def bump_generation():
+    """
+    Invalidate the cached entries of every customer, used after bulk loads
+    that bypass model signals, and read everyone from the primary while the
+    replica catches up
+    """
+    stick_to_primary()
+    cache.set(GENERATION_KEY, _new_version(), settings.CACHE_VERSION_TTL)
+    transaction.on_commit(lambda: cache.set(GENERATION_KEY, _new_version(), settings.CACHE_VERSION_TTL))
+
+
+def get_loan_owner(loan_id):
+    """Cached customer_id of a loan, or None when not cached"""
+    return cache.get(LOAN_OWNER_KEY.format(loan_id=loan_id))
+
+
+async def aget_loan_owner(loan_id):
+    return await cache.aget(LOAN_OWNER_KEY.format(loan_id=loan_id))
+
+
+def remember_loan_owner(loan_id, customer_id):
+    cache.set(LOAN_OWNER_KEY.format(loan_id=loan_id), customer_id, settings.LOAN_OWNER_CACHE_TTL)
+
+
+async def aremember_loan_owner(loan_id, customer_id):
+    await cache.aset(LOAN_OWNER_KEY.format(loan_id=loan_id), customer_id, settings.LOAN_OWNER_CACHE_TTL)
+
+
+def forget_loan_owner(loan_id):
+    """Drop a deleted loan's cached owner"""
+    cache.delete(LOAN_OWNER_KEY.format(loan_id=loan_id))
+
+
+def _etag(version, url):
+    return '"%s"' % hashlib.sha1(f'{version}:{url}'.encode()).hexdigest()
+
+
+def response_etag(customer_id, url):
+    """
+    Strong ETag of a loan view response, derived from the customer's cache
+    version, so it changes whenever the customer or their loans change
+    """
+    return _etag(get_customer_version(customer_id), url)
+
+
+async def aresponse_etag(customer_id, url):
+    return _etag(await aget_customer_version(customer_id), url)
+
+
+def get_cached_response(etag):
+    """Response data stored for an ETag, or None"""
+    if not settings.LOAN_RESPONSE_CACHE_TTL:
+        return None
+    return cache.get(RESPONSE_KEY.format(etag=etag))
+
+
+async def aget_cached_response(etag):
+    if not settings.LOAN_RESPONSE_CACHE_TTL:
+        return None
+    return await cache.aget(RESPONSE_KEY.format(etag=etag))
+
+
+def cache_response(etag, data):
+    if settings.LOAN_RESPONSE_CACHE_TTL:
+        cache.set(RESPONSE_KEY.format(etag=etag), data, settings.LOAN_RESPONSE_CACHE_TTL)
+
+
+async def acache_response(etag, data):
+    if settings.LOAN_RESPONSE_CACHE_TTL:
+        await cache.aset(RESPONSE_KEY.format(etag=etag), data, settings.LOAN_RESPONSE_CACHE_TTL)
+
+
+def seconds_until_next_year(now=None):
+    """Seconds left before the current-year score component rolls over"""
+    now = now or datetime.now()
+    next_year = datetime(now.year + 1, 1, 1, tzinfo=now.tzinfo)
+    return max(int((next_year - now).total_seconds()), 1)
+
+
+def credit_cache_timeout(now=None):
+    """
+    Cache timeout for credit data, never extending past the end of the year
+    """
+    return min(settings.CREDIT_SCORE_CACHE_TTL, seconds_until_next_year(now))
+
+
+def record_hit():
+    with _stats_lock:
+        _stats['hits'] += 1
+
+
+def record_miss():
+    with _stats_lock:
+        _stats['misses'] += 1
+
+
+def get_cache_stats():
+    """
+    Return the credit cache hit/miss counters of this process
+    """
+    with _stats_lock:
+        hits, misses = _stats['hits'], _stats['misses']
+    lookups = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': hits / lookups if lookups else 0.0,
+    }
+
+
+def reset_cache_stats():
+    with _stats_lock:
+        _stats['hits'] = 0
+        _stats['misses'] = 0
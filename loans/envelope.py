@@ -0,0 +1,154 @@
+# Eligibility envelopes. check_loan_eligibility depends on a customer only
+# through their credit score, which fixes the minimum interest rate, and the
+# installment headroom left under the 50%-of-salary rule. An envelope keeps
+# just those, cached per customer version, so any quote - and the largest
+# approvable loan amount for any tenure and rate - is answered without
+# touching the database.
+from dataclasses import dataclass
+from datetime import datetime
+from decimal import Decimal, ROUND_FLOOR
+import numpy as np
+from django.core.cache import cache
+
+from .amortization import as_float_array
+from .cache import credit_cache_timeout, get_customer_version
+from .models import Customer
+from .routers import read_from, replica_alias
+from .utils import (
+    LoanAggregates, decide_eligibility, get_corrected_interest_rate, get_credit_snapshot,
+    calculate_monthly_installment, monthly_installment_cents
+)
+
+
+ENVELOPE_KEY = 'credit:envelope:{customer_id}:{version}:{year}'
+
+# Grid served by /eligibility-envelope unless the request picks its own
+DEFAULT_TENURES = [6, 12, 18, 24, 36, 48, 60]
+DEFAULT_INTEREST_RATES = [8, 10, 12, 14, 16, 18, 20]
+
+# Largest amount Loan.loan_amount holds, in paise
+MAX_LOAN_AMOUNT_CENTS = 10 ** 12 - 1
+
+
+@dataclass(frozen=True)
+class EligibilityEnvelope:
+    """
+    The inputs of the approval rules for one customer at one version of
+    their credit data
+    """
+    customer_id: int
+    version: str
+    credit_score: int
+    monthly_salary: Decimal
+    total_monthly_repayment: Decimal
+
+    @property
+    def emi_headroom(self):
+        """Largest installment a new loan may add under the 50%-of-salary rule"""
+        return self.monthly_salary * Decimal('0.5') - self.total_monthly_repayment
+
+    @property
+    def approvable(self):
+        """Whether any loan can be approved at all"""
+        return self.credit_score > 10 and self.emi_headroom >= 0
+
+    @property
+    def minimum_interest_rate(self):
+        """Rate requests are raised to, 0 when the score allows any rate"""
+        if not self.approvable:
+            return None
+        return get_corrected_interest_rate(self.credit_score, Decimal('0'))
+
+    def quote(self, loan_amount, interest_rate, tenure):
+        """
+        check_loan_eligibility for this customer, without database access
+        Returns: (approval_status, corrected_interest_rate, monthly_installment, message)
+        """
+        corrected_rate = get_corrected_interest_rate(self.credit_score, Decimal(str(interest_rate)))
+        monthly_installment = calculate_monthly_installment(loan_amount, corrected_rate, tenure)
+        # The envelope stands in for the customer: the rules only read the
+        # salary and the existing installments
+        approval, message = decide_eligibility(
+            self, LoanAggregates(total_monthly_repayment=self.total_monthly_repayment),
+            self.credit_score, monthly_installment
+        )
+        return approval, corrected_rate, monthly_installment, message
+
+    def max_loan_amounts(self, interest_rates, tenures):
+        """
+        Largest approvable loan amount, as a Decimal, for each tenure (rows)
+        and requested interest rate (columns); None everywhere when no loan
+        can be approved. Amounts are exact to the paisa: the installment of
+        one paisa more exceeds the headroom.
+        """
+        if not self.approvable:
+            return [[None] * len(interest_rates) for _ in tenures]
+
+        rates = [get_corrected_interest_rate(self.credit_score, Decimal(str(rate))) for rate in interest_rates]
+        grid_rates = rates * len(tenures)
+        grid_tenures = [tenure for tenure in tenures for _ in rates]
+        headroom = int(self.emi_headroom.scaleb(2).to_integral_value(rounding=ROUND_FLOOR))
+
+        # Installment per paisa of principal, inverted for a first estimate
+        # within a few paise of the answer
+        r = as_float_array(grid_rates) / 12 / 100
+        n = as_float_array(grid_tenures)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            growth = np.expm1(n * np.log1p(r))
+            per_cent = np.where(r == 0, 1 / n, r * (growth + 1) / growth)
+            estimate = np.floor((headroom + 0.5) / per_cent)
+        amounts = np.clip(np.nan_to_num(estimate, nan=0.0), 0, MAX_LOAN_AMOUNT_CENTS).astype(np.int64)
+
+        def installments(cents):
+            return monthly_installment_cents(
+                [Decimal(int(value)).scaleb(-2) for value in cents.tolist()], grid_rates, grid_tenures
+            )
+
+        # Installments grow with the amount, so step down while over the
+        # headroom and up while one more paisa still fits
+        while True:
+            over = (installments(amounts) > headroom) & (amounts > 0)
+            if not over.any():
+                break
+            amounts = amounts - over
+        while True:
+            fits = (installments(amounts + 1) <= headroom) & (amounts < MAX_LOAN_AMOUNT_CENTS)
+            if not fits.any():
+                break
+            amounts = amounts + fits
+
+        values = [Decimal(value).scaleb(-2) for value in amounts.tolist()]
+        return [values[row * len(rates):(row + 1) * len(rates)] for row in range(len(tenures))]
+
+
+def build_envelope(customer, version):
+    aggregates, breakdown = get_credit_snapshot(customer)
+    return EligibilityEnvelope(
+        customer_id=customer.customer_id,
+        version=version,
+        credit_score=breakdown.score,
+        monthly_salary=customer.monthly_salary,
+        total_monthly_repayment=aggregates.total_monthly_repayment,
+    )
+
+
+def get_eligibility_envelope(customer_id):
+    """
+    Return the customer's EligibilityEnvelope, built once per version of
+    their credit data and served from the cache without database access
+    afterwards, or None when the customer does not exist
+    """
+    version = get_customer_version(customer_id)
+    key = ENVELOPE_KEY.format(customer_id=customer_id, version=version, year=datetime.now().year)
+    envelope = cache.get(key)
+    if envelope is not None:
+        return envelope
+
+    # Nothing is written, so the customer can be read from the replica
+    with read_from(replica_alias(customer_id)):
+        customer = Customer.objects.select_related('credit_profile').filter(customer_id=customer_id).first()
+        if customer is None:
+            return None
+        envelope = build_envelope(customer, version)
+    cache.set(key, envelope, credit_cache_timeout())
+    return envelope
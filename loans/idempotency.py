@@ -0,0 +1,174 @@
+# Idempotency-Key support for POST endpoints. The first request with a key
+# claims it by inserting an IdempotencyKey row, runs the view and stores the
+# response on the row; retries with the same key get the stored response
+# back without running the view again. A duplicate arriving while the first
+# request is still running polls the row for up to IDEMPOTENCY_WAIT_SECONDS
+# and replays the response once it is stored, or gets 409 with Retry-After
+# when the first request outlasts the wait. A claim expires after
+# IDEMPOTENCY_LOCK_SECONDS, so a request that died mid-way does not hold its
+# key forever, and a stored response after IDEMPOTENCY_KEY_TTL.
+import hashlib
+import json
+import time
+from datetime import timedelta
+from functools import wraps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+
+HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+RESPONSE_KEY = 'idempotency:{scope}:{key_hash}'
+
+# Polling interval of a duplicate waiting for the first request, doubling
+# up to the maximum, and the Retry-After sent when it stops waiting
+POLL_SECONDS = 0.01
+MAX_POLL_SECONDS = 0.2
+RETRY_AFTER_SECONDS = 1
+
+
+def request_hash(request):
+    """Fingerprint of a request's method, path and parsed body"""
+    body = json.dumps(request.data, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(f'{request.method} {request.path}\n{body}'.encode()).hexdigest()
+
+
+def _response_key(scope, key):
+    return RESPONSE_KEY.format(scope=scope, key_hash=hashlib.sha256(key.encode()).hexdigest())
+
+
+def _lookup(scope, key):
+    """The live IdempotencyKey of scope and key, from the cache when stored there"""
+    if settings.IDEMPOTENCY_CACHE:
+        stored = cache.get(_response_key(scope, key))
+        if stored is not None:
+            return IdempotencyKey(scope=scope, key=key, **stored)
+    return IdempotencyKey.objects.filter(scope=scope, key=key, expires_at__gt=timezone.now()).first()
+
+
+def _claim(scope, key, fingerprint):
+    """Insert the row claiming a key, returning None when it is already taken"""
+    now = timezone.now()
+    for _ in range(2):
+        try:
+            with transaction.atomic():
+                return IdempotencyKey.objects.create(
+                    scope=scope, key=key, request_hash=fingerprint,
+                    expires_at=now + timedelta(seconds=settings.IDEMPOTENCY_LOCK_SECONDS),
+                )
+        except IntegrityError:
+            # An expired row keeps the key until it is deleted
+            if not IdempotencyKey.objects.filter(scope=scope, key=key, expires_at__lte=now).delete()[0]:
+                return None
+    return None
+
+
+def _run(view, record, request, args, kwargs):
+    """
+    Run the view for the request holding the key and store its response in
+    the same transaction as the view's writes, so a request that dies
+    mid-way leaves neither behind. A server error or exception releases the
+    key so the request can be retried.
+    """
+    try:
+        with transaction.atomic():
+            # Holding the claim's row lock keeps a duplicate from taking
+            # over the key while the view runs
+            if not IdempotencyKey.objects.select_for_update().filter(pk=record.pk, status_code=None).exists():
+                return _in_progress()
+            response = view(request, *args, **kwargs)
+            if response.status_code >= 500:
+                IdempotencyKey.objects.filter(pk=record.pk).delete()
+                return response
+
+            record.status_code = response.status_code
+            record.response_body = (
+                None if response.data is None else json.loads(JSONRenderer().render(response.data))
+            )
+            record.expires_at = timezone.now() + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+            IdempotencyKey.objects.filter(pk=record.pk).update(
+                status_code=record.status_code, response_body=record.response_body, expires_at=record.expires_at
+            )
+    except Exception:
+        IdempotencyKey.objects.filter(pk=record.pk, status_code=None).delete()
+        raise
+
+    if settings.IDEMPOTENCY_CACHE:
+        cache.set(_response_key(record.scope, record.key), {
+            'request_hash': record.request_hash,
+            'status_code': record.status_code,
+            'response_body': record.response_body,
+            'expires_at': record.expires_at,
+        }, settings.IDEMPOTENCY_KEY_TTL)
+    return response
+
+
+def _in_progress():
+    return Response(
+        {'error': f'A request with this {HEADER} is still in progress'},
+        status=status.HTTP_409_CONFLICT, headers={'Retry-After': str(RETRY_AFTER_SECONDS)}
+    )
+
+
+def idempotent(view):
+    """
+    Make a DRF function view honour the Idempotency-Key header: the first
+    response below 500 to a key is replayed to every retry with the same
+    key and body, marked with an Idempotent-Replayed header. Reusing a key
+    for a different body is rejected with 422. A duplicate of a request
+    still running waits for its response, and gets 409 when none is stored
+    within IDEMPOTENCY_WAIT_SECONDS.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if key is None:
+            return view(request, *args, **kwargs)
+        if not key or len(key) > MAX_KEY_LENGTH:
+            return Response(
+                {'error': f'{HEADER} must be 1 to {MAX_KEY_LENGTH} characters'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        match = request.resolver_match
+        scope = (match.url_name if match else None) or request.path
+        fingerprint = request_hash(request)
+        # Past the claim's lifetime the key is free again, so waiting any
+        # longer than that is pointless
+        wait = min(settings.IDEMPOTENCY_WAIT_SECONDS, settings.IDEMPOTENCY_LOCK_SECONDS)
+        deadline = time.monotonic() + wait
+        delay = POLL_SECONDS
+        while True:
+            record = _lookup(scope, key)
+            if record is None:
+                record = _claim(scope, key, fingerprint)
+                if record is not None:
+                    return _run(view, record, request, args, kwargs)
+                # Claimed by a concurrent request since the lookup
+                continue
+            if record.request_hash != fingerprint:
+                return Response(
+                    {'error': f'{HEADER} was already used for a different request'},
+                    status=status.HTTP_422_UNPROCESSABLE_ENTITY
+                )
+            if record.status_code is not None:
+                return Response(record.response_body, status=record.status_code, headers={REPLAYED_HEADER: 'true'})
+            if time.monotonic() >= deadline:
+                return _in_progress()
+            time.sleep(delay)
+            delay = min(delay * 2, MAX_POLL_SECONDS)
+
+    return wrapper
+
+
+def purge_expired_keys():
+    """Delete expired keys, returning how many were deleted"""
+    return IdempotencyKey.objects.filter(expires_at__lte=timezone.now()).delete()[0]
@@ -0,0 +1,616 @@
+import io
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from decimal import Decimal
+import pandas as pd
+from openpyxl import load_workbook
+from django.conf import settings
+from django.core.management.color import no_style
+from django.db import connection, connections, transaction
+from django.utils import timezone
+
+from .amortization import outstanding_principal_cents
+from .cache import bump_generation
+from .models import Customer, Loan, IngestedFile, IngestionJob
+from .profiles import rebuild_credit_profiles
+from .staging import (
+    StagingCache, staging_available, file_digest, is_staged, count_staged_rows, read_staged_frames
+)
+from .utils import calculate_monthly_installments
+
+
+@dataclass
+class IngestStats:
+    """
+    Counters for one ingested file
+    """
+    rows: int = 0
+    created: int = 0
+    updated: int = 0
+    skipped: int = 0
+    seconds: float = 0.0
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.seconds if self.seconds else 0.0
+
+
+def _is_csv(file_path):
+    return os.path.splitext(file_path)[1].lower() == '.csv'
+
+
+def count_rows(file_path):
+    """
+    Number of data rows (header excluded) in an .xlsx, .csv or staged file
+    """
+    if is_staged(file_path):
+        return count_staged_rows(file_path)
+
+    if _is_csv(file_path):
+        with open(file_path, 'rb') as f:
+            return max(sum(1 for _ in f) - 1, 0)
+
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        sheet = workbook.active
+        if sheet.max_row is not None:
+            return max(sheet.max_row - 1, 0)
+        return max(sum(1 for _ in sheet.iter_rows(values_only=True)) - 1, 0)
+    finally:
+        workbook.close()
+
+
+def read_frames(file_path, chunk_size, start=0, stop=None):
+    """
+    Yield data rows [start, stop) of an .xlsx, .csv or staged Arrow file as
+    DataFrames of at most chunk_size rows, without loading the whole file
+    into memory
+    """
+    if is_staged(file_path):
+        yield from read_staged_frames(file_path, chunk_size, start, stop)
+        return
+
+    if _is_csv(file_path):
+        yield from pd.read_csv(
+            file_path,
+            chunksize=chunk_size,
+            skiprows=range(1, start + 1),
+            nrows=None if stop is None else stop - start,
+        )
+        return
+
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        sheet = workbook.active
+        header = [str(name).strip() for name in next(sheet.iter_rows(max_row=1, values_only=True))]
+        rows = sheet.iter_rows(
+            min_row=start + 2,
+            max_row=None if stop is None else stop + 1,
+            values_only=True,
+        )
+        chunk = []
+        for row in rows:
+            if all(value is None for value in row):
+                continue
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                yield pd.DataFrame(chunk, columns=header)
+                chunk = []
+        if chunk:
+            yield pd.DataFrame(chunk, columns=header)
+    finally:
+        workbook.close()
+
+
+def partition_rows(total_rows, partitions):
+    """
+    Split [0, total_rows) into at most `partitions` contiguous row ranges
+    """
+    partitions = max(min(partitions, total_rows), 1)
+    size, extra = divmod(total_rows, partitions)
+    ranges = []
+    start = 0
+    for index in range(partitions):
+        stop = start + size + (1 if index < extra else 0)
+        ranges.append((start, stop))
+        start = stop
+    return ranges
+
+
+def _decimals(series):
+    return series.map(lambda value: Decimal(str(value)))
+
+
+def normalize_customers(df):
+    """
+    Convert a spreadsheet chunk into a frame of Customer field values
+    """
+    frame = pd.DataFrame({
+        'customer_id': df['Customer ID'].astype('int64'),
+        'first_name': df['First Name'].astype(str),
+        'last_name': df['Last Name'].astype(str),
+        'age': 25,  # Default age as not in Excel
+        'phone_number': df['Phone Number'].astype('int64'),
+        'monthly_salary': _decimals(df['Monthly Salary']),
+        'approved_limit': _decimals(df['Approved Limit']),
+    })
+    # Only set (and on upsert, overwrite) current debt when the sheet carries it
+    if 'Current Debt' in df:
+        frame['current_debt'] = _decimals(df['Current Debt'])
+    return frame.drop_duplicates('customer_id', keep='first')
+
+
+def normalize_loans(df, recompute_emi=False):
+    """
+    Convert a spreadsheet chunk into a frame of Loan field values
+    """
+    if recompute_emi:
+        monthly_repayment = pd.Series(calculate_monthly_installments(
+            df['Loan Amount'].to_numpy(),
+            df['Interest Rate'].to_numpy(),
+            df['Tenure'].to_numpy(),
+        ), index=df.index)
+    else:
+        monthly_repayment = _decimals(df['Monthly payment'])
+
+    frame = pd.DataFrame({
+        'loan_id': df['Loan ID'].astype('int64'),
+        'customer_id': df['Customer ID'].astype('int64'),
+        'loan_amount': _decimals(df['Loan Amount']),
+        'tenure': df['Tenure'].astype('int64'),
+        'interest_rate': _decimals(df['Interest Rate']),
+        'monthly_repayment': monthly_repayment,
+        'emis_paid_on_time': df['EMIs paid on Time'].astype('int64'),
+        'start_date': pd.to_datetime(df['Date of Approval']).dt.date,
+        'end_date': pd.to_datetime(df['End Date']).dt.date,
+    })
+    frame = frame.drop_duplicates('loan_id', keep='first')
+    frame['outstanding_principal'] = [
+        Decimal(value).scaleb(-2) for value in outstanding_principal_cents(
+            frame['loan_amount'], frame['interest_rate'], frame['monthly_repayment'],
+            frame['tenure'], frame['emis_paid_on_time'],
+        ).tolist()
+    ]
+    return frame
+
+
+class Ingestor:
+    """
+    Bulk loader for customer and loan spreadsheets.
+
+    Files are streamed in chunks, rows are deduplicated against ID sets
+    preloaded from the database, and new rows are written with COPY on
+    PostgreSQL or bulk_create elsewhere. With upsert=True, rows whose
+    values differ from the stored ones are updated with bulk_update.
+    Bulk writes bypass model signals, so finish() rebuilds the credit
+    profiles of affected customers and invalidates the credit cache.
+
+    With ignore_conflicts=True inserts skip rows whose primary key already
+    exists, which parallel loaders need since an ID duplicated across
+    partitions is not visible to the other workers' ID sets.
+    """
+
+    def __init__(self, batch_size=5000, chunk_size=50000, upsert=False, use_copy=True,
+                 recompute_emi=False, ignore_conflicts=False, warn=None):
+        self.batch_size = batch_size
+        self.chunk_size = chunk_size
+        self.upsert = upsert
+        self.ignore_conflicts = ignore_conflicts
+        # COPY has no ON CONFLICT clause
+        self.use_copy = use_copy and not ignore_conflicts and connection.vendor == 'postgresql'
+        self.recompute_emi = recompute_emi
+        self.warn = warn or (lambda message: None)
+        self.customer_ids = None
+        self.phone_owners = None
+        self.loan_ids = None
+        self.affected_customers = set()
+
+    def ingest_customers(self, file_path, start=0, stop=None):
+        """Load customers (data rows [start, stop)) from file_path and return IngestStats"""
+        if self.customer_ids is None:
+            self.customer_ids = set(Customer.objects.values_list('customer_id', flat=True))
+        if self.phone_owners is None:
+            self.phone_owners = dict(Customer.objects.values_list('phone_number', 'customer_id'))
+
+        stats = IngestStats()
+        started = time.monotonic()
+
+        for df in read_frames(file_path, self.chunk_size, start, stop):
+            frame = normalize_customers(df)
+            stats.rows += len(df)
+            stats.skipped += len(df) - len(frame)
+
+            frame = self._drop_phone_conflicts(frame, stats)
+
+            known = frame['customer_id'].isin(self.customer_ids)
+            new_rows = frame[~known]
+            self._insert(Customer, new_rows)
+            stats.created += len(new_rows)
+            self.customer_ids.update(new_rows['customer_id'].tolist())
+            self.affected_customers.update(new_rows['customer_id'].tolist())
+
+            if self.upsert:
+                stats.updated += self._update_changed(
+                    Customer, frame[known], exclude=('customer_id', 'age')
+                )
+            else:
+                stats.skipped += int(known.sum())
+
+        stats.seconds = time.monotonic() - started
+        return stats
+
+    def _drop_phone_conflicts(self, frame, stats):
+        """
+        Skip rows whose phone number belongs to another customer, since the
+        unique phone index would reject the whole batch
+        """
+        owners = frame['phone_number'].map(self.phone_owners)
+        conflicts = (owners.notna() & (owners != frame['customer_id'])) | frame.duplicated(
+            'phone_number', keep='first'
+        )
+        if conflicts.any():
+            self.warn(
+                f'Skipping {int(conflicts.sum())} customers with a phone number already in use '
+                f'(e.g. customer {frame.loc[conflicts, "customer_id"].iloc[0]})'
+            )
+            stats.skipped += int(conflicts.sum())
+            frame = frame[~conflicts]
+        self.phone_owners.update(zip(frame['phone_number'].tolist(), frame['customer_id'].tolist()))
+        return frame
+
+    def ingest_loans(self, file_path, start=0, stop=None):
+        """Load loans (data rows [start, stop)) from file_path and return IngestStats"""
+        if self.customer_ids is None:
+            self.customer_ids = set(Customer.objects.values_list('customer_id', flat=True))
+        if self.loan_ids is None:
+            self.loan_ids = set(Loan.objects.values_list('loan_id', flat=True))
+
+        stats = IngestStats()
+        started = time.monotonic()
+
+        for df in read_frames(file_path, self.chunk_size, start, stop):
+            frame = normalize_loans(df, self.recompute_emi)
+            stats.rows += len(df)
+            stats.skipped += len(df) - len(frame)
+
+            orphans = ~frame['customer_id'].isin(self.customer_ids)
+            if orphans.any():
+                self.warn(
+                    f'Skipping {int(orphans.sum())} loans of unknown customers '
+                    f'(e.g. loan {frame.loc[orphans, "loan_id"].iloc[0]})'
+                )
+                stats.skipped += int(orphans.sum())
+                frame = frame[~orphans]
+
+            known = frame['loan_id'].isin(self.loan_ids)
+            new_rows = frame[~known]
+            self._insert(Loan, new_rows)
+            stats.created += len(new_rows)
+            self.loan_ids.update(new_rows['loan_id'].tolist())
+            self.affected_customers.update(new_rows['customer_id'].tolist())
+
+            if self.upsert:
+                stats.updated += self._update_changed(Loan, frame[known], exclude=('loan_id',))
+            else:
+                stats.skipped += int(known.sum())
+
+        stats.seconds = time.monotonic() - started
+        return stats
+
+    def finish(self):
+        """
+        Rebuild the credit profiles touched by the load, invalidate every
+        cached credit score and move the ID sequences past ingested IDs
+        """
+        affected = sorted(self.affected_customers)
+        for start in range(0, len(affected), self.batch_size):
+            rebuild_credit_profiles(affected[start:start + self.batch_size])
+        self.affected_customers = set()
+        bump_generation()
+        reset_sequences()
+        return len(affected)
+
+    def insert_frame(self, model, frame):
+        """
+        Insert rows that are already in model field form, such as generated
+        data, bypassing the spreadsheet parsing and ID checks
+        """
+        self._insert(model, frame)
+        self.affected_customers.update(frame['customer_id'].tolist())
+
+    def _insert(self, model, frame):
+        if frame.empty:
+            return
+        if self.use_copy:
+            self._copy(model, frame)
+        else:
+            model.objects.bulk_create(
+                [model(**record) for record in frame.to_dict('records')],
+                batch_size=self.batch_size,
+                ignore_conflicts=self.ignore_conflicts,
+            )
+
+    def _copy(self, model, frame):
+        """Stream rows into the table with PostgreSQL COPY"""
+        frame = frame.copy()
+        for field in model._meta.concrete_fields:
+            if field.attname not in frame and field.has_default():
+                frame[field.attname] = field.get_default()
+
+        columns = ', '.join(
+            connection.ops.quote_name(model._meta.get_field(name).column)
+            for name in frame.columns
+        )
+        buffer = io.StringIO()
+        frame.to_csv(buffer, header=False, index=False)
+        buffer.seek(0)
+        with connection.cursor() as cursor:
+            cursor.copy_expert(
+                f'COPY {connection.ops.quote_name(model._meta.db_table)} ({columns}) '
+                f'FROM STDIN WITH (FORMAT csv)',
+                buffer,
+            )
+
+    def _update_changed(self, model, frame, exclude):
+        """
+        Update stored rows whose values differ from frame; returns the
+        number of rows updated
+        """
+        if frame.empty:
+            return 0
+
+        pk_name = model._meta.pk.attname
+        fields = [name for name in frame.columns if name not in exclude]
+        stored = {
+            row[pk_name]: row
+            for row in model.objects.filter(
+                pk__in=frame[pk_name].tolist()
+            ).values(pk_name, *fields)
+        }
+
+        changed = []
+        for record in frame.to_dict('records'):
+            current = stored.get(record[pk_name])
+            if current is None or all(current[name] == record[name] for name in fields):
+                continue
+            changed.append(model(**{name: record[name] for name in [pk_name] + fields}))
+            if model is Loan:
+                self.affected_customers.add(current['customer_id'])
+            self.affected_customers.add(record['customer_id'])
+
+        model.objects.bulk_update(changed, fields, batch_size=self.batch_size)
+        return len(changed)
+
+
+def reset_sequences():
+    """
+    Move the customers/loans ID sequences past the highest stored ID, since
+    ingested rows carry explicit IDs and later create() calls would
+    otherwise collide with them
+    """
+    statements = connection.ops.sequence_reset_sql(no_style(), [Customer, Loan])
+    if statements:
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+
+
+# Ingestor whose preloaded ID sets forked loan workers inherit
+_parent_ingestor = None
+
+
+def _ingest_loan_partition(file_path, start, stop):
+    """
+    Process pool entry point: load one row range of the loan file through
+    this worker's own database connection, committing it atomically
+    """
+    # The parent closed its connections before forking, so the first query
+    # here opens a fresh connection owned by this worker
+    parent = _parent_ingestor
+    ingestor = Ingestor(
+        batch_size=parent.batch_size,
+        chunk_size=parent.chunk_size,
+        upsert=parent.upsert,
+        recompute_emi=parent.recompute_emi,
+        ignore_conflicts=True,
+        warn=parent.warn,
+    )
+    ingestor.customer_ids = parent.customer_ids
+    ingestor.loan_ids = set(parent.loan_ids)
+
+    with transaction.atomic():
+        stats = ingestor.ingest_loans(file_path, start, stop)
+    return stats, ingestor.affected_customers
+
+
+def ingest_loans_parallel(ingestor, file_path, workers):
+    """
+    Parse, convert and write the loan file in `workers` processes, one row
+    range each. Customers must already be committed because of the loans
+    foreign key. Returns the combined IngestStats; affected customers are
+    recorded on `ingestor` for finish().
+
+    Each partition commits on its own. When one fails, the customers of the
+    partitions that did commit are still recorded before the first error is
+    re-raised, so finish() can rebuild their profiles; a rerun skips the
+    loans already present and converges.
+    """
+    global _parent_ingestor
+
+    if ingestor.customer_ids is None:
+        ingestor.customer_ids = set(Customer.objects.values_list('customer_id', flat=True))
+    if ingestor.loan_ids is None:
+        ingestor.loan_ids = set(Loan.objects.values_list('loan_id', flat=True))
+
+    ranges = partition_rows(count_rows(file_path), workers)
+    loans_before = Loan.objects.count()
+    started = time.monotonic()
+
+    # Children get their own connections; the parent reconnects lazily
+    connections.close_all()
+    _parent_ingestor = ingestor
+    try:
+        # fork lets workers inherit the configured Django app and ID sets
+        with ProcessPoolExecutor(
+            max_workers=len(ranges), mp_context=multiprocessing.get_context('fork')
+        ) as pool:
+            futures = [
+                pool.submit(_ingest_loan_partition, file_path, start, stop)
+                for start, stop in ranges
+            ]
+            results = []
+            error = None
+            for future in futures:
+                try:
+                    results.append(future.result())
+                except Exception as exc:
+                    error = error or exc
+    finally:
+        _parent_ingestor = None
+
+    for stats, affected in results:
+        ingestor.affected_customers.update(affected)
+    if error is not None:
+        raise error
+
+    total = IngestStats(seconds=time.monotonic() - started)
+    for stats, _ in results:
+        total.rows += stats.rows
+        total.updated += stats.updated
+
+    # Workers cannot tell which of them inserted an ID duplicated across
+    # partitions, so count what actually landed
+    total.created = Loan.objects.count() - loans_before
+    total.skipped = total.rows - total.created - total.updated
+    return total
+
+
+# Warnings kept on an ingestion job, later ones are only counted
+MAX_JOB_WARNINGS = 100
+
+
+def find_or_create_ingestion_job(customers_file, loans_file, upsert=False, recompute_emi=False,
+                                 force=False, chunk_size=50000, batch_size=5000):
+    """
+    Return (job, created): the unfinished job loading the same file contents
+    with the same options, which running again resumes, or a new job
+    """
+    hashes = {'customers_hash': file_digest(customers_file), 'loans_hash': file_digest(loans_file)}
+    options = {'upsert': upsert, 'recompute_emi': recompute_emi, 'force': force}
+    job = IngestionJob.objects.filter(**hashes, **options).exclude(
+        status=IngestionJob.COMPLETED
+    ).order_by('-pk').first()
+    if job is not None:
+        # The same contents may have moved
+        IngestionJob.objects.filter(pk=job.pk).update(customers_file=customers_file, loans_file=loans_file)
+        job.customers_file, job.loans_file = customers_file, loans_file
+        return job, False
+
+    job = IngestionJob.objects.create(
+        customers_file=customers_file, loans_file=loans_file,
+        chunk_size=chunk_size, batch_size=batch_size, **hashes, **options
+    )
+    return job, True
+
+
+def claim_ingestion_job(job_id):
+    """
+    Mark a pending or failed job as running. Returns False when the job
+    is already running elsewhere or completed.
+    """
+    return IngestionJob.objects.filter(
+        pk=job_id, status__in=[IngestionJob.PENDING, IngestionJob.FAILED]
+    ).update(status=IngestionJob.RUNNING) == 1
+
+
+def run_ingestion(job, warn=None):
+    """
+    Load a claimed job's files from their watermarks on. Every checkpoint of
+    job.chunk_size rows is committed in one transaction together with the
+    advanced watermark, after rebuilding the credit profiles it touched, so
+    the data served meanwhile is consistent and an interrupted job resumes
+    where it stopped. Files already ingested are skipped unless job.force.
+    """
+    warn = warn or (lambda message: None)
+
+    def record_warning(message):
+        if len(job.warnings) < MAX_JOB_WARNINGS:
+            job.warnings.append(message)
+        warn(message)
+
+    now = timezone.now()
+    job.status = IngestionJob.RUNNING
+    job.error = ''
+    job.started_at = job.started_at or now
+    job.run_started_at = now
+    job.run_start_rows = job.rows_done
+    job.finished_at = None
+    job.save()
+
+    ingestor = Ingestor(
+        batch_size=job.batch_size,
+        chunk_size=job.chunk_size,
+        upsert=job.upsert,
+        recompute_emi=job.recompute_emi,
+        warn=record_warning,
+    )
+    loaders = {'customers': ingestor.ingest_customers, 'loans': ingestor.ingest_loans}
+
+    try:
+        for label, load in loaders.items():
+            source = getattr(job, f'{label}_file')
+            digest = getattr(job, f'{label}_hash')
+            if file_digest(source) != digest:
+                raise ValueError(f'{source} changed since ingestion job {job.pk} was created')
+
+            total = getattr(job, f'{label}_total')
+            if total is None:
+                if not job.force and IngestedFile.objects.filter(file_hash=digest).exists():
+                    total = 0
+                else:
+                    total = count_rows(_staged_path(source, digest, job.chunk_size))
+                setattr(job, f'{label}_total', total)
+                job.save()
+
+            path = _staged_path(source, digest, job.chunk_size) if total else source
+            while getattr(job, f'{label}_done') < total:
+                start = getattr(job, f'{label}_done')
+                stop = min(start + job.chunk_size, total)
+                with transaction.atomic():
+                    stats = load(path, start, stop)
+                    ingestor.finish()
+                    setattr(job, f'{label}_done', stop)
+                    job.rows_created += stats.created
+                    job.rows_updated += stats.updated
+                    job.rows_skipped += stats.skipped
+                    job.save()
+
+            if total:
+                IngestedFile.objects.update_or_create(
+                    file_hash=digest,
+                    defaults={'file_name': os.path.basename(source), 'rows': total},
+                )
+    except Exception as exc:
+        job.status = IngestionJob.FAILED
+        job.error = repr(exc)
+        job.finished_at = timezone.now()
+        job.save()
+        raise
+
+    job.status = IngestionJob.COMPLETED
+    job.finished_at = timezone.now()
+    job.save()
+    return job
+
+
+def _staged_path(file_path, digest, chunk_size):
+    """
+    Columnar copy of file_path from the staging cache, or file_path itself
+    when pyarrow is not installed
+    """
+    if not staging_available():
+        return file_path
+    return StagingCache(settings.INGEST_CACHE_DIR).stage(file_path, read_frames, digest, chunk_size)[0]
@@ -0,0 +1,176 @@
+import http.client
+import threading
+import time
+from contextlib import ExitStack
+from dataclasses import dataclass, field
+from urllib.parse import urlsplit
+from django.db import connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+
+@dataclass
+class LoadResult:
+    """
+    Outcome of one load run: latencies in milliseconds of completed requests
+    and, when sent in-process, the number of queries each one ran
+    """
+    seconds: float = 0.0
+    latencies: list = field(default_factory=list)
+    queries: list = field(default_factory=list)
+    errors: int = 0
+
+    @property
+    def requests(self):
+        return len(self.latencies)
+
+    @property
+    def requests_per_second(self):
+        return self.requests / self.seconds if self.seconds else 0.0
+
+    def percentile(self, fraction):
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+    def summary(self):
+        summary = {
+            'requests': self.requests,
+            'errors': self.errors,
+            'requests_per_second': round(self.requests_per_second, 1),
+            'p50_ms': round(self.percentile(0.5), 2),
+            'p95_ms': round(self.percentile(0.95), 2),
+            'p99_ms': round(self.percentile(0.99), 2),
+        }
+        if self.queries:
+            summary['queries_per_request'] = round(sum(self.queries) / len(self.queries), 2)
+        return summary
+
+
+def http_sender(base_url):
+    """
+    Sender factory for run_requests sending requests to a server at
+    base_url, each worker over its own keep-alive connection. Query counts
+    are not known.
+    """
+    url = urlsplit(base_url)
+    connection_class = http.client.HTTPSConnection if url.scheme == 'https' else http.client.HTTPConnection
+
+    def make_sender():
+        connection = connection_class(url.hostname, url.port, timeout=30)
+
+        def send(method, path, body):
+            headers = {'Content-Type': 'application/json'} if body is not None else {}
+            try:
+                connection.request(method, url.path.rstrip('/') + path, body=body, headers=headers)
+                response = connection.getresponse()
+                response.read()
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                return None, None
+            return response.status, None
+
+        return send, connection.close
+
+    return make_sender
+
+
+def local_sender():
+    """
+    Sender factory for run_requests calling the application in-process
+    through the Django test client (middleware included), against the
+    configured databases, counting the queries of every request
+    """
+    def make_sender():
+        client = Client(raise_request_exception=False)
+
+        def send(method, path, body):
+            with ExitStack() as stack:
+                contexts = [stack.enter_context(CaptureQueriesContext(connection)) for connection in connections.all()]
+                response = client.generic(method, path, body or '', content_type='application/json')
+            return response.status_code, sum(len(context) for context in contexts)
+
+        # Each worker thread opened its own database connections
+        return send, connections.close_all
+
+    return make_sender
+
+
+def run_requests(make_sender, next_request, concurrency=16, duration=10.0, total=None):
+    """
+    Send requests from `concurrency` threads, each with its own sender from
+    make_sender(), for `duration` seconds or until `total` requests were
+    sent. next_request(worker, sequence) returns (label, method, path, body)
+    with body a bytes JSON payload or None. Returns {label: LoadResult};
+    responses with a 5xx status and failed connections count as errors.
+    """
+    results = {}
+    lock = threading.Lock()
+    counter = iter(range(total)) if total is not None else None
+    deadline = time.monotonic() + duration
+
+    def worker(index):
+        send, close = make_sender()
+        local = {}
+        sequence = 0
+        while time.monotonic() < deadline:
+            if counter is not None:
+                with lock:
+                    if next(counter, None) is None:
+                        break
+            label, method, path, body = next_request(index, sequence)
+            sequence += 1
+            result = local.setdefault(label, LoadResult())
+            started = time.perf_counter()
+            status, queries = send(method, path, body)
+            if status is None or status >= 500:
+                result.errors += 1
+                continue
+            result.latencies.append((time.perf_counter() - started) * 1000)
+            if queries is not None:
+                result.queries.append(queries)
+        close()
+        with lock:
+            for label, result in local.items():
+                merged = results.setdefault(label, LoadResult())
+                merged.latencies.extend(result.latencies)
+                merged.queries.extend(result.queries)
+                merged.errors += result.errors
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(concurrency)]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = time.monotonic() - started
+    for result in results.values():
+        result.seconds = seconds
+    return results
+
+
+def combine(results):
+    """Merge the LoadResults of one run's labels into a single result"""
+    combined = LoadResult()
+    for result in results.values():
+        combined.seconds = max(combined.seconds, result.seconds)
+        combined.latencies.extend(result.latencies)
+        combined.queries.extend(result.queries)
+        combined.errors += result.errors
+    return combined
+
+
+def run_load(base_url, next_request, concurrency=16, duration=10.0, total=None):
+    """
+    Send requests to base_url from `concurrency` threads, each over its own
+    keep-alive connection, for `duration` seconds or until `total` requests
+    were sent. next_request(worker, sequence) returns (method, path, body)
+    with body a bytes JSON payload or None. Responses with a 5xx status and
+    failed connections count as errors.
+    """
+    results = run_requests(
+        http_sender(base_url), lambda worker, sequence: (None, *next_request(worker, sequence)),
+        concurrency=concurrency, duration=duration, total=total,
+    )
+    return results.get(None) or LoadResult(seconds=duration)
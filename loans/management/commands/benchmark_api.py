@@ -0,0 +1,200 @@
+import itertools
+import json
+import random
+import subprocess
+import time
+from datetime import datetime, timezone
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from loans.loadgen import combine, http_sender, local_sender, run_requests
+from loans.models import Customer, Loan
+
+
+# Default share of each endpoint in the traffic mix
+DEFAULT_MIX = {
+    'check-eligibility': 35,
+    'view-loan': 25,
+    'view-loans': 25,
+    'create-loan': 10,
+    'register': 5,
+}
+
+# Registered phone numbers start past the synthetic customers' block
+REGISTER_PHONE_OFFSET = 6_000_000_000
+
+# Relative change of p99 latency or throughput reported as a regression
+REGRESSION_THRESHOLD = 0.10
+
+
+def parse_mix(value):
+    """Parse a traffic mix such as view-loan=50,check-eligibility=50"""
+    mix = {}
+    for part in value.split(','):
+        endpoint, separator, weight = part.partition('=')
+        if endpoint not in DEFAULT_MIX or not separator:
+            raise ValueError(f'Expected ENDPOINT=WEIGHT with ENDPOINT in {", ".join(DEFAULT_MIX)}, got {part}')
+        mix[endpoint] = float(weight)
+    return mix
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, cwd=settings.BASE_DIR
+        ).stdout.strip() or None
+    except OSError:
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        'Replay a weighted mix of register, check-eligibility, create-loan, view-loan and '
+        'view-loans traffic in-process (default, counting queries per request) or against a '
+        'running server, report throughput and p50/p95/p99 latency per endpoint, and save '
+        'or compare JSON results across commits. Writes customers and loans to the database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', help='Server to load, e.g. http://localhost:8000 (default: in-process)')
+        parser.add_argument(
+            '--mix', type=parse_mix, default=DEFAULT_MIX,
+            help='Endpoint weights, e.g. view-loan=50,check-eligibility=50 (default: %s)'
+                 % ','.join(f'{endpoint}={weight}' for endpoint, weight in DEFAULT_MIX.items())
+        )
+        parser.add_argument('--concurrency', type=int, default=8, help='Concurrent clients')
+        parser.add_argument('--duration', type=float, default=15.0, help='Seconds to run')
+        parser.add_argument('--requests', type=int, help='Stop after this many requests')
+        parser.add_argument('--warmup', type=float, default=2.0, help='Seconds of unrecorded traffic first')
+        parser.add_argument('--samples', type=int, default=1000, help='Customer and loan IDs to rotate through')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help='Write the results to this JSON file')
+        parser.add_argument('--compare', help='JSON results of an earlier run to compare against')
+        parser.add_argument(
+            '--fail-on-regression', action='store_true',
+            help=f'Exit with an error when p99 latency or throughput regressed by more than '
+                 f'{REGRESSION_THRESHOLD:.0%} against --compare'
+        )
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as file:
+                baseline = json.load(file)
+
+        rng = random.Random(options['seed'])
+        customer_ids = list(Customer.objects.values_list('customer_id', flat=True)[:options['samples'] * 10])
+        loan_ids = list(Loan.objects.values_list('loan_id', flat=True)[:options['samples'] * 10])
+        if not customer_ids or not loan_ids:
+            raise CommandError('No customers or loans to request, run generate_dataset first')
+        customer_ids = rng.sample(customer_ids, min(options['samples'], len(customer_ids)))
+        loan_ids = rng.sample(loan_ids, min(options['samples'], len(loan_ids)))
+
+        next_request = self.traffic(options['mix'], customer_ids, loan_ids, options['seed'])
+        make_sender = http_sender(options['target']) if options['target'] else local_sender()
+
+        if options['warmup'] > 0:
+            run_requests(make_sender, next_request, concurrency=options['concurrency'], duration=options['warmup'])
+        by_endpoint = run_requests(
+            make_sender, next_request,
+            concurrency=options['concurrency'], duration=options['duration'], total=options['requests'],
+        )
+
+        results = {
+            'meta': {
+                'commit': git_commit(),
+                'timestamp': datetime.now(timezone.utc).isoformat(),
+                'target': options['target'] or 'in-process',
+                'database': connection.vendor,
+                'customers': Customer.objects.count(),
+                'loans': Loan.objects.count(),
+                'concurrency': options['concurrency'],
+                'duration': options['duration'],
+                'mix': options['mix'],
+                'seed': options['seed'],
+            },
+            'overall': combine(by_endpoint).summary(),
+            'endpoints': {endpoint: result.summary() for endpoint, result in sorted(by_endpoint.items())},
+        }
+
+        self.report(results)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump(results, file, indent=2)
+            self.stdout.write(f'\nResults written to {options["output"]}')
+        if baseline is not None:
+            regressions = self.compare(results, baseline)
+            if regressions and options['fail_on_regression']:
+                raise CommandError(f'Regressed: {", ".join(regressions)}')
+
+    def traffic(self, mix, customer_ids, loan_ids, seed):
+        """
+        next_request function drawing endpoints by weight, from a random
+        stream per worker so runs with the same seed send the same requests
+        """
+        endpoints = [endpoint for endpoint, weight in mix.items() if weight > 0]
+        if not endpoints:
+            raise CommandError('The traffic mix has no endpoint with a positive weight')
+        weights = [mix[endpoint] for endpoint in endpoints]
+        rngs = {}
+        phone_numbers = itertools.count(REGISTER_PHONE_OFFSET + time.time_ns() // 1000 % 10 ** 9)
+
+        def next_request(worker, sequence):
+            rng = rngs.setdefault(worker, random.Random(f'{seed}:{worker}'))
+            endpoint = rng.choices(endpoints, weights)[0]
+            customer_id = rng.choice(customer_ids)
+            if endpoint == 'register':
+                return endpoint, 'POST', '/register', json.dumps({
+                    'first_name': 'Load', 'last_name': f'Test {worker}', 'age': rng.randint(21, 64),
+                    'monthly_income': rng.randrange(20000, 300000, 1000), 'phone_number': next(phone_numbers),
+                }).encode()
+            if endpoint in ('check-eligibility', 'create-loan'):
+                return endpoint, 'POST', f'/{endpoint}', json.dumps({
+                    'customer_id': customer_id, 'loan_amount': rng.randrange(10000, 500000, 1000),
+                    'interest_rate': rng.choice([8, 10, 12, 14, 16]), 'tenure': rng.choice([6, 12, 24, 36]),
+                }).encode()
+            if endpoint == 'view-loan':
+                return endpoint, 'GET', f'/view-loan/{rng.choice(loan_ids)}', None
+            return endpoint, 'GET', f'/view-loans/{customer_id}', None
+
+        return next_request
+
+    def report(self, results):
+        meta = results['meta']
+        self.stdout.write(
+            f'{meta["target"]} on {meta["database"]} ({meta["customers"]:,} customers, {meta["loans"]:,} loans), '
+            f'concurrency {meta["concurrency"]}, {meta["duration"]:.0f}s, commit {meta["commit"] or "unknown"}'
+        )
+        rows = list(results['endpoints'].items()) + [('overall', results['overall'])]
+        for endpoint, summary in rows:
+            queries = summary.get('queries_per_request')
+            self.stdout.write(
+                f'  {endpoint:>17}: {summary["requests_per_second"]:>8,.1f} req/s, '
+                f'p50 {summary["p50_ms"]:.1f} ms, p95 {summary["p95_ms"]:.1f} ms, p99 {summary["p99_ms"]:.1f} ms, '
+                + (f'{queries:.1f} queries/req, ' if queries is not None else '')
+                + f'{summary["errors"]} errors'
+            )
+
+    def compare(self, results, baseline):
+        """
+        Print the change of throughput and p99 latency against baseline and
+        return the endpoints that regressed by more than the threshold
+        """
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f'\nAgainst {baseline["meta"].get("commit") or "baseline"} ({baseline["meta"].get("timestamp")})'
+        ))
+        current = dict(results['endpoints'], overall=results['overall'])
+        previous = dict(baseline['endpoints'], overall=baseline['overall'])
+        regressions = []
+        for endpoint, summary in current.items():
+            before = previous.get(endpoint)
+            if not before or not before['requests_per_second'] or not before['p99_ms']:
+                continue
+            throughput = summary['requests_per_second'] / before['requests_per_second'] - 1
+            p99 = summary['p99_ms'] / before['p99_ms'] - 1
+            regressed = throughput < -REGRESSION_THRESHOLD or p99 > REGRESSION_THRESHOLD
+            style = self.style.ERROR if regressed else self.style.SUCCESS
+            self.stdout.write(style(f'  {endpoint:>17}: throughput {throughput:+.1%}, p99 {p99:+.1%}'))
+            if regressed:
+                regressions.append(endpoint)
+        return regressions
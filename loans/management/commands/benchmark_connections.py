@@ -0,0 +1,73 @@
+import random
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from loans.models import Customer, Loan
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure per-endpoint latency in-process with a new database connection per '
+        'request (CONN_MAX_AGE=0) and with a persistent connection, through the same '
+        'request_started/request_finished handling the servers use'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=300, help='Requests per endpoint and mode')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        customer_ids = list(Customer.objects.values_list('customer_id', flat=True)[:10000])
+        loan_ids = list(Loan.objects.values_list('loan_id', flat=True)[:10000])
+        if not customer_ids or not loan_ids:
+            raise CommandError('No customers or loans to request, run ingest_data first')
+
+        endpoints = {
+            'view-loan': lambda client: client.get(f'/view-loan/{rng.choice(loan_ids)}'),
+            'view-loans': lambda client: client.get(f'/view-loans/{rng.choice(customer_ids)}'),
+            'check-eligibility': lambda client: client.post('/check-eligibility', {
+                'customer_id': rng.choice(customer_ids),
+                'loan_amount': 100000, 'interest_rate': 12, 'tenure': 24,
+            }, content_type='application/json'),
+        }
+
+        original_max_age = connection.settings_dict['CONN_MAX_AGE']
+        self.stdout.write(
+            f'{connection.vendor} at {connection.settings_dict["HOST"] or "localhost"}, '
+            f'{options["requests"]} requests per endpoint and mode'
+        )
+        try:
+            for name, request in endpoints.items():
+                self.stdout.write(self.style.MIGRATE_HEADING(f'\n{name}'))
+                p50s = {}
+                for mode, max_age in (('new connection', 0), ('persistent', 600)):
+                    # The connection's lifetime is fixed when it is opened
+                    connection.close()
+                    connection.settings_dict['CONN_MAX_AGE'] = max_age
+                    timings = self.measure(request, options['requests'])
+                    p50s[mode] = timings[len(timings) // 2]
+                    self.stdout.write(
+                        f'  {mode:>14}: p50 {p50s[mode]:.2f} ms, '
+                        f'p99 {timings[min(int(len(timings) * 0.99), len(timings) - 1)]:.2f} ms'
+                    )
+                self.stdout.write(self.style.SUCCESS(
+                    f'  saved per request: {p50s["new connection"] - p50s["persistent"]:.2f} ms (p50)'
+                ))
+        finally:
+            connection.close()
+            connection.settings_dict['CONN_MAX_AGE'] = original_max_age
+
+    def measure(self, request, count):
+        """Sorted latencies in milliseconds of `count` requests"""
+        client = Client()
+        request(client)  # Warm up imports and caches
+        timings = []
+        for _ in range(count):
+            started = time.perf_counter()
+            response = request(client)
+            timings.append((time.perf_counter() - started) * 1000)
+            if response.status_code >= 500:
+                raise CommandError(f'Request failed with {response.status_code}')
+        return sorted(timings)
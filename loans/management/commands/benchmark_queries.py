@@ -0,0 +1,159 @@
+import copy
+import random
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from loans.models import Customer, Loan
+from loans.synthetic import load_synthetic_data
+from loans.utils import aggregate_loans, aggregate_loans_for_customers
+
+
+def hot_queries(customer_ids, phone_numbers):
+    """
+    (name, function(index)) pairs running the application's hot queries
+    for the index-th sampled customer
+    """
+    return [
+        ('register phone lookup',
+         lambda i: Customer.objects.filter(phone_number=phone_numbers[i]).exists()),
+        ('credit score aggregates',
+         lambda i: aggregate_loans(customer_ids[i])),
+        ('customer loan list',
+         lambda i: list(Loan.objects.filter(customer_id=customer_ids[i]).values())),
+        ('grouped aggregates (50 customers)',
+         lambda i: aggregate_loans_for_customers(customer_ids[i:i + 50])),
+    ]
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+class Command(BaseCommand):
+    help = (
+        'Report query plans and latency of the hot scoring and registration '
+        'queries, optionally comparing against the schema without the indexes '
+        'added in migration 0004 (PostgreSQL only)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--generate-loans', type=int, default=0,
+            help='First add synthetic loans until this many loans are stored (e.g. 1000000)'
+        )
+        parser.add_argument(
+            '--loans-per-customer', type=int, default=10,
+            help='Loans per generated customer when generating data'
+        )
+        parser.add_argument('--seed', type=int, default=0, help='Seed for generated data and sampling')
+        parser.add_argument('--samples', type=int, default=200, help='Customers sampled per query')
+        parser.add_argument(
+            '--compare', action='store_true',
+            help='Also measure with the hot-query indexes dropped, inside a transaction '
+                 'that is rolled back afterwards'
+        )
+
+    def handle(self, *args, **options):
+        stored = Loan.objects.count()
+        missing = options['generate_loans'] - stored
+        if missing > 0:
+            customers = max(missing // options['loans_per_customer'], 1)
+            self.stdout.write(f'Generating {customers} customers and {missing} loans...')
+            started = time.monotonic()
+            load_synthetic_data(customers, missing, seed=options['seed'])
+            self.stdout.write(f'Generated in {time.monotonic() - started:.1f}s')
+
+        sample = self.sample_customers(options['samples'], options['seed'])
+        if not sample:
+            raise CommandError('No customers to benchmark, use --generate-loans')
+        customer_ids = [customer_id for customer_id, _ in sample]
+        phone_numbers = [phone_number for _, phone_number in sample]
+        queries = hot_queries(customer_ids, phone_numbers)
+
+        self.stdout.write(
+            f'{Customer.objects.count()} customers, {Loan.objects.count()} loans, '
+            f'{len(sample)} sampled customers, {connection.vendor}'
+        )
+
+        after = self.measure(queries, len(sample))
+        before = None
+        if options['compare']:
+            if connection.vendor != 'postgresql':
+                raise CommandError('--compare needs PostgreSQL, which can drop indexes transactionally')
+            with transaction.atomic():
+                self.drop_hot_query_indexes()
+                before = self.measure(queries, len(sample))
+                transaction.set_rollback(True)
+
+        for name, _ in queries:
+            self.stdout.write(self.style.MIGRATE_HEADING(f'\n{name}'))
+            if before is not None:
+                self.report('without indexes', before[name])
+            self.report('with indexes', after[name])
+            if before is not None:
+                speedup = before[name]['p50'] / after[name]['p50'] if after[name]['p50'] else 0
+                self.stdout.write(self.style.SUCCESS(f'  p50 speedup: {speedup:.1f}x'))
+
+    def sample_customers(self, size, seed):
+        """Random (customer_id, phone_number) pairs of stored customers"""
+        rows = list(Customer.objects.values_list('customer_id', 'phone_number').order_by('customer_id'))
+        return random.Random(seed).sample(rows, min(size, len(rows)))
+
+    def measure(self, queries, sample_size):
+        """
+        Return {name: {'p50', 'p95', 'plan'}} with latencies in milliseconds
+        and the plan of the first sampled customer's query
+        """
+        results = {}
+        for name, run in queries:
+            # Warm up the connection and plan caches
+            run(0)
+            timings = []
+            for i in range(sample_size):
+                started = time.perf_counter()
+                run(i)
+                timings.append((time.perf_counter() - started) * 1000)
+            results[name] = {
+                'p50': percentile(timings, 0.5),
+                'p95': percentile(timings, 0.95),
+                'plan': self.explain(run),
+            }
+        return results
+
+    def explain(self, run):
+        """Plan of the last query issued by run(0)"""
+        with CaptureQueriesContext(connection) as queries:
+            run(0)
+        sql = queries.captured_queries[-1]['sql']
+        # PostgreSQL can report actual row counts and timings per plan node
+        options = {'analyze': True} if connection.vendor == 'postgresql' else {}
+        prefix = connection.ops.explain_query_prefix(**options)
+        with connection.cursor() as cursor:
+            cursor.execute(f'{prefix} {sql}')
+            return '\n'.join(str(row[-1]) for row in cursor.fetchall())
+
+    def drop_hot_query_indexes(self):
+        """
+        Restore the pre-0004 schema: no phone number index, a plain foreign
+        key index and no composite loan index
+        """
+        with connection.schema_editor() as editor:
+            for index in Loan._meta.indexes:
+                editor.remove_index(Loan, index)
+
+            customer_field = Loan._meta.get_field('customer')
+            indexed_field = copy.copy(customer_field)
+            indexed_field.db_index = True
+            editor.alter_field(Loan, customer_field, indexed_field)
+
+            phone_field = Customer._meta.get_field('phone_number')
+            plain_field = copy.copy(phone_field)
+            plain_field._unique = False
+            editor.alter_field(Customer, phone_field, plain_field)
+
+    def report(self, label, result):
+        self.stdout.write(f'  {label}: p50 {result["p50"]:.3f} ms, p95 {result["p95"]:.3f} ms')
+        for line in result['plan'].splitlines():
+            self.stdout.write(f'    {line}')
@@ -0,0 +1,68 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+from loans.models import Loan
+from loans.renderers import FastJSONRenderer, orjson
+from loans.serializers import (
+    LoanSerializer, LoanListSerializer, LOAN_DETAIL_VALUES, LOAN_LIST_VALUES,
+    loan_detail_row, loan_list_row
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare rows/second of the DRF serializers behind /view-loan and /view-loans '
+        'with the .values() fast path and FastJSONRenderer'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000, help='Loans serialized per run')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per variant, the best is reported')
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        loans = Loan.objects.order_by('loan_id')[:rows]
+        count = loans.count()
+        if not count:
+            raise CommandError('No loans to serialize, run ingest_data or benchmark_queries --generate-loans')
+
+        self.stdout.write(
+            f'{count} loans, best of {options["repeat"]} runs, '
+            f'JSON encoder: {"orjson" if orjson is not None else "json (orjson not installed)"}'
+        )
+
+        variants = {
+            'view-loans': (
+                lambda: JSONRenderer().render(LoanListSerializer(list(loans), many=True).data),
+                lambda: FastJSONRenderer().render([loan_list_row(row) for row in loans.values(*LOAN_LIST_VALUES)]),
+            ),
+            'view-loan': (
+                lambda: JSONRenderer().render(
+                    LoanSerializer(list(loans.select_related('customer')), many=True).data
+                ),
+                lambda: FastJSONRenderer().render(
+                    [loan_detail_row(row) for row in loans.values(*LOAN_DETAIL_VALUES)]
+                ),
+            ),
+        }
+
+        for name, (serializer_path, fast_path) in variants.items():
+            if serializer_path() != fast_path():
+                raise CommandError(f'{name}: fast path output differs from the serializers')
+
+            serializer_seconds = self.best_time(serializer_path, options['repeat'])
+            fast_seconds = self.best_time(fast_path, options['repeat'])
+            self.stdout.write(self.style.MIGRATE_HEADING(f'\n{name} (query + serialize + render)'))
+            self.stdout.write(f'  serializers: {count / serializer_seconds:,.0f} rows/s')
+            self.stdout.write(f'  fast path:   {count / fast_seconds:,.0f} rows/s')
+            self.stdout.write(self.style.SUCCESS(
+                f'  speedup: {serializer_seconds / fast_seconds:.1f}x, identical output'
+            ))
+
+    def best_time(self, run, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            run()
+            timings.append(time.perf_counter() - started)
+        return min(timings)
@@ -1,107 +1,266 @@
 import os
-import pandas as pd
-from datetime import datetime
-from decimal import Decimal
-from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
 from django.db import transaction
-from loans.models import Customer, Loan
+from loans.ingestion import (
+    Ingestor, ingest_loans_parallel, read_frames, count_rows, normalize_customers,
+    normalize_loans, find_or_create_ingestion_job, claim_ingestion_job, run_ingestion
+)
+from loans.models import IngestedFile, IngestionJob
+from loans.staging import StagingCache, staging_available, file_digest
+from loans.tasks import run_ingestion_job
 
 
 class Command(BaseCommand):
-    help = 'Ingest customer and loan data from Excel files'
+    help = 'Ingest customer and loan data from Excel (or CSV) files'
 
-    def handle(self, *args, **options):
+    def add_arguments(self, parser):
         base_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
-        
-        customer_file = os.path.join(base_dir, 'customer_data.xlsx')
-        loan_file = os.path.join(base_dir, 'loan_data.xlsx')
-        
+        parser.add_argument(
+            '--customers-file', default=os.path.join(base_dir, 'customer_data.xlsx'),
+            help='Customer spreadsheet (.xlsx or .csv)'
+        )
+        parser.add_argument(
+            '--loans-file', default=os.path.join(base_dir, 'loan_data.xlsx'),
+            help='Loan spreadsheet (.xlsx or .csv)'
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=50000,
+            help='Rows read from a file at a time'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=5000,
+            help='Rows per bulk INSERT/UPDATE statement'
+        )
+        parser.add_argument(
+            '--upsert', action='store_true',
+            help='Update existing customers and loans whose values changed instead of skipping them'
+        )
+        parser.add_argument(
+            '--no-copy', action='store_true',
+            help='Use bulk_create even when PostgreSQL COPY is available'
+        )
+        parser.add_argument(
+            '--workers', type=int, default=1,
+            help='Parse and load the loan file in this many processes, each committing '
+                 'its own row range (customers are always loaded first)'
+        )
+        parser.add_argument(
+            '--recompute-emi', action='store_true',
+            help='Recompute monthly repayments from amount, rate and tenure instead of '
+                 'trusting the spreadsheet values'
+        )
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Ingest files even if a file with the same contents was already ingested'
+        )
+        parser.add_argument(
+            '--no-cache', action='store_true',
+            help='Parse the source files directly instead of through the columnar staging cache'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Parse and validate the files without writing to the database'
+        )
+        parser.add_argument(
+            '--resumable', action='store_true',
+            help='Load as an ingestion job committing every --chunk-size rows, resuming '
+                 'an unfinished job for the same files where it stopped'
+        )
+        parser.add_argument(
+            '--background', action='store_true',
+            help='Queue the ingestion job for a Celery worker and return immediately'
+        )
+
+    def handle(self, *args, **options):
+        customer_file = options['customers_file']
+        loan_file = options['loans_file']
+
         # Check if files exist
         if not os.path.exists(customer_file):
             self.stdout.write(self.style.ERROR(f'Customer file not found: {customer_file}'))
             return
-        
+
         if not os.path.exists(loan_file):
             self.stdout.write(self.style.ERROR(f'Loan file not found: {loan_file}'))
             return
-        
+
+        if options['resumable'] or options['background']:
+            self.run_job(customer_file, loan_file, options)
+            return
+
+        sources = {'customers': customer_file, 'loans': loan_file}
+        digests = {label: file_digest(path) for label, path in sources.items()}
+
+        if not options['force'] and not options['dry_run']:
+            ingested = set(IngestedFile.objects.filter(
+                file_hash__in=digests.values()
+            ).values_list('file_hash', flat=True))
+            for label in list(sources):
+                if digests[label] in ingested:
+                    self.stdout.write(f'{label.capitalize()} file unchanged since last ingestion, skipping')
+                    del sources[label]
+
+        if not sources:
+            self.stdout.write(self.style.SUCCESS('Nothing to ingest'))
+            return
+
+        if not options['no_cache']:
+            sources = self.stage(sources, digests, options['chunk_size'])
+
+        if options['dry_run']:
+            self.dry_run(sources, options)
+            return
+
+        ingestor = Ingestor(
+            batch_size=options['batch_size'],
+            chunk_size=options['chunk_size'],
+            upsert=options['upsert'],
+            use_copy=not options['no_copy'],
+            recompute_emi=options['recompute_emi'],
+            warn=lambda message: self.stdout.write(self.style.WARNING(message)),
+        )
+
         self.stdout.write(self.style.SUCCESS('Starting data ingestion...'))
-        
+
         try:
-            with transaction.atomic():
-                # Ingest customers
-                self.stdout.write('Ingesting customer data...')
-                self.ingest_customers(customer_file)
-                
-                # Ingest loans
-                self.stdout.write('Ingesting loan data...')
-                self.ingest_loans(loan_file)
-            
+            if options['workers'] > 1:
+                row_counts = self.ingest_parallel(ingestor, sources, options['workers'])
+            else:
+                row_counts = {}
+                with transaction.atomic():
+                    if 'customers' in sources:
+                        # Ingest customers
+                        self.stdout.write('Ingesting customer data...')
+                        stats = ingestor.ingest_customers(sources['customers'])
+                        self.report('customers', stats)
+                        row_counts['customers'] = stats.rows
+
+                    if 'loans' in sources:
+                        # Ingest loans
+                        self.stdout.write('Ingesting loan data...')
+                        stats = ingestor.ingest_loans(sources['loans'])
+                        self.report('loans', stats)
+                        row_counts['loans'] = stats.rows
+
+                    profiles = ingestor.finish()
+                    self.stdout.write(f'Rebuilt {profiles} credit profiles')
+
+            for label, rows in row_counts.items():
+                IngestedFile.objects.update_or_create(
+                    file_hash=digests[label],
+                    defaults={'file_name': os.path.basename(options[f'{label}_file']), 'rows': rows},
+                )
+
             self.stdout.write(self.style.SUCCESS('Data ingestion completed successfully!'))
-        
+
         except Exception as e:
             self.stdout.write(self.style.ERROR(f'Error during ingestion: {str(e)}'))
             raise
 
-    def ingest_customers(self, file_path):
-        """Ingest customer data from Excel file"""
-        df = pd.read_excel(file_path)
-        
-        customers_created = 0
-        
-        for _, row in df.iterrows():
-            # Check if customer already exists
-            if Customer.objects.filter(customer_id=row['Customer ID']).exists():
-                continue
-            
-            Customer.objects.create(
-                customer_id=int(row['Customer ID']),
-                first_name=str(row['First Name']),
-                last_name=str(row['Last Name']),
-                age=25,  # Default age as not in Excel
-                phone_number=int(row['Phone Number']),
-                monthly_salary=Decimal(str(row['Monthly Salary'])),
-                approved_limit=Decimal(str(row['Approved Limit'])),
-                current_debt=Decimal(str(row.get('Current Debt', 0)))
+    def run_job(self, customer_file, loan_file, options):
+        """
+        Load the files as a checkpointed IngestionJob, here or on a Celery
+        worker with --background
+        """
+        job, created = find_or_create_ingestion_job(
+            os.path.abspath(customer_file), os.path.abspath(loan_file),
+            upsert=options['upsert'], recompute_emi=options['recompute_emi'], force=options['force'],
+            chunk_size=options['chunk_size'], batch_size=options['batch_size'],
+        )
+        if options['background'] and not created and job.status in (IngestionJob.PENDING, IngestionJob.RUNNING):
+            # Already queued or running on a worker; a second task could not
+            # claim it
+            state = 'running' if job.status == IngestionJob.RUNNING else 'queued'
+            self.stdout.write(
+                f'Ingestion job {job.pk} is already {state}, follow it at /ingestion-jobs/{job.pk}'
             )
-            customers_created += 1
-        
-        self.stdout.write(self.style.SUCCESS(f'Created {customers_created} customers'))
-
-    def ingest_loans(self, file_path):
-        """Ingest loan data from Excel file"""
-        df = pd.read_excel(file_path)
-        
-        loans_created = 0
-        
-        for _, row in df.iterrows():
-            # Check if loan already exists
-            if Loan.objects.filter(loan_id=row['Loan ID']).exists():
-                continue
-            
-            try:
-                customer = Customer.objects.get(customer_id=int(row['Customer ID']))
-            except Customer.DoesNotExist:
-                self.stdout.write(self.style.WARNING(
-                    f'Customer {row["Customer ID"]} not found for loan {row["Loan ID"]}, skipping...'
-                ))
-                continue
-            
-            # Parse dates
-            start_date = pd.to_datetime(row['Date of Approval']).date()
-            end_date = pd.to_datetime(row['End Date']).date()
-            
-            Loan.objects.create(
-                loan_id=int(row['Loan ID']),
-                customer=customer,
-                loan_amount=Decimal(str(row['Loan Amount'])),
-                tenure=int(row['Tenure']),
-                interest_rate=Decimal(str(row['Interest Rate'])),
-                monthly_repayment=Decimal(str(row['Monthly payment'])),
-                emis_paid_on_time=int(row['EMIs paid on Time']),
-                start_date=start_date,
-                end_date=end_date
+            return
+        if not created:
+            self.stdout.write(
+                f'Resuming ingestion job {job.pk} after {job.customers_done} customer '
+                f'and {job.loans_done} loan rows'
             )
-            loans_created += 1
-        
-        self.stdout.write(self.style.SUCCESS(f'Created {loans_created} loans'))
+
+        if options['background']:
+            run_ingestion_job.delay(job.pk)
+            self.stdout.write(self.style.SUCCESS(
+                f'Queued ingestion job {job.pk}, follow it at /ingestion-jobs/{job.pk}'
+            ))
+            return
+
+        if not claim_ingestion_job(job.pk):
+            raise CommandError(f'Ingestion job {job.pk} is already running')
+        job = run_ingestion(job, warn=lambda message: self.stdout.write(self.style.WARNING(message)))
+        self.stdout.write(self.style.SUCCESS(
+            f'Ingestion job {job.pk} completed: created {job.rows_created} rows, updated '
+            f'{job.rows_updated}, skipped {job.rows_skipped} ({job.rows_per_second:,.0f} rows/s)'
+        ))
+
+    def stage(self, sources, digests, chunk_size):
+        """
+        Swap each source for its columnar copy in the staging cache,
+        converting files seen for the first time
+        """
+        if not staging_available():
+            self.stdout.write(self.style.WARNING('pyarrow is not installed, reading files directly'))
+            return sources
+
+        cache = StagingCache(settings.INGEST_CACHE_DIR)
+        staged = {}
+        for label, path in sources.items():
+            staged[label], converted = cache.stage(path, read_frames, digests[label], chunk_size)
+            if converted:
+                self.stdout.write(f'Converted {os.path.basename(path)} into the staging cache')
+            else:
+                self.stdout.write(f'Reading {os.path.basename(path)} from the staging cache')
+        return staged
+
+    def dry_run(self, sources, options):
+        """Parse and normalize every row without touching the database"""
+        normalizers = {
+            'customers': normalize_customers,
+            'loans': lambda df: normalize_loans(df, options['recompute_emi']),
+        }
+        for label, path in sources.items():
+            rows = 0
+            for df in read_frames(path, options['chunk_size']):
+                normalizers[label](df)
+                rows += len(df)
+            self.stdout.write(f'{label.capitalize()}: {rows} rows parsed ({count_rows(path)} in file)')
+        self.stdout.write(self.style.SUCCESS('Dry run completed, nothing was written'))
+
+    def ingest_parallel(self, ingestor, sources, workers):
+        """
+        Commit customers first (loans reference them), then load loan row
+        ranges in worker processes and finish in this process
+        """
+        row_counts = {}
+        if 'customers' in sources:
+            self.stdout.write('Ingesting customer data...')
+            with transaction.atomic():
+                stats = ingestor.ingest_customers(sources['customers'])
+            self.report('customers', stats)
+            row_counts['customers'] = stats.rows
+
+        try:
+            if 'loans' in sources:
+                self.stdout.write(f'Ingesting loan data with {workers} workers...')
+                stats = ingest_loans_parallel(ingestor, sources['loans'], workers)
+                self.report('loans', stats)
+                row_counts['loans'] = stats.rows
+        finally:
+            # Worker partitions are already committed, so their profiles are
+            # rebuilt even when another partition failed
+            with transaction.atomic():
+                profiles = ingestor.finish()
+            self.stdout.write(f'Rebuilt {profiles} credit profiles')
+        return row_counts
+
+    def report(self, label, stats):
+        """Print the counters of one ingested file"""
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {stats.created} {label}, updated {stats.updated}, '
+            f'skipped {stats.skipped} ({stats.rows} rows in {stats.seconds:.2f}s, '
+            f'{stats.rows_per_second:,.0f} rows/s)'
+        ))
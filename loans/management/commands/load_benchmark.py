@@ -0,0 +1,83 @@
+import json
+import random
+from django.core.management.base import BaseCommand, CommandError
+from loans.loadgen import run_load
+from loans.models import Customer, Loan
+
+
+ENDPOINTS = ['check-eligibility', 'view-loan', 'view-loans']
+
+
+class Command(BaseCommand):
+    help = (
+        'Load running servers (e.g. sync gunicorn and uvicorn with ASYNC_VIEWS) at a fixed '
+        'concurrency and compare requests/second and p99 latency per endpoint. IDs are '
+        'sampled from the database the servers use.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--target', action='append', required=True, metavar='LABEL=URL',
+            help='Server to load, e.g. sync=http://localhost:8000 (repeatable)'
+        )
+        parser.add_argument(
+            '--endpoint', action='append', choices=ENDPOINTS,
+            help='Endpoint to load (repeatable, default: all)'
+        )
+        parser.add_argument('--concurrency', type=int, default=32, help='Concurrent connections')
+        parser.add_argument('--duration', type=float, default=15.0, help='Seconds per endpoint and target')
+        parser.add_argument('--samples', type=int, default=1000, help='Customer and loan IDs to rotate through')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+
+    def handle(self, *args, **options):
+        targets = []
+        for target in options['target']:
+            label, separator, url = target.partition('=')
+            if not separator:
+                raise CommandError(f'Expected LABEL=URL, got {target}')
+            targets.append((label, url))
+
+        rng = random.Random(options['seed'])
+        customer_ids = list(Customer.objects.values_list('customer_id', flat=True)[:options['samples'] * 10])
+        loan_ids = list(Loan.objects.values_list('loan_id', flat=True)[:options['samples'] * 10])
+        if not customer_ids or not loan_ids:
+            raise CommandError('No customers or loans to request, run ingest_data first')
+        customer_ids = rng.sample(customer_ids, min(options['samples'], len(customer_ids)))
+        loan_ids = rng.sample(loan_ids, min(options['samples'], len(loan_ids)))
+
+        requests = {
+            'check-eligibility': lambda worker, sequence: ('POST', '/check-eligibility', json.dumps({
+                'customer_id': customer_ids[(worker + sequence) % len(customer_ids)],
+                'loan_amount': 100000, 'interest_rate': 12, 'tenure': 24,
+            }).encode()),
+            'view-loan': lambda worker, sequence: (
+                'GET', f'/view-loan/{loan_ids[(worker + sequence) % len(loan_ids)]}', None
+            ),
+            'view-loans': lambda worker, sequence: (
+                'GET', f'/view-loans/{customer_ids[(worker + sequence) % len(customer_ids)]}', None
+            ),
+        }
+
+        results = {}
+        for endpoint in options['endpoint'] or ENDPOINTS:
+            for label, url in targets:
+                result = run_load(
+                    url, requests[endpoint],
+                    concurrency=options['concurrency'], duration=options['duration'],
+                )
+                results.setdefault(endpoint, {})[label] = result.summary()
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        self.stdout.write(f'concurrency {options["concurrency"]}, {options["duration"]:.0f}s per run')
+        for endpoint, by_target in results.items():
+            self.stdout.write(self.style.MIGRATE_HEADING(f'\n{endpoint}'))
+            for label, summary in by_target.items():
+                self.stdout.write(
+                    f'  {label:>8}: {summary["requests_per_second"]:>8,.1f} req/s, '
+                    f'p50 {summary["p50_ms"]:.1f} ms, p99 {summary["p99_ms"]:.1f} ms, '
+                    f'{summary["errors"]} errors'
+                )
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from loans.models import Customer
+from loans.profiles import rebuild_credit_profiles
+
+
+class Command(BaseCommand):
+    help = 'Rebuild materialized customer credit profiles from the loans table'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--customer', type=int, action='append', dest='customer_ids',
+            help='Only rebuild the profile of this customer ID (repeatable)'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of customers rebuilt per transaction'
+        )
+
+    def handle(self, *args, **options):
+        if options['customer_ids']:
+            customer_ids = iter(options['customer_ids'])
+        else:
+            customer_ids = Customer.objects.order_by('customer_id').values_list(
+                'customer_id', flat=True
+            ).iterator()
+
+        batch_size = options['batch_size']
+        batch = []
+        rebuilt = 0
+
+        for customer_id in customer_ids:
+            batch.append(customer_id)
+            if len(batch) >= batch_size:
+                rebuilt += self.rebuild_batch(batch)
+                batch = []
+
+        if batch:
+            rebuilt += self.rebuild_batch(batch)
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {rebuilt} credit profiles'))
+
+    def rebuild_batch(self, customer_ids):
+        """Rebuild one batch of profiles atomically"""
+        with transaction.atomic():
+            return len(rebuild_credit_profiles(customer_ids))
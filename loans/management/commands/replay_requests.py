@@ -0,0 +1,150 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from loans.loadgen import combine
+from loans.replay import (
+    Replay, async_http_client, async_local_client, http_client, local_client, read_traffic,
+    recorded_expectation
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Replay a JSONL traffic file (see loans/replay.py for the format) through the Django '
+        'test client or against a running server, closed-loop or open-loop at a fixed rate or '
+        'the recorded timing. Reports latency per endpoint and status counts, and checks '
+        'responses against the recorded expectations.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('traffic', help='JSONL traffic file, e.g. sample_traffic.jsonl')
+        parser.add_argument('--target', help='Server to replay against, e.g. http://localhost:8000 (default: in-process)')
+        parser.add_argument('--concurrency', type=int, default=8, help='Requests in flight at most')
+        parser.add_argument(
+            '--mode', choices=['threads', 'asyncio'], default='threads',
+            help='Send from threads, or from one asyncio event loop (in-process: through ASGI)'
+        )
+        pacing = parser.add_mutually_exclusive_group()
+        pacing.add_argument('--rate', type=float, help='Open loop: send this many requests per second')
+        pacing.add_argument(
+            '--timestamps', action='store_true',
+            help='Open loop: send each request at its recorded "at" offset'
+        )
+        parser.add_argument('--speed', type=float, default=1.0, help='Replay recorded timestamps this much faster')
+        parser.add_argument('--output', help='Write every request\'s status, latency and mismatches to this JSONL file')
+        parser.add_argument(
+            '--record', metavar='FILE',
+            help='Write the traffic to FILE with the responses received as the new expectations'
+        )
+        parser.add_argument('--no-check', action='store_true', help='Do not compare responses with expectations')
+        parser.add_argument('--show-mismatches', type=int, default=10, help='Mismatching requests to print')
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1:
+            raise CommandError('--concurrency must be at least 1')
+        schedule = None
+        if options['rate']:
+            rate = options['rate']
+            schedule = lambda index, entry: index / rate  # noqa: E731
+        elif options['timestamps']:
+            schedule = self.recorded_schedule(options['speed'])
+
+        if options['mode'] == 'asyncio':
+            make_sender = async_http_client(options['target']) if options['target'] else async_local_client()
+        else:
+            make_sender = http_client(options['target']) if options['target'] else local_client()
+
+        files = []
+        recorded = []
+        try:
+            traffic = open(options['traffic'])
+            files.append(traffic)
+            output = record = None
+            if options['output']:
+                output = open(options['output'], 'w')
+                files.append(output)
+            if options['record']:
+                record = open(options['record'], 'w')
+                files.append(record)
+
+            def on_outcome(outcome):
+                if output is not None:
+                    output.write(json.dumps({
+                        'line': outcome.entry.line,
+                        'method': outcome.entry.method,
+                        'path': outcome.entry.path,
+                        'status': outcome.status,
+                        'latency_ms': round(outcome.latency_ms, 3),
+                        'mismatches': outcome.mismatches,
+                    }) + '\n')
+                if record is not None:
+                    recorded.append((outcome.entry.line, recorded_expectation(outcome.entry, outcome)))
+
+            replay = Replay(
+                read_traffic(traffic), make_sender, concurrency=options['concurrency'],
+                schedule=schedule, check=not options['no_check'], on_outcome=on_outcome,
+            )
+            try:
+                if options['mode'] == 'asyncio':
+                    replay.run_asyncio()
+                else:
+                    replay.run_threads()
+            except ValueError as exc:
+                raise CommandError(str(exc))
+            # Keep the recorded traffic in the original order
+            for _, entry in sorted(recorded, key=lambda item: item[0]):
+                record.write(json.dumps(entry) + '\n')
+        except OSError as exc:
+            raise CommandError(str(exc))
+        finally:
+            for file in files:
+                file.close()
+
+        self.report(replay, options)
+        if replay.mismatched and not options['no_check']:
+            raise CommandError(f'{len(replay.mismatched)} responses did not match their expectations')
+
+    def recorded_schedule(self, speed):
+        """Schedule replaying the recorded "at" offsets, relative to the first one"""
+        first = []
+
+        def schedule(index, entry):
+            if entry.at is None:
+                raise ValueError(f'Line {entry.line}: --timestamps needs an "at" offset on every request')
+            if not first:
+                first.append(entry.at)
+            return max(entry.at - first[0], 0) / speed
+
+        return schedule
+
+    def report(self, replay, options):
+        overall = combine(replay.results).summary()
+        self.stdout.write(
+            f'{overall["requests"] + overall["errors"]} requests in {replay.seconds:.2f}s '
+            f'({options["target"] or "in-process"}, {options["mode"]}, concurrency {options["concurrency"]}'
+            + (f', open loop at {options["rate"]:g}/s' if options['rate'] else '')
+            + (f', recorded timing x{options["speed"]:g}' if options['timestamps'] else '')
+            + ')'
+        )
+        rows = sorted((label, result.summary()) for label, result in replay.results.items())
+        for label, summary in rows + [('overall', overall)]:
+            self.stdout.write(
+                f'  {label:>22}: {summary["requests"] + summary["errors"]:>6} requests, '
+                f'p50 {summary["p50_ms"]:.1f} ms, p95 {summary["p95_ms"]:.1f} ms, '
+                f'p99 {summary["p99_ms"]:.1f} ms, {summary["errors"]} errors'
+            )
+        statuses = ', '.join(
+            f'{status or "failed"}: {count}'
+            for status, count in sorted(replay.statuses.items(), key=lambda item: item[0] or 0)
+        )
+        self.stdout.write(f'Statuses: {statuses}')
+
+        if options['no_check']:
+            return
+        if not replay.mismatched:
+            self.stdout.write(self.style.SUCCESS('All responses matched their expectations'))
+            return
+        for outcome in sorted(replay.mismatched, key=lambda outcome: outcome.entry.line)[:options['show_mismatches']]:
+            entry = outcome.entry
+            self.stdout.write(self.style.ERROR(f'Line {entry.line}: {entry.method} {entry.path}'))
+            for mismatch in outcome.mismatches:
+                self.stdout.write(f'    {mismatch}')
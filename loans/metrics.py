@@ -0,0 +1,239 @@
+# Per-request instrumentation. RequestMetricsMiddleware counts every request
+# and its latency; a sampled share of requests (METRICS_SAMPLE_RATE) also
+# records its queries, database time and the named spans below, sent back in
+# a Server-Timing header. Everything is aggregated in process and served by
+# /metrics in the Prometheus text format, so each worker process reports its
+# own series.
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from functools import wraps
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+
+
+logger = logging.getLogger('loans.slow_queries')
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100)
+
+_current = ContextVar('request_metrics', default=None)
+_lock = threading.Lock()
+
+
+class Counter:
+    def __init__(self, name, help, labels):
+        self.name, self.help, self.labels = name, help, labels
+        self.series = {}
+
+    def inc(self, values, amount=1):
+        with _lock:
+            self.series[values] = self.series.get(values, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        for values, count in sorted(self.series.items()):
+            lines.append(f'{self.name}{_labels(self.labels, values)} {count}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labels, buckets):
+        self.name, self.help, self.labels, self.buckets = name, help, labels, buckets
+        # values -> [count per bucket (the last one is +Inf), sum]
+        self.series = {}
+
+    def observe(self, values, value):
+        index = bisect_left(self.buckets, value)
+        with _lock:
+            series = self.series.get(values)
+            if series is None:
+                series = self.series[values] = [[0] * (len(self.buckets) + 1), 0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        for values, (counts, total) in sorted(self.series.items()):
+            cumulative = 0
+            for bound, count in zip(list(self.buckets) + ['+Inf'], counts):
+                cumulative += count
+                lines.append(
+                    f'{self.name}_bucket{_labels(self.labels + ("le",), values + (str(bound),))} {cumulative}'
+                )
+            lines.append(f'{self.name}_sum{_labels(self.labels, values)} {total}')
+            lines.append(f'{self.name}_count{_labels(self.labels, values)} {cumulative}')
+        return lines
+
+
+def _labels(names, values):
+    pairs = ','.join(
+        '%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in zip(names, values)
+    )
+    return '{%s}' % pairs
+
+
+REQUESTS = Counter('http_requests_total', 'Requests by view, method and status.', ('view', 'method', 'status'))
+REQUEST_SECONDS = Histogram(
+    'http_request_duration_seconds', 'Request latency by view.', ('view',), LATENCY_BUCKETS
+)
+QUERIES = Histogram(
+    'http_request_db_queries', 'SQL queries per sampled request by view.', ('view',), QUERY_BUCKETS
+)
+DB_SECONDS = Histogram(
+    'http_request_db_duration_seconds', 'Database time per sampled request by view.', ('view',), LATENCY_BUCKETS
+)
+SPAN_SECONDS = Histogram(
+    'http_request_span_duration_seconds', 'Time per sampled request in named spans.', ('view', 'span'),
+    LATENCY_BUCKETS
+)
+SLOW_QUERIES = Counter(
+    'db_slow_queries_total', 'Queries slower than SLOW_QUERY_MS in sampled requests.', ('view',)
+)
+METRICS = [REQUESTS, REQUEST_SECONDS, QUERIES, DB_SECONDS, SPAN_SECONDS, SLOW_QUERIES]
+
+
+class RequestMetrics:
+    """Queries, database time and span durations of one sampled request"""
+
+    def __init__(self, request):
+        self.request = request
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.spans = {}
+        self._open = set()
+
+    @property
+    def view(self):
+        return view_name(self.request)
+
+    def add_span(self, name, seconds):
+        self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+    def server_timing(self, total_seconds):
+        """Server-Timing header value, durations in milliseconds"""
+        entries = [f'db;dur={self.db_seconds * 1000:.2f};desc="{self.queries} queries"']
+        entries += [f'{name};dur={seconds * 1000:.2f}' for name, seconds in self.spans.items()]
+        entries.append(f'total;dur={total_seconds * 1000:.2f}')
+        return ', '.join(entries)
+
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return (match.url_name or match.view_name) if match else 'unmatched'
+
+
+def start_request(request, sampled):
+    """Begin recording a request, returning the token for finish_request"""
+    return _current.set(RequestMetrics(request) if sampled else None)
+
+
+def finish_request(token, request, response, seconds):
+    """
+    Record a finished request and, when it was sampled, add its
+    Server-Timing header
+    """
+    metrics = _current.get()
+    _current.reset(token)
+    view = view_name(request)
+    REQUESTS.inc((view, request.method, str(response.status_code)))
+    REQUEST_SECONDS.observe((view,), seconds)
+    if metrics is None:
+        return
+    QUERIES.observe((view,), metrics.queries)
+    DB_SECONDS.observe((view,), metrics.db_seconds)
+    for name, span_seconds in metrics.spans.items():
+        SPAN_SECONDS.observe((view, name), span_seconds)
+    response['Server-Timing'] = metrics.server_timing(seconds)
+
+
+def record_query(execute, sql, params, many, context):
+    """
+    Database execute wrapper timing the queries of sampled requests and
+    logging those slower than SLOW_QUERY_MS
+    """
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        seconds = time.perf_counter() - started
+        metrics.queries += 1
+        metrics.db_seconds += seconds
+        if seconds * 1000 >= settings.SLOW_QUERY_MS:
+            SLOW_QUERIES.inc((metrics.view,))
+            logger.warning(
+                'Slow query (%.1f ms) in %s on %s: %s',
+                seconds * 1000, metrics.view, context['connection'].alias, sql[:2000],
+            )
+
+
+def install_query_recorder(sender, connection, **kwargs):
+    """connection_created receiver adding record_query to every connection"""
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def span(name):
+    """
+    Decorator adding a function's duration in sampled requests to the named
+    span. Nested calls of the same span are counted once.
+    """
+    def decorator(func):
+        if iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                metrics = _current.get()
+                if metrics is None or name in metrics._open:
+                    return await func(*args, **kwargs)
+                metrics._open.add(name)
+                started = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    metrics._open.discard(name)
+                    metrics.add_span(name, time.perf_counter() - started)
+            return async_wrapper
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            metrics = _current.get()
+            if metrics is None or name in metrics._open:
+                return func(*args, **kwargs)
+            metrics._open.add(name)
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                metrics._open.discard(name)
+                metrics.add_span(name, time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+
+def timed_render(response):
+    """
+    Make a DRF response count its rendering to the serialize span of the
+    sampled request it belongs to
+    """
+    if _current.get() is not None:
+        response.render = span('serialize')(response.render)
+    return response
+
+
+def render_metrics():
+    """All metrics in the Prometheus text exposition format"""
+    with _lock:
+        lines = [line for metric in METRICS for line in metric.render()]
+    return '\n'.join(lines) + '\n'
+
+
+def reset_metrics():
+    with _lock:
+        for metric in METRICS:
+            metric.series = {}
@@ -0,0 +1,50 @@
+import random
+import time
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from .metrics import finish_request, start_request, timed_render
+
+
+class RequestMetricsMiddleware:
+    """
+    Record every request's latency and, for a METRICS_SAMPLE_RATE share of
+    requests, its queries, database time and spans (see loans.metrics).
+    Place it first in MIDDLEWARE so the total covers the other middleware.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not settings.METRICS_ENABLED:
+            return self.get_response(request)
+        started = time.perf_counter()
+        token = start_request(request, self.sampled())
+        response = self.get_response(request)
+        finish_request(token, request, response, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        if not settings.METRICS_ENABLED:
+            return await self.get_response(request)
+        started = time.perf_counter()
+        token = start_request(request, self.sampled())
+        response = await self.get_response(request)
+        finish_request(token, request, response, time.perf_counter() - started)
+        return response
+
+    def process_template_response(self, request, response):
+        return timed_render(response)
+
+    @staticmethod
+    def sampled():
+        rate = settings.METRICS_SAMPLE_RATE
+        return rate >= 1 or random.random() < rate
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.7 on 2026-10-17 05:51
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loans', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CustomerCreditProfile',
+            fields=[
+                ('customer', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='credit_profile', serialize=False, to='loans.customer')),
+                ('loan_count', models.IntegerField(default=0)),
+                ('total_loan_amount', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('total_monthly_repayment', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('on_time_ratio_sum', models.FloatField(default=0)),
+                ('activity_by_year', models.JSONField(default=dict, help_text='Number of loans starting or ending in each year')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'customer_credit_profiles',
+            },
+        ),
+    ]
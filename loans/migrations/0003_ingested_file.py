@@ -0,0 +1,26 @@
+# Generated by Django 4.2.7 on 2026-10-17 06:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loans', '0002_customer_credit_profile'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngestedFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file_hash', models.CharField(max_length=64, unique=True)),
+                ('file_name', models.CharField(max_length=255)),
+                ('rows', models.IntegerField(default=0)),
+                ('ingested_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'ingested_files',
+            },
+        ),
+    ]
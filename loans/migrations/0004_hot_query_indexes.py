@@ -0,0 +1,62 @@
+# Generated by Django 4.2.7 on 2026-10-17 06:03
+
+from django.db import migrations, models
+from django.db.models import Count
+import django.db.models.deletion
+
+
+# Duplicate phone numbers listed when the migration refuses to run
+MAX_REPORTED_DUPLICATES = 20
+
+
+def check_duplicate_phone_numbers(apps, schema_editor):
+    """
+    Refuse to make phone_number unique while customers share a number,
+    listing them; which customer keeps the number is not ours to guess
+    """
+    Customer = apps.get_model('loans', 'Customer')
+    duplicates = (
+        Customer.objects.values('phone_number')
+        .annotate(customers=Count('customer_id'))
+        .filter(customers__gt=1)
+        .order_by('phone_number')
+        .values_list('phone_number', flat=True)
+    )
+    lines = []
+    for phone_number in duplicates[:MAX_REPORTED_DUPLICATES]:
+        customer_ids = Customer.objects.filter(phone_number=phone_number).order_by('customer_id').values_list(
+            'customer_id', flat=True
+        )
+        lines.append(f"{phone_number}: customers {', '.join(map(str, customer_ids))}")
+    if lines:
+        raise RuntimeError(
+            f'{duplicates.count()} phone numbers belong to more than one customer, merge or '
+            'renumber them before migrating:\n' + '\n'.join(lines)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loans', '0003_ingested_file'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicate_phone_numbers, migrations.RunPython.noop),
+        # Create the composite index before dropping the single-column
+        # foreign key index it replaces
+        migrations.AddIndex(
+            model_name='loan',
+            index=models.Index(fields=['customer', 'start_date', 'end_date'], include=('loan_amount', 'monthly_repayment', 'tenure', 'emis_paid_on_time'), name='loans_customer_dates_idx'),
+        ),
+        migrations.AlterField(
+            model_name='loan',
+            name='customer',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='loans', to='loans.customer'),
+        ),
+        migrations.AlterField(
+            model_name='customer',
+            name='phone_number',
+            field=models.BigIntegerField(unique=True),
+        ),
+    ]
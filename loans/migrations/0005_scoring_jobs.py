@@ -0,0 +1,47 @@
+# Generated by Django 4.2.7 on 2026-10-17 06:18
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loans', '0004_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScoringJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed')], default='pending', max_length=16)),
+                ('customer_ids', models.JSONField(blank=True, help_text='Customers to score, all customers when empty', null=True)),
+                ('updated_since', models.DateTimeField(blank=True, help_text='Only score customers whose credit profile changed since', null=True)),
+                ('chunk_size', models.IntegerField(default=1000)),
+                ('total_customers', models.IntegerField(default=0)),
+                ('scored_customers', models.IntegerField(default=0)),
+                ('total_chunks', models.IntegerField(default=0)),
+                ('completed_chunks', models.IntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'scoring_jobs',
+            },
+        ),
+        migrations.CreateModel(
+            name='CustomerScore',
+            fields=[
+                ('customer', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stored_score', serialize=False, to='loans.customer')),
+                ('score', models.IntegerField()),
+                ('scored_at', models.DateTimeField()),
+                ('job', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='scores', to='loans.scoringjob')),
+            ],
+            options={
+                'db_table': 'customer_scores',
+            },
+        ),
+    ]
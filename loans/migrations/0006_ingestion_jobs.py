@@ -0,0 +1,47 @@
+# Generated by Django 4.2.7 on 2026-10-17 06:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loans', '0005_scoring_jobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngestionJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed')], default='pending', max_length=16)),
+                ('customers_file', models.CharField(max_length=500)),
+                ('customers_hash', models.CharField(max_length=64)),
+                ('loans_file', models.CharField(max_length=500)),
+                ('loans_hash', models.CharField(max_length=64)),
+                ('upsert', models.BooleanField(default=False)),
+                ('recompute_emi', models.BooleanField(default=False)),
+                ('force', models.BooleanField(default=False)),
+                ('chunk_size', models.IntegerField(default=50000, help_text='Rows committed per checkpoint')),
+                ('batch_size', models.IntegerField(default=5000)),
+                ('customers_total', models.IntegerField(blank=True, help_text='Rows to load, 0 when unchanged', null=True)),
+                ('customers_done', models.IntegerField(default=0)),
+                ('loans_total', models.IntegerField(blank=True, help_text='Rows to load, 0 when unchanged', null=True)),
+                ('loans_done', models.IntegerField(default=0)),
+                ('rows_created', models.IntegerField(default=0)),
+                ('rows_updated', models.IntegerField(default=0)),
+                ('rows_skipped', models.IntegerField(default=0)),
+                ('warnings', models.JSONField(blank=True, default=list)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('run_started_at', models.DateTimeField(blank=True, help_text='Start of the latest (resumed) run', null=True)),
+                ('run_start_rows', models.IntegerField(default=0, help_text='Rows already done when the latest run started')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'ingestion_jobs',
+            },
+        ),
+    ]
@@ -0,0 +1,80 @@
+# Generated by Django 4.2.7 on 2026-10-17 06:24
+
+from decimal import Decimal
+import numpy as np
+from django.db import migrations, models
+
+
+BATCH_SIZE = 5000
+
+
+def outstanding_principal_cents(loan_amounts, interest_rates, installments, tenures, paid):
+    """
+    Principal outstanding, in paise, after `paid` installments:
+    P(1 + r)^k - EMI((1 + r)^k - 1) / r, rounded to the paisa, never
+    negative and zero once the tenure is over. A frozen copy of the
+    loans.amortization computation at the time of this migration.
+    """
+    def floats(values):
+        return np.fromiter(map(float, values), dtype=np.float64, count=len(values))
+
+    principal = np.round(floats(loan_amounts) * 100)
+    rate = floats(interest_rates) / 12 / 100
+    installment = np.round(floats(installments) * 100)
+    tenure = floats(tenures)
+    paid = floats(paid)
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        growth = np.expm1(paid * np.log1p(rate))
+        balance = np.where(
+            rate == 0,
+            principal - installment * paid,
+            principal + principal * growth - installment * growth / rate,
+        )
+    balance = np.round(np.nan_to_num(balance)).clip(min=0)
+    balance = np.where(paid >= tenure, 0, balance)
+    balance = np.where(paid <= 0, principal, balance)
+    return balance.astype(np.int64)
+
+
+def fill_outstanding_principal(apps, schema_editor):
+    """Compute the outstanding principal of existing loans in batches"""
+    Loan = apps.get_model('loans', 'Loan')
+    fields = ['loan_id', 'loan_amount', 'interest_rate', 'monthly_repayment', 'tenure', 'emis_paid_on_time']
+    rows = Loan.objects.order_by('loan_id').values_list(*fields).iterator(chunk_size=BATCH_SIZE)
+
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == BATCH_SIZE:
+            _update(Loan, batch)
+            batch = []
+    if batch:
+        _update(Loan, batch)
+
+
+def _update(Loan, batch):
+    loan_ids, amounts, rates, installments, tenures, paid = zip(*batch)
+    cents = outstanding_principal_cents(amounts, rates, installments, tenures, paid)
+    Loan.objects.bulk_update(
+        [
+            Loan(loan_id=loan_id, outstanding_principal=Decimal(value).scaleb(-2))
+            for loan_id, value in zip(loan_ids, cents.tolist())
+        ],
+        ['outstanding_principal'],
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loans', '0006_ingestion_jobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='loan',
+            name='outstanding_principal',
+            field=models.DecimalField(decimal_places=2, default=0, help_text='Principal left after the EMIs paid, kept up to date on save', max_digits=12),
+        ),
+        migrations.RunPython(fill_outstanding_principal, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 4.2.7 on 2026-10-17 06:57
+
+from collections import defaultdict
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Count
+
+
+ON_TIME_RATIO_QUANTUM = Decimal('1e-10')
+
+
+def recompute_on_time_ratio_sums(apps, schema_editor):
+    """
+    Replace the float sums carried over from the old column with the sum of
+    each loan's rounded on-time ratio, which later loan changes add and
+    subtract exactly
+    """
+    Loan = apps.get_model('loans', 'Loan')
+    CustomerCreditProfile = apps.get_model('loans', 'CustomerCreditProfile')
+
+    sums = defaultdict(Decimal)
+    rows = Loan.objects.filter(tenure__gt=0).values('customer_id', 'emis_paid_on_time', 'tenure').annotate(
+        n=Count('loan_id')
+    ).order_by()
+    for row in rows:
+        ratio = Decimal(min(row['emis_paid_on_time'], row['tenure'])) / Decimal(row['tenure'])
+        sums[row['customer_id']] += row['n'] * ratio.quantize(ON_TIME_RATIO_QUANTUM)
+
+    profiles = list(CustomerCreditProfile.objects.only('customer_id', 'on_time_ratio_sum'))
+    for profile in profiles:
+        profile.on_time_ratio_sum = sums.get(profile.customer_id, Decimal('0'))
+    CustomerCreditProfile.objects.bulk_update(profiles, ['on_time_ratio_sum'], batch_size=5000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loans', '0008_idempotency_keys'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='customercreditprofile',
+            name='on_time_ratio_sum',
+            field=models.DecimalField(decimal_places=10, default=0, max_digits=20),
+        ),
+        migrations.RunPython(recompute_on_time_ratio_sums, migrations.RunPython.noop),
+    ]
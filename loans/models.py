@@ -1,13 +1,15 @@
 from django.db import models
 from django.core.validators import MinValueValidator
 
+from .amortization import outstanding_principal
+
 
 class Customer(models.Model):
     customer_id = models.AutoField(primary_key=True)
     first_name = models.CharField(max_length=100)
     last_name = models.CharField(max_length=100)
     age = models.IntegerField(validators=[MinValueValidator(18)])
-    phone_number = models.BigIntegerField()
+    phone_number = models.BigIntegerField(unique=True)
     monthly_salary = models.DecimalField(max_digits=12, decimal_places=2)
     approved_limit = models.DecimalField(max_digits=12, decimal_places=2)
     current_debt = models.DecimalField(max_digits=12, decimal_places=2, default=0)
@@ -19,9 +21,16 @@ class Customer(models.Model):
         return f"{self.first_name} {self.last_name}"
 
 
+# Loan fields outstanding_principal is derived from
+AMORTIZATION_FIELDS = {'loan_amount', 'interest_rate', 'monthly_repayment', 'tenure', 'emis_paid_on_time'}
+
+
 class Loan(models.Model):
     loan_id = models.AutoField(primary_key=True)
-    customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name='loans')
+    # Indexed through loans_customer_dates_idx, which leads with customer_id
+    customer = models.ForeignKey(
+        Customer, on_delete=models.CASCADE, related_name='loans', db_index=False
+    )
     loan_amount = models.DecimalField(max_digits=12, decimal_places=2)
     tenure = models.IntegerField(help_text="Tenure in months")
     interest_rate = models.DecimalField(max_digits=5, decimal_places=2)
@@ -29,14 +38,243 @@ class Loan(models.Model):
     emis_paid_on_time = models.IntegerField(default=0)
     start_date = models.DateField()
     end_date = models.DateField()
+    outstanding_principal = models.DecimalField(
+        max_digits=12, decimal_places=2, default=0,
+        help_text="Principal left after the EMIs paid, kept up to date on save"
+    )
 
     class Meta:
         db_table = 'loans'
+        indexes = [
+            # Serves per-customer loan lists, the current-year filter and, on
+            # PostgreSQL, the credit score aggregates as index-only scans
+            models.Index(
+                fields=['customer', 'start_date', 'end_date'],
+                include=['loan_amount', 'monthly_repayment', 'tenure', 'emis_paid_on_time'],
+                name='loans_customer_dates_idx',
+            ),
+        ]
 
     def __str__(self):
         return f"Loan {self.loan_id} - Customer {self.customer.customer_id}"
 
+    def save(self, *args, **kwargs):
+        amortization = [
+            self.loan_amount, self.interest_rate, self.monthly_repayment, self.tenure, self.emis_paid_on_time
+        ]
+        # Values given as F() expressions are only known to the database
+        if not any(hasattr(value, 'resolve_expression') for value in amortization):
+            self.outstanding_principal = outstanding_principal(*amortization)
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None and AMORTIZATION_FIELDS.intersection(update_fields):
+                kwargs['update_fields'] = {*update_fields, 'outstanding_principal'}
+        super().save(*args, **kwargs)
+
     @property
     def repayments_left(self):
         """Calculate remaining EMIs"""
         return max(0, self.tenure - self.emis_paid_on_time)
+
+
+class CustomerCreditProfile(models.Model):
+    """
+    Running loan totals per customer, kept in step with the loans table so
+    the credit score can be read without scanning a customer's loans
+    """
+    customer = models.OneToOneField(
+        Customer, on_delete=models.CASCADE, primary_key=True, related_name='credit_profile'
+    )
+    loan_count = models.IntegerField(default=0)
+    total_loan_amount = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    total_monthly_repayment = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    on_time_ratio_sum = models.DecimalField(max_digits=20, decimal_places=10, default=0)
+    activity_by_year = models.JSONField(
+        default=dict, help_text="Number of loans starting or ending in each year"
+    )
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'customer_credit_profiles'
+
+    def __str__(self):
+        return f"Credit profile - Customer {self.customer_id}"
+
+
+class IngestedFile(models.Model):
+    """
+    Source spreadsheets already loaded, identified by content hash so an
+    unchanged file is not ingested again
+    """
+    file_hash = models.CharField(max_length=64, unique=True)
+    file_name = models.CharField(max_length=255)
+    rows = models.IntegerField(default=0)
+    ingested_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'ingested_files'
+
+    def __str__(self):
+        return f"{self.file_name} ({self.file_hash[:12]})"
+
+
+class ScoringJob(models.Model):
+    """
+    A bulk rescoring run, split into chunks of customers scored by Celery
+    workers in parallel
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    COMPLETED = 'completed'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (COMPLETED, 'Completed'),
+        (FAILED, 'Failed'),
+    ]
+
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=PENDING)
+    customer_ids = models.JSONField(
+        null=True, blank=True, help_text="Customers to score, all customers when empty"
+    )
+    updated_since = models.DateTimeField(
+        null=True, blank=True, help_text="Only score customers whose credit profile changed since"
+    )
+    chunk_size = models.IntegerField(default=1000)
+    total_customers = models.IntegerField(default=0)
+    scored_customers = models.IntegerField(default=0)
+    total_chunks = models.IntegerField(default=0)
+    completed_chunks = models.IntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'scoring_jobs'
+
+    def __str__(self):
+        return f"Scoring job {self.pk} ({self.status})"
+
+
+class CustomerScore(models.Model):
+    """
+    Latest stored credit score of a customer, written by scoring jobs
+    """
+    customer = models.OneToOneField(
+        Customer, on_delete=models.CASCADE, primary_key=True, related_name='stored_score'
+    )
+    score = models.IntegerField()
+    job = models.ForeignKey(ScoringJob, on_delete=models.SET_NULL, null=True, related_name='scores')
+    scored_at = models.DateTimeField()
+
+    class Meta:
+        db_table = 'customer_scores'
+
+    def __str__(self):
+        return f"Score {self.score} - Customer {self.customer_id}"
+
+
+class IngestionJob(models.Model):
+    """
+    A background load of the customer and loan files. Rows are committed in
+    checkpoints of chunk_size rows together with the per-file watermarks
+    (customers_done, loans_done), so a failed or interrupted job resumes
+    after the last committed checkpoint.
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    COMPLETED = 'completed'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (COMPLETED, 'Completed'),
+        (FAILED, 'Failed'),
+    ]
+
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=PENDING)
+    customers_file = models.CharField(max_length=500)
+    customers_hash = models.CharField(max_length=64)
+    loans_file = models.CharField(max_length=500)
+    loans_hash = models.CharField(max_length=64)
+    upsert = models.BooleanField(default=False)
+    recompute_emi = models.BooleanField(default=False)
+    force = models.BooleanField(default=False)
+    chunk_size = models.IntegerField(default=50000, help_text="Rows committed per checkpoint")
+    batch_size = models.IntegerField(default=5000)
+    customers_total = models.IntegerField(null=True, blank=True, help_text="Rows to load, 0 when unchanged")
+    customers_done = models.IntegerField(default=0)
+    loans_total = models.IntegerField(null=True, blank=True, help_text="Rows to load, 0 when unchanged")
+    loans_done = models.IntegerField(default=0)
+    rows_created = models.IntegerField(default=0)
+    rows_updated = models.IntegerField(default=0)
+    rows_skipped = models.IntegerField(default=0)
+    warnings = models.JSONField(default=list, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    run_started_at = models.DateTimeField(
+        null=True, blank=True, help_text="Start of the latest (resumed) run"
+    )
+    run_start_rows = models.IntegerField(default=0, help_text="Rows already done when the latest run started")
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'ingestion_jobs'
+
+    def __str__(self):
+        return f"Ingestion job {self.pk} ({self.status})"
+
+    @property
+    def rows_done(self):
+        return self.customers_done + self.loans_done
+
+    @property
+    def total_rows(self):
+        if self.customers_total is None or self.loans_total is None:
+            return None
+        return self.customers_total + self.loans_total
+
+    @property
+    def rows_per_second(self):
+        """Rate of the latest run, up to its last checkpoint"""
+        if self.run_started_at is None:
+            return 0.0
+        seconds = ((self.finished_at or self.updated_at) - self.run_started_at).total_seconds()
+        rows = self.rows_done - self.run_start_rows
+        return rows / seconds if seconds > 0 else 0.0
+
+    @property
+    def eta_seconds(self):
+        """Estimated seconds left at the latest run's rate, None while unknown"""
+        if self.status == self.COMPLETED:
+            return 0.0
+        if self.total_rows is None or not self.rows_per_second:
+            return None
+        return (self.total_rows - self.rows_done) / self.rows_per_second
+
+
+class IdempotencyKey(models.Model):
+    """
+    An Idempotency-Key sent to one endpoint and the response to its first
+    request, replayed to retries until expires_at. status_code is null
+    while the first request is still running.
+    """
+    scope = models.CharField(max_length=64, help_text="URL name of the endpoint")
+    key = models.CharField(max_length=255)
+    request_hash = models.CharField(max_length=64, help_text="SHA-256 of the method, path and body")
+    status_code = models.IntegerField(null=True, blank=True)
+    response_body = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        db_table = 'idempotency_keys'
+        constraints = [
+            models.UniqueConstraint(fields=['scope', 'key'], name='idempotency_keys_scope_key'),
+        ]
+
+    def __str__(self):
+        return f"Idempotency key {self.key} ({self.scope})"
@@ -0,0 +1,14 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+
+
+class LoanCursorPagination(CursorPagination):
+    """
+    Keyset pagination over loan_id: each page is fetched with
+    loan_id > <last id of the previous page>, so deep pages cost the same
+    as the first one
+    """
+    ordering = 'loan_id'
+    page_size = settings.VIEW_LOANS_PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = settings.VIEW_LOANS_MAX_PAGE_SIZE
@@ -0,0 +1,191 @@
+# Portfolio analytics. Every number is computed by the database with grouped
+# aggregates and window functions; results are kept in the cache for
+# PORTFOLIO_CACHE_TTL seconds and refreshed ahead of expiry by the
+# refresh_portfolio Celery beat task, so requests do not scan the loans table.
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.db.models import Avg, Case, Count, DecimalField, F, Q, Sum, Value, When
+from django.db.models.functions import Coalesce, ExtractYear
+from django.utils import timezone
+
+from .models import Customer, CustomerScore, Loan
+from .routers import read_from, replica_alias
+
+
+SUMMARY_KEY = 'portfolio:summary'
+DISTRIBUTION_KEY = 'portfolio:distribution:{by}'
+
+# Lower edges of the interest rate bands, in percent
+INTEREST_BANDS = [8, 10, 12, 14, 16, 18, 20]
+
+# Credit score bands of the approval rules: no loan, 16% minimum, 12%
+# minimum, any rate
+SCORE_BANDS = [(0, 10), (11, 30), (31, 50), (51, 100)]
+UNSCORED = -1
+
+DISTRIBUTIONS = ['vintage', 'interest_band', 'score_band']
+
+
+def _active():
+    return Q(emis_paid_on_time__lt=F('tenure'))
+
+
+def _amount(value):
+    return round(float(value or 0), 2)
+
+
+def _ratio(numerator, denominator):
+    return float(numerator) / float(denominator) if denominator else 0.0
+
+
+def compute_summary():
+    """
+    Portfolio totals: exposure (outstanding principal), the monthly EMI
+    burden of active loans against customers' salaries, and the stored
+    credit score distribution
+    """
+    amount = DecimalField(max_digits=20, decimal_places=4)
+    loans = Loan.objects.aggregate(
+        loans=Count('loan_id'),
+        active_loans=Count('loan_id', filter=_active()),
+        total_loan_amount=Sum('loan_amount'),
+        exposure=Sum('outstanding_principal'),
+        monthly_emi=Sum('monthly_repayment', filter=_active()),
+        weighted_rate_sum=Sum(F('interest_rate') * F('outstanding_principal'), output_field=amount),
+    )
+    customers = Customer.objects.aggregate(
+        customers=Count('customer_id'),
+        total_monthly_salary=Sum('monthly_salary'),
+        total_approved_limit=Sum('approved_limit'),
+    )
+    scores = CustomerScore.objects.aggregate(
+        scored_customers=Count('customer_id'),
+        average_score=Avg('score'),
+        **{
+            f'band_{low}': Count('customer_id', filter=Q(score__range=(low, high)))
+            for low, high in SCORE_BANDS
+        }
+    )
+
+    outstanding = loans['exposure'] or 0
+    return {
+        'customers': customers['customers'],
+        'loans': loans['loans'],
+        'active_loans': loans['active_loans'],
+        'total_loan_amount': _amount(loans['total_loan_amount']),
+        'outstanding_principal': _amount(outstanding),
+        'monthly_emi': _amount(loans['monthly_emi']),
+        'emi_to_income': _ratio(loans['monthly_emi'] or 0, customers['total_monthly_salary']),
+        'limit_utilization': _ratio(outstanding, customers['total_approved_limit']),
+        'weighted_interest_rate': _ratio(loans['weighted_rate_sum'] or 0, outstanding),
+        'scored_customers': scores['scored_customers'],
+        'average_score': float(scores['average_score'] or 0),
+        'score_distribution': [
+            {'band': f'{low}-{high}', 'customers': scores[f'band_{low}']}
+            for low, high in SCORE_BANDS
+        ],
+        'generated_at': timezone.now().isoformat(),
+    }
+
+
+def _bucket_expression(by):
+    """Integer bucket of a loan for a distribution, with its label function"""
+    if by == 'vintage':
+        return ExtractYear('start_date'), str
+    if by == 'interest_band':
+        bucket = Case(
+            *[When(interest_rate__gte=edge, then=Value(edge)) for edge in reversed(INTEREST_BANDS)],
+            default=Value(0),
+        )
+        upper = dict(zip([0] + INTEREST_BANDS, INTEREST_BANDS))
+        return bucket, lambda edge: f'{edge}-{upper[edge]}' if edge in upper else f'{edge}+'
+    bucket = Coalesce(
+        Case(*[
+            When(customer__stored_score__score__range=(low, high), then=Value(low))
+            for low, high in SCORE_BANDS
+        ]),
+        Value(UNSCORED),
+    )
+    bands = dict(SCORE_BANDS)
+    return bucket, lambda low: f'{low}-{bands[low]}' if low in bands else 'unscored'
+
+
+def compute_distribution(by):
+    """
+    Loans grouped by vintage year, interest band or the customer's stored
+    score band, with each bucket's share of the exposure and the cumulative
+    share up to it, both computed with window functions over the grouped rows
+    """
+    bucket, label = _bucket_expression(by)
+    grouped = Loan.objects.annotate(bucket=bucket).values('bucket').annotate(
+        loans=Count('loan_id'),
+        active_loans=Count('loan_id', filter=_active()),
+        total_amount=Sum('loan_amount'),
+        exposure=Sum('outstanding_principal'),
+        monthly_emi=Sum('monthly_repayment', filter=_active()),
+    ).order_by()
+
+    # Django cannot window over aggregates, so the window functions run in
+    # an outer query over the grouped one
+    connection = connections[grouped.db]
+    sql, params = grouped.query.get_compiler(connection=connection).as_sql()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT buckets.bucket, buckets.loans, buckets.active_loans, buckets.total_amount, '
+            f'buckets.exposure, buckets.monthly_emi, '
+            f'SUM(buckets.exposure) OVER () AS total_exposure, '
+            f'SUM(buckets.exposure) OVER ('
+            f'ORDER BY buckets.bucket ROWS BETWEEN UNBOUNDED PRECEDING AND CURRENT ROW'
+            f') AS cumulative_exposure '
+            f'FROM ({sql}) AS buckets ORDER BY buckets.bucket',
+            params,
+        )
+        rows = cursor.fetchall()
+
+    return {
+        'by': by,
+        'buckets': [
+            {
+                'bucket': label(bucket),
+                'loans': loans,
+                'active_loans': active_loans,
+                'loan_amount': _amount(total_amount),
+                'outstanding_principal': _amount(exposure),
+                'monthly_emi': _amount(monthly_emi),
+                'exposure_share': _ratio(exposure or 0, total),
+                'cumulative_share': _ratio(cumulative or 0, total),
+            }
+            for bucket, loans, active_loans, total_amount, exposure, monthly_emi, total, cumulative in rows
+        ],
+        'generated_at': timezone.now().isoformat(),
+    }
+
+
+def _cached(key, compute):
+    result = cache.get(key)
+    if result is None:
+        result = _refresh(key, compute)
+    return result
+
+
+def _refresh(key, compute):
+    with read_from(replica_alias()):
+        result = compute()
+    cache.set(key, result, settings.PORTFOLIO_CACHE_TTL)
+    return result
+
+
+def get_portfolio_summary():
+    return _cached(SUMMARY_KEY, compute_summary)
+
+
+def get_portfolio_distribution(by):
+    return _cached(DISTRIBUTION_KEY.format(by=by), lambda: compute_distribution(by))
+
+
+def refresh_portfolio_cache():
+    """Recompute and cache the summary and every distribution"""
+    _refresh(SUMMARY_KEY, compute_summary)
+    for by in DISTRIBUTIONS:
+        _refresh(DISTRIBUTION_KEY.format(by=by), lambda: compute_distribution(by))
@@ -0,0 +1,133 @@
+from collections import defaultdict
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import Sum, Count
+from django.db.models.functions import ExtractYear
+from .models import Customer, Loan, CustomerCreditProfile
+
+
+# Places each loan's on-time ratio is rounded to. Adding and removing the
+# same rounded Decimals is exact, so the running sum does not drift however
+# many times loans are edited or deleted.
+ON_TIME_RATIO_QUANTUM = Decimal('1e-10')
+
+
+def on_time_ratio(emis_paid_on_time, tenure):
+    """Share of a loan's EMIs paid on time, capped at 1 and rounded for the profile"""
+    if tenure <= 0:
+        return Decimal('0')
+    return (Decimal(min(emis_paid_on_time, tenure)) / Decimal(tenure)).quantize(ON_TIME_RATIO_QUANTUM)
+
+
+def loan_contribution(loan):
+    """
+    Return the share a single loan adds to its customer's credit profile:
+    (loan_amount, monthly_repayment, on_time_ratio, activity_years)
+    """
+    start_date = Loan._meta.get_field('start_date').to_python(loan.start_date)
+    end_date = Loan._meta.get_field('end_date').to_python(loan.end_date)
+
+    return (
+        Decimal(str(loan.loan_amount)),
+        Decimal(str(loan.monthly_repayment)),
+        on_time_ratio(int(loan.emis_paid_on_time), int(loan.tenure)),
+        {start_date.year, end_date.year},
+    )
+
+
+def apply_loan_change(customer_id, removed=None, added=None, create_missing=True):
+    """
+    Incrementally update a customer's credit profile with the contribution
+    of a removed and/or added loan state
+    """
+    with transaction.atomic():
+        profile = CustomerCreditProfile.objects.select_for_update().filter(
+            customer_id=customer_id
+        ).first()
+
+        if profile is None:
+            # No running totals to adjust yet, derive them from the loans table
+            if create_missing:
+                return rebuild_credit_profiles([customer_id])[0]
+            return None
+
+        activity = dict(profile.activity_by_year)
+        for sign, contribution in ((-1, removed), (1, added)):
+            if contribution is None:
+                continue
+            amount, repayment, on_time_ratio, years = contribution
+            profile.loan_count += sign
+            profile.total_loan_amount += sign * amount
+            profile.total_monthly_repayment += sign * repayment
+            profile.on_time_ratio_sum += sign * on_time_ratio
+            for year in years:
+                key = str(year)
+                activity[key] = activity.get(key, 0) + sign
+                if activity[key] <= 0:
+                    del activity[key]
+
+        profile.activity_by_year = activity
+        profile.save()
+        return profile
+
+
+def rebuild_credit_profiles(customer_ids=None):
+    """
+    Recompute credit profiles from the loans table for the given customers
+    (or every customer) and return the saved profiles
+    """
+    customers = Customer.objects.all()
+    if customer_ids is not None:
+        customers = customers.filter(customer_id__in=customer_ids)
+    customer_ids = list(customers.values_list('customer_id', flat=True))
+
+    loans = Loan.objects.filter(customer_id__in=customer_ids)
+
+    totals = {
+        row['customer_id']: row
+        for row in loans.values('customer_id').annotate(
+            loan_count=Count('loan_id'),
+            total_loan_amount=Sum('loan_amount'),
+            total_monthly_repayment=Sum('monthly_repayment'),
+        ).order_by()
+    }
+
+    # Summed from the same rounded ratios the signals add and remove, one
+    # per distinct (emis_paid_on_time, tenure) pair
+    on_time = defaultdict(Decimal)
+    ratio_rows = loans.values('customer_id', 'emis_paid_on_time', 'tenure').annotate(n=Count('loan_id')).order_by()
+    for row in ratio_rows:
+        on_time[row['customer_id']] += row['n'] * on_time_ratio(row['emis_paid_on_time'], row['tenure'])
+
+    # A loan counts once towards each distinct year it starts or ends in
+    activity = defaultdict(lambda: defaultdict(int))
+    year_rows = loans.annotate(
+        start_year=ExtractYear('start_date'),
+        end_year=ExtractYear('end_date'),
+    ).values('customer_id', 'start_year', 'end_year').annotate(n=Count('loan_id')).order_by()
+    for row in year_rows:
+        for year in {row['start_year'], row['end_year']}:
+            activity[row['customer_id']][str(year)] += row['n']
+
+    profiles = []
+    for customer_id in customer_ids:
+        row = totals.get(customer_id, {})
+        profiles.append(CustomerCreditProfile(
+            customer_id=customer_id,
+            loan_count=row.get('loan_count', 0),
+            total_loan_amount=row.get('total_loan_amount') or Decimal('0'),
+            total_monthly_repayment=row.get('total_monthly_repayment') or Decimal('0'),
+            on_time_ratio_sum=on_time.get(customer_id, Decimal('0')),
+            activity_by_year=dict(activity.get(customer_id, {})),
+        ))
+
+    CustomerCreditProfile.objects.bulk_create(
+        profiles,
+        update_conflicts=True,
+        unique_fields=['customer'],
+        update_fields=[
+            'loan_count', 'total_loan_amount', 'total_monthly_repayment',
+            'on_time_ratio_sum', 'activity_by_year', 'updated_at',
+        ],
+    )
+    return profiles
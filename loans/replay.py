@@ -0,0 +1,436 @@
+# Traffic replay. A traffic file holds one JSON request per line:
+#
+#   {"method": "POST", "path": "/check-eligibility", "body": {...},
+#    "headers": {"If-None-Match": "..."}, "at": 12.5, "name": "...",
+#    "expect": {"status": 200, "body": {...}, "ignore": ["generated_at"]}}
+#
+# Only path is required. "at" is the request's offset in seconds in the
+# recorded traffic, used when replaying with the original timing; "expect"
+# holds the recorded response the replayed one is checked against.
+import asyncio
+import http.client
+import json
+import math
+import threading
+import time
+from dataclasses import dataclass, field
+from urllib.parse import urlsplit
+from django.db import connections
+from django.test import AsyncClient, Client
+from django.urls import Resolver404, resolve
+
+from .loadgen import LoadResult
+
+
+@dataclass
+class TrafficEntry:
+    line: int
+    path: str
+    method: str = 'GET'
+    body: bytes = None
+    headers: dict = field(default_factory=dict)
+    at: float = None
+    name: str = None
+    expect: dict = None
+
+    @property
+    def label(self):
+        """Name to group the entry's statistics by: its view's URL name"""
+        if self.name:
+            return self.name
+        try:
+            return resolve(urlsplit(self.path).path).url_name or self.path
+        except Resolver404:
+            return 'unmatched'
+
+
+@dataclass
+class Outcome:
+    """Replayed response of one entry; status is None when it failed to send"""
+    entry: TrafficEntry
+    status: int = None
+    body: bytes = b''
+    latency_ms: float = 0.0
+    mismatches: list = field(default_factory=list)
+
+
+def read_traffic(file):
+    """Yield the TrafficEntry of every non-blank line of a JSONL file"""
+    for line_number, line in enumerate(file, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+            body = record.get('body')
+            yield TrafficEntry(
+                line=line_number,
+                path=record['path'],
+                method=record.get('method', 'GET').upper(),
+                body=None if body is None else json.dumps(body).encode(),
+                headers=record.get('headers') or {},
+                at=record.get('at'),
+                name=record.get('name'),
+                expect=record.get('expect'),
+            )
+        except (ValueError, KeyError, TypeError, AttributeError) as exc:
+            raise ValueError(f'Line {line_number}: not a traffic record ({exc!r})')
+
+
+def _diff(expected, actual, where, ignore, mismatches):
+    if isinstance(expected, dict) and isinstance(actual, dict):
+        for key, value in expected.items():
+            if key in ignore:
+                continue
+            if key not in actual:
+                mismatches.append(f'{where}.{key}: missing')
+            else:
+                _diff(value, actual[key], f'{where}.{key}', ignore, mismatches)
+    elif isinstance(expected, list) and isinstance(actual, list):
+        if len(expected) != len(actual):
+            mismatches.append(f'{where}: {len(actual)} items, expected {len(expected)}')
+        for index, (value, other) in enumerate(zip(expected, actual)):
+            _diff(value, other, f'{where}[{index}]', ignore, mismatches)
+    elif isinstance(expected, float) or isinstance(actual, float):
+        if not (
+            isinstance(actual, (int, float)) and isinstance(expected, (int, float))
+            and math.isclose(expected, actual, rel_tol=1e-9, abs_tol=1e-9)
+        ):
+            mismatches.append(f'{where}: {actual!r}, expected {expected!r}')
+    elif expected != actual:
+        mismatches.append(f'{where}: {actual!r}, expected {expected!r}')
+
+
+def check_response(expect, status, body):
+    """
+    Differences between a response and an entry's expectation. Expected
+    body fields must match exactly (floats to 1e-9), fields named in
+    expect['ignore'] are skipped at any depth, and fields the expectation
+    does not mention are not checked.
+    """
+    mismatches = []
+    if 'status' in expect and status != expect['status']:
+        mismatches.append(f'status: {status}, expected {expect["status"]}')
+    if 'body' in expect:
+        try:
+            actual = json.loads(body)
+        except ValueError:
+            return mismatches + ['body: not JSON']
+        _diff(expect['body'], actual, 'body', set(expect.get('ignore', [])), mismatches)
+    return mismatches
+
+
+def recorded_expectation(entry, outcome):
+    """The entry as a traffic record expecting outcome's response"""
+    record = {'method': entry.method, 'path': entry.path}
+    if entry.body is not None:
+        record['body'] = json.loads(entry.body)
+    if entry.headers:
+        record['headers'] = entry.headers
+    if entry.at is not None:
+        record['at'] = entry.at
+    if entry.name:
+        record['name'] = entry.name
+    expect = {'status': outcome.status}
+    try:
+        expect['body'] = json.loads(outcome.body)
+    except ValueError:
+        pass
+    if entry.expect and entry.expect.get('ignore'):
+        expect['ignore'] = entry.expect['ignore']
+    record['expect'] = expect
+    return record
+
+
+def _headers(entry):
+    headers = dict(entry.headers)
+    if entry.body is not None:
+        headers.setdefault('Content-Type', 'application/json')
+    return headers
+
+
+def local_client():
+    """Thread sender factory calling the application in-process"""
+    def make_sender():
+        client = Client(raise_request_exception=False)
+
+        def send(entry):
+            headers = _headers(entry)
+            content_type = headers.pop('Content-Type', 'application/octet-stream')
+            response = client.generic(
+                entry.method, entry.path, entry.body or b'', content_type=content_type, headers=headers
+            )
+            content = b''.join(response) if response.streaming else response.content
+            return response.status_code, content
+
+        # Each worker thread opened its own database connections
+        return send, connections.close_all
+
+    return make_sender
+
+
+def http_client(base_url):
+    """Thread sender factory sending to a server over keep-alive connections"""
+    url = urlsplit(base_url)
+    connection_class = http.client.HTTPSConnection if url.scheme == 'https' else http.client.HTTPConnection
+
+    def make_sender():
+        connection = connection_class(url.hostname, url.port, timeout=30)
+
+        def send(entry):
+            try:
+                connection.request(
+                    entry.method, url.path.rstrip('/') + entry.path, body=entry.body, headers=_headers(entry)
+                )
+                response = connection.getresponse()
+                return response.status, response.read()
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                return None, b''
+
+        return send, connection.close
+
+    return make_sender
+
+
+def async_local_client():
+    """Asyncio sender factory calling the application in-process over ASGI"""
+    def make_sender():
+        client = AsyncClient(raise_request_exception=False)
+
+        async def send(entry):
+            headers = _headers(entry)
+            content_type = headers.pop('Content-Type', 'application/octet-stream')
+            response = await client.generic(
+                entry.method, entry.path, entry.body or b'', content_type=content_type, headers=headers
+            )
+            if response.streaming:
+                content = b''.join([chunk async for chunk in response])
+            else:
+                content = response.content
+            return response.status_code, content
+
+        async def close():
+            pass
+
+        return send, close
+
+    return make_sender
+
+
+class AsyncHTTPConnection:
+    """Minimal keep-alive HTTP/1.1 client connection on asyncio streams"""
+
+    def __init__(self, url):
+        self.url = url
+        self.reader = self.writer = None
+
+    async def request(self, method, path, body, headers):
+        if self.writer is None:
+            port = self.url.port or (443 if self.url.scheme == 'https' else 80)
+            self.reader, self.writer = await asyncio.open_connection(
+                self.url.hostname, port, ssl=self.url.scheme == 'https'
+            )
+        body = body or b''
+        lines = [f'{method} {path} HTTP/1.1', f'Host: {self.url.netloc}', f'Content-Length: {len(body)}']
+        lines += [f'{name}: {value}' for name, value in headers.items()]
+        self.writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body)
+        await self.writer.drain()
+
+        status = int((await self.reader.readline()).split()[1])
+        response_headers = {}
+        while True:
+            line = (await self.reader.readline()).decode('latin-1').strip()
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            response_headers[name.strip().lower()] = value.strip()
+
+        if response_headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await self.reader.readline()).split(b';')[0], 16)
+                if not size:
+                    await self.reader.readline()
+                    break
+                chunks.append(await self.reader.readexactly(size))
+                await self.reader.readline()
+            content = b''.join(chunks)
+        elif 'content-length' in response_headers:
+            content = await self.reader.readexactly(int(response_headers['content-length']))
+        else:
+            content = await self.reader.read()
+            response_headers['connection'] = 'close'
+
+        if response_headers.get('connection', '').lower() == 'close':
+            await self.close()
+        return status, content
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.reader = self.writer = None
+
+
+def async_http_client(base_url):
+    """Asyncio sender factory sending to a server over keep-alive connections"""
+    url = urlsplit(base_url)
+
+    def make_sender():
+        connection = AsyncHTTPConnection(url)
+
+        async def send(entry):
+            try:
+                return await connection.request(
+                    entry.method, url.path.rstrip('/') + entry.path, entry.body, _headers(entry)
+                )
+            except (OSError, ValueError, IndexError, asyncio.IncompleteReadError):
+                await connection.close()
+                return None, b''
+
+        return send, connection.close
+
+    return make_sender
+
+
+class Replay:
+    """
+    Replays traffic entries with `concurrency` senders and collects the
+    outcomes, raising ValueError for an invalid entry. With a schedule
+    (entry index, entry) -> seconds from the start, requests are sent
+    open-loop: each at its scheduled time, or as soon as a sender is free
+    when all are busy, and latency is measured from the scheduled time so
+    queueing delays are included. Without one, senders send back to back.
+    """
+
+    def __init__(self, entries, make_sender, concurrency=8, schedule=None, check=True, on_outcome=None):
+        self.entries = enumerate(entries)
+        self.make_sender = make_sender
+        self.concurrency = concurrency
+        self.schedule = schedule
+        self.check = check
+        self.on_outcome = on_outcome
+        self.results = {}
+        self.statuses = {}
+        self.mismatched = []
+        self.seconds = 0.0
+        self.error = None
+        self._lock = threading.Lock()
+
+    def _next(self):
+        """
+        Next (entry, scheduled offset or None), or None once the entries
+        are exhausted or one of them is invalid
+        """
+        with self._lock:
+            if self.error is not None:
+                return None
+            try:
+                item = next(self.entries, None)
+                if item is None:
+                    return None
+                index, entry = item
+                return entry, None if self.schedule is None else self.schedule(index, entry)
+            except ValueError as exc:
+                self.error = exc
+                return None
+
+    def _record(self, outcome):
+        entry = outcome.entry
+        if self.check and entry.expect:
+            outcome.mismatches = check_response(entry.expect, outcome.status, outcome.body)
+        with self._lock:
+            result = self.results.setdefault(entry.label, LoadResult())
+            if outcome.status is None or outcome.status >= 500:
+                result.errors += 1
+            else:
+                result.latencies.append(outcome.latency_ms)
+            self.statuses[outcome.status] = self.statuses.get(outcome.status, 0) + 1
+            if outcome.mismatches:
+                self.mismatched.append(outcome)
+            if self.on_outcome is not None:
+                self.on_outcome(outcome)
+
+    def run_threads(self):
+        started = time.perf_counter()
+
+        def worker():
+            send, close = self.make_sender()
+            try:
+                while True:
+                    item = self._next()
+                    if item is None:
+                        break
+                    entry, offset = item
+                    intended = time.perf_counter()
+                    if offset is not None:
+                        intended = started + offset
+                        delay = intended - time.perf_counter()
+                        if delay > 0:
+                            time.sleep(delay)
+                    status, body = send(entry)
+                    self._record(Outcome(entry, status, body, (time.perf_counter() - intended) * 1000))
+            finally:
+                close()
+
+        threads = [threading.Thread(target=worker) for _ in range(self.concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self._finish(started)
+
+    def run_asyncio(self):
+        asyncio.run(self._run_asyncio())
+
+    async def _run_asyncio(self):
+        started = time.perf_counter()
+        senders = asyncio.Queue()
+        for _ in range(self.concurrency):
+            senders.put_nowait(self.make_sender())
+
+        async def send(entry, intended):
+            sender = await senders.get()
+            try:
+                status, body = await sender[0](entry)
+            finally:
+                senders.put_nowait(sender)
+            self._record(Outcome(entry, status, body, (time.perf_counter() - intended) * 1000))
+
+        if self.schedule is None:
+            async def worker():
+                while True:
+                    item = self._next()
+                    if item is None:
+                        break
+                    await send(item[0], time.perf_counter())
+
+            await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+        else:
+            # Dispatch every entry at its scheduled time, keeping at most
+            # concurrency * 4 requests waiting for a sender
+            pending = set()
+            while True:
+                item = self._next()
+                if item is None:
+                    break
+                entry, offset = item
+                intended = started + offset
+                delay = intended - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                pending.add(asyncio.ensure_future(send(entry, intended)))
+                if len(pending) >= self.concurrency * 4:
+                    _, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            if pending:
+                await asyncio.gather(*pending)
+
+        while not senders.empty():
+            await senders.get_nowait()[1]()
+        self._finish(started)
+
+    def _finish(self, started):
+        self.seconds = time.perf_counter() - started
+        for result in self.results.values():
+            result.seconds = self.seconds
+        if self.error is not None:
+            raise self.error
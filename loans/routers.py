@@ -0,0 +1,111 @@
+# Read-replica routing. Reads go to the primary unless a view opts in with
+# read_from(replica_alias(customer_id)): the loan views and the eligibility
+# checks do, while create_loan's check-then-insert, signal handlers,
+# ingestion and the admin keep reading from the database they write to.
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, transaction
+
+
+PRIMARY = 'default'
+REPLICA = 'replica'
+
+STICKY_KEY = 'replica:sticky:{customer_id}'
+STICKY_ALL_KEY = 'replica:sticky:all'
+
+_read_alias = ContextVar('read_alias', default=None)
+
+
+class ReplicaRouter:
+    """
+    Send reads to the alias chosen by the enclosing read_from() block and
+    every write and migration to the primary
+    """
+
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == PRIMARY
+
+
+def replica_configured():
+    """
+    Whether a replica other than the primary itself is configured. Under
+    the test runner the replica mirrors the primary's test database.
+    """
+    if REPLICA not in settings.DATABASES:
+        return False
+    replica, primary = connections[REPLICA].settings_dict, connections[PRIMARY].settings_dict
+    return any(replica[key] != primary[key] for key in ('NAME', 'HOST', 'PORT'))
+
+
+def _sticky_keys(customer_id):
+    keys = [STICKY_ALL_KEY]
+    if customer_id is not None:
+        keys.append(STICKY_KEY.format(customer_id=customer_id))
+    return keys
+
+
+def stick_to_primary(customer_id=None):
+    """
+    Read a customer's data (everyone's when customer_id is None) from the
+    primary for the next REPLICA_STICKY_SECONDS, so a client sees its own
+    write while the replica catches up. The window restarts when the
+    surrounding transaction commits.
+    """
+    if not replica_configured():
+        return
+    key = _sticky_keys(customer_id)[-1]
+    cache.set(key, True, settings.REPLICA_STICKY_SECONDS)
+    transaction.on_commit(lambda: cache.set(key, True, settings.REPLICA_STICKY_SECONDS))
+
+
+def replica_alias(customer_id=None):
+    """
+    Database to read a customer's data from: the replica, unless none is
+    configured or the customer was written within the sticky window
+    """
+    if not replica_configured():
+        return PRIMARY
+    return PRIMARY if cache.get_many(_sticky_keys(customer_id)) else REPLICA
+
+
+async def areplica_alias(customer_id=None):
+    if not replica_configured():
+        return PRIMARY
+    return PRIMARY if await cache.aget_many(_sticky_keys(customer_id)) else REPLICA
+
+
+def replica_alias_for_customers(customer_ids):
+    """
+    replica_alias for a set of customers read together: the primary as soon
+    as any of them is within the sticky window
+    """
+    if not replica_configured():
+        return PRIMARY
+    keys = [STICKY_ALL_KEY] + [STICKY_KEY.format(customer_id=customer_id) for customer_id in customer_ids]
+    return PRIMARY if cache.get_many(keys) else REPLICA
+
+
+@contextmanager
+def read_from(alias):
+    """
+    Route the ORM reads made in this block (and in sync_to_async calls from
+    it) to alias. Querysets evaluated after the block ends, such as the
+    rows of a streamed response, need an explicit .using(alias).
+    """
+    token = _read_alias.set(alias)
+    try:
+        yield alias
+    finally:
+        _read_alias.reset(token)
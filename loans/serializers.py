@@ -1,5 +1,9 @@
 from rest_framework import serializers
-from .models import Customer, Loan
+import os
+from django.conf import settings
+from .models import Customer, Loan, IngestionJob, ScoringJob
+from .envelope import DEFAULT_INTEREST_RATES, DEFAULT_TENURES
+from .portfolio import DISTRIBUTIONS
 
 
 class CustomerSerializer(serializers.ModelSerializer):
@@ -43,6 +47,140 @@ class CreateLoanSerializer(serializers.Serializer):
     tenure = serializers.IntegerField(min_value=1)
 
 
+class EMIGridSerializer(serializers.Serializer):
+    loan_amount = serializers.DecimalField(max_digits=12, decimal_places=2, min_value=0)
+    interest_rates = serializers.ListField(
+        child=serializers.DecimalField(max_digits=5, decimal_places=2, min_value=0),
+        min_length=1, max_length=100
+    )
+    tenures = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        min_length=1, max_length=100
+    )
+
+
+class EligibilityEnvelopeQuerySerializer(serializers.Serializer):
+    interest_rates = serializers.ListField(
+        child=serializers.DecimalField(max_digits=5, decimal_places=2, min_value=0),
+        min_length=1, max_length=100, default=DEFAULT_INTEREST_RATES
+    )
+    tenures = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        min_length=1, max_length=100, default=DEFAULT_TENURES
+    )
+
+
+class LoanListQuerySerializer(serializers.Serializer):
+    cursor = serializers.CharField(required=False)
+    page_size = serializers.IntegerField(required=False, min_value=1)
+    stream = serializers.BooleanField(required=False, default=False)
+
+
+class LoanScheduleQuerySerializer(serializers.Serializer):
+    start = serializers.IntegerField(required=False, default=1, min_value=1)
+    end = serializers.IntegerField(required=False, min_value=1)
+
+    def validate(self, data):
+        if 'end' in data and data['end'] < data['start']:
+            raise serializers.ValidationError({'end': 'Must not be before start'})
+        return data
+
+
+class PortfolioDistributionQuerySerializer(serializers.Serializer):
+    by = serializers.ChoiceField(choices=DISTRIBUTIONS, default='vintage')
+
+
+class ScoringJobRequestSerializer(serializers.Serializer):
+    customer_ids = serializers.ListField(
+        child=serializers.IntegerField(), required=False, min_length=1
+    )
+    updated_since = serializers.DateTimeField(required=False)
+    chunk_size = serializers.IntegerField(
+        required=False, min_value=1, max_value=settings.SCORING_MAX_CHUNK_SIZE
+    )
+
+
+class ScoringJobSerializer(serializers.ModelSerializer):
+    job_id = serializers.IntegerField(source='pk', read_only=True)
+    progress = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ScoringJob
+        fields = [
+            'job_id', 'status', 'progress', 'total_customers', 'scored_customers',
+            'total_chunks', 'completed_chunks', 'customer_ids', 'updated_since', 'chunk_size',
+            'error', 'created_at', 'started_at', 'finished_at'
+        ]
+
+    def get_progress(self, obj):
+        if obj.status == ScoringJob.COMPLETED:
+            return 1.0
+        return obj.completed_chunks / obj.total_chunks if obj.total_chunks else 0.0
+
+
+class IngestionJobRequestSerializer(serializers.Serializer):
+    customers_file = serializers.CharField(required=False, default='customer_data.xlsx')
+    loans_file = serializers.CharField(required=False, default='loan_data.xlsx')
+    upsert = serializers.BooleanField(required=False, default=False)
+    recompute_emi = serializers.BooleanField(required=False, default=False)
+    force = serializers.BooleanField(required=False, default=False)
+    chunk_size = serializers.IntegerField(required=False, default=50000, min_value=1)
+
+    def _data_file(self, name):
+        """Absolute path of a file inside INGEST_DATA_DIR"""
+        data_dir = os.path.realpath(settings.INGEST_DATA_DIR)
+        path = os.path.realpath(os.path.join(data_dir, name))
+        if os.path.commonpath([data_dir, path]) != data_dir:
+            raise serializers.ValidationError('Files must be inside the data directory')
+        if not os.path.isfile(path):
+            raise serializers.ValidationError(f'File not found: {name}')
+        return path
+
+    def validate_customers_file(self, value):
+        return self._data_file(value)
+
+    def validate_loans_file(self, value):
+        return self._data_file(value)
+
+
+class IngestionJobSerializer(serializers.ModelSerializer):
+    job_id = serializers.IntegerField(source='pk', read_only=True)
+    customers_file = serializers.SerializerMethodField()
+    loans_file = serializers.SerializerMethodField()
+    progress = serializers.SerializerMethodField()
+    rows_done = serializers.IntegerField(read_only=True)
+    total_rows = serializers.IntegerField(read_only=True)
+    rows_per_second = serializers.SerializerMethodField()
+    eta_seconds = serializers.SerializerMethodField()
+
+    class Meta:
+        model = IngestionJob
+        fields = [
+            'job_id', 'status', 'progress', 'rows_done', 'total_rows', 'rows_per_second',
+            'eta_seconds', 'customers_file', 'customers_done', 'customers_total',
+            'loans_file', 'loans_done', 'loans_total', 'rows_created', 'rows_updated',
+            'rows_skipped', 'warnings', 'error', 'created_at', 'started_at', 'finished_at'
+        ]
+
+    def get_customers_file(self, obj):
+        return os.path.basename(obj.customers_file)
+
+    def get_loans_file(self, obj):
+        return os.path.basename(obj.loans_file)
+
+    def get_progress(self, obj):
+        if obj.status == IngestionJob.COMPLETED:
+            return 1.0
+        return obj.rows_done / obj.total_rows if obj.total_rows else 0.0
+
+    def get_rows_per_second(self, obj):
+        return round(obj.rows_per_second, 1)
+
+    def get_eta_seconds(self, obj):
+        eta = obj.eta_seconds
+        return None if eta is None else round(eta, 1)
+
+
 class LoanSerializer(serializers.ModelSerializer):
     customer = CustomerDetailSerializer(read_only=True)
     monthly_installment = serializers.DecimalField(source='monthly_repayment', max_digits=12, decimal_places=2, read_only=True)
@@ -59,3 +197,50 @@ class LoanListSerializer(serializers.ModelSerializer):
     class Meta:
         model = Loan
         fields = ['loan_id', 'loan_amount', 'interest_rate', 'monthly_installment', 'repayments_left']
+
+
+# Fast path for the read endpoints: build the serializers' output straight
+# from .values() rows, skipping per-field serializer overhead. Decimals are
+# rendered like DRF's DecimalField, as fixed-point strings.
+
+LOAN_DETAIL_VALUES = [
+    'loan_id', 'loan_amount', 'interest_rate', 'monthly_repayment', 'tenure',
+    'customer__customer_id', 'customer__first_name', 'customer__last_name',
+    'customer__phone_number', 'customer__age',
+]
+
+
+def loan_detail_row(values):
+    """
+    LoanSerializer output for a row of Loan.objects.values(*LOAN_DETAIL_VALUES)
+    """
+    return {
+        'loan_id': values['loan_id'],
+        'customer': {
+            'id': values['customer__customer_id'],
+            'first_name': values['customer__first_name'],
+            'last_name': values['customer__last_name'],
+            'phone_number': values['customer__phone_number'],
+            'age': values['customer__age'],
+        },
+        'loan_amount': f"{values['loan_amount']:f}",
+        'interest_rate': f"{values['interest_rate']:f}",
+        'monthly_installment': f"{values['monthly_repayment']:f}",
+        'tenure': values['tenure'],
+    }
+
+
+LOAN_LIST_VALUES = ['loan_id', 'loan_amount', 'interest_rate', 'monthly_repayment', 'tenure', 'emis_paid_on_time']
+
+
+def loan_list_row(values):
+    """
+    LoanListSerializer output for a row of Loan.objects.values(*LOAN_LIST_VALUES)
+    """
+    return {
+        'loan_id': values['loan_id'],
+        'loan_amount': f"{values['loan_amount']:f}",
+        'interest_rate': f"{values['interest_rate']:f}",
+        'monthly_installment': f"{values['monthly_repayment']:f}",
+        'repayments_left': max(0, values['tenure'] - values['emis_paid_on_time']),
+    }
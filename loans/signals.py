@@ -0,0 +1,90 @@
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from .cache import bump_customer_version, forget_loan_owner, remember_loan_owner
+from .models import Customer, Loan, CustomerCreditProfile
+from .profiles import loan_contribution, apply_loan_change
+
+
+def _refresh_cached_profile(loan, profile):
+    """
+    Keep the profile cached on the loan's in-memory customer in step with
+    the database so later scoring on that instance sees the new totals
+    """
+    if profile is not None and Loan.customer.is_cached(loan):
+        Customer.credit_profile.related.set_cached_value(loan.customer, profile)
+
+
+@receiver(post_save, sender=Customer)
+def create_credit_profile(sender, instance, created, raw=False, **kwargs):
+    """
+    Start every new customer with an empty credit profile
+    """
+    if created and not raw:
+        CustomerCreditProfile.objects.get_or_create(customer_id=instance.customer_id)
+
+
+@receiver(post_save, sender=Customer)
+@receiver(post_delete, sender=Customer)
+def invalidate_customer_credit_cache(sender, instance, **kwargs):
+    """
+    Salary and approved limit feed the score, so any customer change
+    invalidates the cached credit data
+    """
+    bump_customer_version(instance.customer_id)
+
+
+@receiver(pre_save, sender=Loan)
+def remember_previous_loan_state(sender, instance, raw=False, **kwargs):
+    """
+    Capture the stored state of an edited loan so its old contribution
+    can be removed from the credit profile after saving
+    """
+    instance._previous_profile_state = None
+    if raw or instance._state.adding or instance.pk is None:
+        return
+
+    previous = Loan.objects.filter(pk=instance.pk).first()
+    if previous is not None:
+        instance._previous_profile_state = (previous.customer_id, loan_contribution(previous))
+
+
+@receiver(post_save, sender=Loan)
+def update_credit_profile_on_save(sender, instance, created, raw=False, **kwargs):
+    """
+    Apply a created or edited loan to its customer's credit profile
+    """
+    if raw:
+        return
+
+    previous = getattr(instance, '_previous_profile_state', None)
+    added = loan_contribution(instance)
+
+    if previous is None:
+        profile = apply_loan_change(instance.customer_id, added=added)
+    elif previous[0] == instance.customer_id:
+        profile = apply_loan_change(instance.customer_id, removed=previous[1], added=added)
+    else:
+        # The loan moved to another customer
+        apply_loan_change(previous[0], removed=previous[1])
+        bump_customer_version(previous[0])
+        profile = apply_loan_change(instance.customer_id, added=added)
+
+    _refresh_cached_profile(instance, profile)
+    bump_customer_version(instance.customer_id)
+    # Knowing the owner lets /view-loan keep the customer's reads on the
+    # primary right after the write, and send an ETag from the first request
+    remember_loan_owner(instance.loan_id, instance.customer_id)
+
+
+@receiver(post_delete, sender=Loan)
+def update_credit_profile_on_delete(sender, instance, **kwargs):
+    """
+    Remove a deleted loan from its customer's credit profile
+    """
+    profile = apply_loan_change(
+        instance.customer_id, removed=loan_contribution(instance), create_missing=False
+    )
+    _refresh_cached_profile(instance, profile)
+    bump_customer_version(instance.customer_id)
+    forget_loan_owner(instance.loan_id)
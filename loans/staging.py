@@ -0,0 +1,100 @@
+import hashlib
+import os
+from pandas.api.types import is_integer_dtype
+
+try:
+    import pyarrow as pa
+except ImportError:  # pragma: no cover - staging is optional
+    pa = None
+
+
+ARROW_SUFFIX = '.arrow'
+
+
+def staging_available():
+    return pa is not None
+
+
+def file_digest(file_path, block_size=1 << 20):
+    """SHA-256 of a file's contents"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def is_staged(file_path):
+    return file_path.endswith(ARROW_SUFFIX)
+
+
+class StagingCache:
+    """
+    Columnar copies of source spreadsheets stored as Arrow IPC files named
+    by the SHA-256 of the source, so each workbook is parsed once and later
+    runs memory-map the converted columns instead
+    """
+
+    def __init__(self, cache_dir):
+        if pa is None:
+            raise RuntimeError('pyarrow is required for the ingestion staging cache')
+        self.cache_dir = cache_dir
+
+    def path_for(self, digest):
+        return os.path.join(self.cache_dir, f'{digest}{ARROW_SUFFIX}')
+
+    def stage(self, file_path, read_frames, digest=None, chunk_size=50000):
+        """
+        Return the Arrow file holding file_path's rows, converting it with
+        read_frames(file_path, chunk_size) when it is not cached yet.
+        Returns (arrow_path, converted).
+        """
+        digest = digest or file_digest(file_path)
+        arrow_path = self.path_for(digest)
+        if os.path.exists(arrow_path):
+            return arrow_path, False
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        partial_path = f'{arrow_path}.{os.getpid()}.partial'
+        writer = None
+        try:
+            for frame in read_frames(file_path, chunk_size):
+                # Spreadsheet cells holding whole numbers come back as ints, so a
+                # chunk may infer int64 where another infers float64. Stage every
+                # numeric column as float64 to keep one schema across chunks.
+                frame = frame.astype({
+                    name: 'float64' for name, dtype in frame.dtypes.items()
+                    if is_integer_dtype(dtype)
+                })
+                table = pa.Table.from_pandas(frame, preserve_index=False)
+                if writer is None:
+                    schema = table.schema
+                    writer = pa.ipc.new_file(partial_path, schema)
+                writer.write_table(table.cast(schema))
+            if writer is None:
+                raise ValueError(f'No rows found in {file_path}')
+        finally:
+            if writer is not None:
+                writer.close()
+
+        # Publish atomically so concurrent runs never read a partial file
+        os.replace(partial_path, arrow_path)
+        return arrow_path, True
+
+
+def count_staged_rows(arrow_path):
+    with pa.memory_map(arrow_path) as source:
+        return pa.ipc.open_file(source).read_all().num_rows
+
+
+def read_staged_frames(arrow_path, chunk_size, start=0, stop=None):
+    """
+    Yield rows [start, stop) of a staged Arrow file as DataFrames. The file
+    is memory-mapped, so slicing is zero-copy and only the requested rows
+    are materialized.
+    """
+    with pa.memory_map(arrow_path) as source:
+        table = pa.ipc.open_file(source).read_all()
+        stop = table.num_rows if stop is None else min(stop, table.num_rows)
+        for offset in range(start, stop, chunk_size):
+            yield table.slice(offset, min(chunk_size, stop - offset)).to_pandas()
@@ -0,0 +1,111 @@
+from datetime import date
+from decimal import Decimal
+import numpy as np
+import pandas as pd
+from django.db.models import Max
+
+from .ingestion import Ingestor
+from .models import Customer, Loan
+from .amortization import outstanding_principal_cents
+from .utils import monthly_installment_cents
+
+
+FIRST_NAMES = ['Aarav', 'Vivaan', 'Aditya', 'Ananya', 'Diya', 'Ishaan', 'Kavya', 'Rohan', 'Saanvi', 'Arjun']
+LAST_NAMES = ['Sharma', 'Verma', 'Iyer', 'Reddy', 'Patel', 'Gupta', 'Nair', 'Singh', 'Das', 'Mehta']
+TENURES = np.array([6, 12, 18, 24, 36, 48, 60, 72, 84, 120, 180, 240])
+
+# Generated phone numbers are the customer ID offset into a block no real
+# ten-digit mobile number starts with
+PHONE_OFFSET = 5_000_000_000
+
+
+def _decimals(values, exponent=0):
+    return [Decimal(int(value)).scaleb(exponent) for value in values]
+
+
+def synthetic_customers(count, rng, start_id=1):
+    """
+    Return `count` generated customers as a frame of Customer field values
+    """
+    customer_ids = np.arange(start_id, start_id + count)
+    salaries = rng.integers(200, 3000, count) * 100
+    approved_limits = np.round(salaries * 36 / 100000) * 100000
+
+    return pd.DataFrame({
+        'customer_id': customer_ids,
+        'first_name': rng.choice(FIRST_NAMES, count),
+        'last_name': rng.choice(LAST_NAMES, count),
+        'age': rng.integers(21, 65, count),
+        'phone_number': customer_ids + PHONE_OFFSET,
+        'monthly_salary': _decimals(salaries),
+        'approved_limit': _decimals(approved_limits),
+        'current_debt': Decimal('0'),
+    })
+
+
+def synthetic_loans(count, customer_ids, rng, start_id=1, today=None):
+    """
+    Return `count` generated loans of the given customers as a frame of
+    Loan field values. Start dates are spread over the last eight years, so
+    a realistic share of loans falls in the current year.
+    """
+    today = np.datetime64(today or date.today(), 'D')
+    amounts = rng.integers(500, 50000, count) * 100
+    rates = rng.integers(600, 1800, count)
+    tenures = rng.choice(TENURES, count)
+    start_dates = today - rng.integers(0, 8 * 365, count).astype('timedelta64[D]')
+    end_dates = start_dates + (tenures * 30).astype('timedelta64[D]')
+
+    # EMIs paid on time never exceed the EMIs due so far
+    months_elapsed = ((today - start_dates).astype(np.int64) // 30).clip(0, tenures)
+    paid_on_time = (months_elapsed * rng.uniform(0.6, 1.0, count)).astype(np.int64)
+    installments = monthly_installment_cents(amounts, rates / 100, tenures)
+
+    return pd.DataFrame({
+        'loan_id': np.arange(start_id, start_id + count),
+        'customer_id': rng.choice(np.asarray(customer_ids), count),
+        'loan_amount': _decimals(amounts),
+        'tenure': tenures,
+        'interest_rate': _decimals(rates, -2),
+        'monthly_repayment': _decimals(installments, -2),
+        'emis_paid_on_time': paid_on_time,
+        'start_date': start_dates.astype(object),
+        'end_date': end_dates.astype(object),
+        'outstanding_principal': _decimals(outstanding_principal_cents(
+            amounts, rates / 100, installments / 100, tenures, paid_on_time
+        ), -2),
+    })
+
+
+def load_synthetic_data(customers, loans, seed=0, chunk_size=100000, batch_size=5000):
+    """
+    Add `customers` generated customers and `loans` generated loans spread
+    over them (or over the stored customers when `customers` is 0),
+    numbered after the highest stored IDs, then rebuild the affected credit
+    profiles. The same seed on the same starting IDs yields the same rows.
+    """
+    rng = np.random.default_rng(seed)
+    ingestor = Ingestor(batch_size=batch_size, chunk_size=chunk_size)
+
+    next_customer_id = (Customer.objects.aggregate(Max('customer_id'))['customer_id__max'] or 0) + 1
+    next_loan_id = (Loan.objects.aggregate(Max('loan_id'))['loan_id__max'] or 0) + 1
+    customer_ids = np.arange(next_customer_id, next_customer_id + customers)
+    if not customers:
+        # Spread the new loans over the stored customers instead, in a
+        # fixed order so the seed alone decides who gets which loan
+        customer_ids = np.fromiter(
+            Customer.objects.order_by('customer_id').values_list('customer_id', flat=True), dtype=np.int64
+        )
+    if loans and not len(customer_ids):
+        raise ValueError('Cannot generate loans without customers')
+
+    for start in range(0, customers, chunk_size):
+        size = min(chunk_size, customers - start)
+        ingestor.insert_frame(Customer, synthetic_customers(size, rng, next_customer_id + start))
+
+    for start in range(0, loans, chunk_size):
+        size = min(chunk_size, loans - start)
+        ingestor.insert_frame(Loan, synthetic_loans(size, customer_ids, rng, next_loan_id + start))
+
+    ingestor.finish()
+    return customers, loans
@@ -0,0 +1,161 @@
+from datetime import datetime
+from celery import chord, shared_task
+from django.db.models import F
+from django.utils import timezone
+
+from .idempotency import purge_expired_keys
+from .ingestion import claim_ingestion_job, run_ingestion
+from .portfolio import refresh_portfolio_cache
+from .models import Customer, CustomerCreditProfile, CustomerScore, IngestionJob, ScoringJob
+from .routers import read_from, replica_alias
+from .utils import aggregates_from_profile, aggregate_loans_for_customers, calculate_credit_score
+
+
+def scoring_job_customers(job):
+    """Customers selected by a scoring job's filters"""
+    customers = Customer.objects.all()
+    if job.customer_ids:
+        customers = customers.filter(customer_id__in=job.customer_ids)
+    if job.updated_since is not None:
+        customers = customers.filter(credit_profile__updated_at__gte=job.updated_since)
+    return customers
+
+
+def chunk_bounds(customer_ids, chunk_size):
+    """
+    Split ordered customer IDs into (first_id, last_id) ranges of at most
+    chunk_size customers, returning (bounds, number of customers). Chunks
+    are sent to workers as ranges so task messages stay small.
+    """
+    bounds = []
+    first = last = None
+    count = total = 0
+    for customer_id in customer_ids:
+        if first is None:
+            first = customer_id
+        last = customer_id
+        count += 1
+        total += 1
+        if count == chunk_size:
+            bounds.append((first, last))
+            first, count = None, 0
+    if first is not None:
+        bounds.append((first, last))
+    return bounds, total
+
+
+def score_customers(customers, year=None):
+    """
+    Return {customer_id: credit score} for customers loaded with
+    select_related('credit_profile'), scored like calculate_credit_score
+    but without going through the per-request credit cache
+    """
+    if year is None:
+        year = datetime.now().year
+
+    scores = {}
+    missing_profiles = {}
+    for customer in customers:
+        try:
+            aggregates = aggregates_from_profile(customer.credit_profile, year)
+        except CustomerCreditProfile.DoesNotExist:
+            missing_profiles[customer.customer_id] = customer
+            continue
+        scores[customer.customer_id] = calculate_credit_score(customer, aggregates)
+
+    if missing_profiles:
+        for customer_id, aggregates in aggregate_loans_for_customers(list(missing_profiles), year).items():
+            scores[customer_id] = calculate_credit_score(missing_profiles[customer_id], aggregates)
+    return scores
+
+
+@shared_task
+def run_scoring_job(job_id):
+    """
+    Split a scoring job into chunks scored in parallel, followed by
+    finish_scoring_job once every chunk is done
+    """
+    job = ScoringJob.objects.get(pk=job_id)
+    with read_from(replica_alias()):
+        customer_ids = scoring_job_customers(job).order_by('customer_id').values_list(
+            'customer_id', flat=True
+        ).iterator(chunk_size=10000)
+        bounds, total = chunk_bounds(customer_ids, job.chunk_size)
+
+    ScoringJob.objects.filter(pk=job_id).update(
+        status=ScoringJob.RUNNING, started_at=timezone.now(),
+        total_customers=total, total_chunks=len(bounds)
+    )
+    if not bounds:
+        finish_scoring_job(job_id)
+        return
+
+    chord(
+        score_customer_chunk.s(job_id, first_id, last_id) for first_id, last_id in bounds
+    )(finish_scoring_job.si(job_id))
+
+
+@shared_task
+def score_customer_chunk(job_id, first_id, last_id):
+    """
+    Score the job's customers with IDs in [first_id, last_id] and store
+    the scores. A failing chunk fails the whole job.
+    """
+    try:
+        job = ScoringJob.objects.get(pk=job_id)
+        with read_from(replica_alias()):
+            customers = scoring_job_customers(job).filter(
+                customer_id__range=(first_id, last_id)
+            ).select_related('credit_profile')
+            scores = score_customers(customers)
+
+        scored_at = timezone.now()
+        CustomerScore.objects.bulk_create(
+            [
+                CustomerScore(customer_id=customer_id, score=score, job_id=job_id, scored_at=scored_at)
+                for customer_id, score in scores.items()
+            ],
+            update_conflicts=True,
+            unique_fields=['customer'],
+            update_fields=['score', 'job', 'scored_at'],
+        )
+        ScoringJob.objects.filter(pk=job_id).update(
+            scored_customers=F('scored_customers') + len(scores),
+            completed_chunks=F('completed_chunks') + 1,
+        )
+    except Exception as exc:
+        ScoringJob.objects.filter(pk=job_id).update(
+            status=ScoringJob.FAILED, error=repr(exc), finished_at=timezone.now()
+        )
+        raise
+    return len(scores)
+
+
+@shared_task
+def finish_scoring_job(job_id):
+    ScoringJob.objects.filter(pk=job_id, status=ScoringJob.RUNNING).update(
+        status=ScoringJob.COMPLETED, finished_at=timezone.now()
+    )
+
+
+@shared_task
+def run_ingestion_job(job_id):
+    """
+    Load, or resume loading, an ingestion job's files unless another worker
+    is already running the job
+    """
+    if not claim_ingestion_job(job_id):
+        return
+    run_ingestion(IngestionJob.objects.get(pk=job_id))
+
+
+@shared_task
+def refresh_portfolio():
+    """Recompute the cached portfolio analytics, run by celery beat"""
+    refresh_portfolio_cache()
+
+
+@shared_task
+def purge_idempotency_keys():
+    """Delete expired Idempotency-Key responses, run by celery beat"""
+    return purge_expired_keys()
@@ -1,10 +1,61 @@
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import replace
+from unittest import mock, skipUnless
 from decimal import Decimal
-from datetime import date, timedelta
-from django.test import TestCase
+from datetime import date, datetime, timedelta
+from io import StringIO
+import numpy as np
+from django.conf import settings
+from django.core.management import CommandError, call_command
+from django.core.cache import cache
+from django.db import IntegrityError, connection
+from django.db.models import QuerySet, Sum
+from asgiref.sync import async_to_sync
+from django.test import AsyncClient, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
 from rest_framework.test import APIClient
 from rest_framework import status
-from .models import Customer, Loan
-from .utils import calculate_credit_score, calculate_monthly_installment
+from rest_framework.renderers import JSONRenderer
+from . import idempotency, metrics, renderers, routers, views
+from .ingestion import Ingestor, partition_rows, read_frames, count_rows
+from .amortization import (
+    amortization_schedules, installment_due_dates, outstanding_principal, outstanding_principal_cents
+)
+from .cache import (
+    bump_customer_version, bump_generation, get_cache_stats, get_customer_version, reset_cache_stats,
+    credit_cache_timeout, forget_loan_owner
+)
+from .envelope import get_eligibility_envelope
+from .models import (
+    Customer, Loan, CustomerCreditProfile, CustomerScore, IdempotencyKey, IngestedFile, IngestionJob, ScoringJob
+)
+from .profiles import on_time_ratio, rebuild_credit_profiles
+from .serializers import LoanSerializer, LoanListSerializer
+from .signals import remember_previous_loan_state
+from .management.commands.benchmark_api import DEFAULT_MIX
+from .tasks import purge_idempotency_keys, refresh_portfolio, run_scoring_job
+from .synthetic import load_synthetic_data, synthetic_customers, synthetic_loans
+from .utils import (
+    calculate_credit_score, calculate_monthly_installment, calculate_monthly_installments, check_loan_eligibility,
+    get_loan_aggregates, compute_credit_score, aggregate_loans, aggregates_from_profile, CreditScore, LoanAggregates
+)
+
+
+def assert_aggregates_match(test, profile_aggregates, loan_aggregates):
+    """
+    Profiles sum on-time ratios rounded to ON_TIME_RATIO_QUANTUM, the loans
+    table sums them as floats; everything else must match exactly
+    """
+    test.assertAlmostEqual(profile_aggregates.on_time_ratio_sum, loan_aggregates.on_time_ratio_sum, places=8)
+    test.assertEqual(
+        replace(profile_aggregates, on_time_ratio_sum=0.0), replace(loan_aggregates, on_time_ratio_sum=0.0)
+    )
 
 
 class CustomerModelTest(TestCase):
@@ -41,6 +92,32 @@ class RegisterAPITest(TestCase):
         self.assertIn('customer_id', response.data)
         self.assertEqual(response.data['approved_limit'], 2200000)  # 60000 * 36 rounded to nearest lakh
 
+    def test_register_duplicate_phone_number(self):
+        data = {
+            'first_name': 'Jane',
+            'last_name': 'Smith',
+            'age': 25,
+            'monthly_income': 60000,
+            'phone_number': 9876543211
+        }
+        self.client.post('/register', data, format='json')
+        response = self.client.post('/register', dict(data, first_name='Janet'), format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['error'], 'Customer with this phone number already exists')
+        self.assertEqual(Customer.objects.count(), 1)
+
+    def test_register_reraises_other_integrity_errors(self):
+        data = {
+            'first_name': 'Jane',
+            'last_name': 'Smith',
+            'age': 25,
+            'monthly_income': 60000,
+            'phone_number': 9876543211
+        }
+        with mock.patch.object(Customer.objects, 'create', side_effect=IntegrityError('CHECK constraint failed')):
+            with self.assertRaises(IntegrityError):
+                self.client.post('/register', data, format='json')
+
 
 class CreditScoreTest(TestCase):
     def setUp(self):
@@ -72,6 +149,215 @@ class CreditScoreTest(TestCase):
         score = calculate_credit_score(self.customer)
         self.assertGreater(score, 50)
 
+    def _create_loan(self, loan_amount, tenure, emis_paid_on_time, start_date, end_date):
+        return Loan.objects.create(
+            customer=self.customer,
+            loan_amount=loan_amount,
+            tenure=tenure,
+            interest_rate=10,
+            monthly_repayment=1000,
+            emis_paid_on_time=emis_paid_on_time,
+            start_date=start_date,
+            end_date=end_date
+        )
+
+    def test_credit_score_breakdown(self):
+        old_start = date(2015, 1, 1)
+        old_end = date(2016, 1, 1)
+        self._create_loan(600000, 12, 12, old_start, old_end)
+        self._create_loan(600000, 12, 6, old_start, old_end)
+        self._create_loan(300000, 12, 24, date.today(), date.today() + timedelta(days=365))
+
+        breakdown = compute_credit_score(self.customer, get_loan_aggregates(self.customer))
+        # on-time ratios 1 + 0.5 + 1 (capped), 3 loans, 1 current-year loan, 83% utilization
+        self.assertAlmostEqual(breakdown.past_loans_points, 2.5 / 3 * 40)
+        self.assertEqual(breakdown.loan_count_points, 20)
+        self.assertEqual(breakdown.current_year_points, 5)
+        self.assertEqual(breakdown.approved_volume_points, 10)
+        self.assertEqual(breakdown.score, 68)
+        self.assertEqual(calculate_credit_score(self.customer), 68)
+
+    def test_credit_score_over_approved_limit(self):
+        self._create_loan(2000000, 12, 12, date(2015, 1, 1), date(2016, 1, 1))
+        breakdown = compute_credit_score(self.customer, get_loan_aggregates(self.customer))
+        self.assertTrue(breakdown.over_approved_limit)
+        self.assertEqual(breakdown.score, 0)
+
+    def test_eligibility_without_profile_falls_back_to_loan_aggregate(self):
+        for _ in range(3):
+            self._create_loan(100000, 12, 6, date(2015, 1, 1), date(2016, 1, 1))
+        CustomerCreditProfile.objects.filter(customer=self.customer).delete()
+        customer = Customer.objects.get(pk=self.customer.pk)
+        with self.assertNumQueries(2):
+            # Profile lookup misses, then one aggregate over the loans
+            check_loan_eligibility(customer, Decimal('100000'), Decimal('10'), 12)
+
+    def test_eligibility_reads_profile_without_scanning_loans(self):
+        for _ in range(3):
+            self._create_loan(100000, 12, 6, date(2015, 1, 1), date(2016, 1, 1))
+        customer = Customer.objects.select_related('credit_profile').get(pk=self.customer.pk)
+        with self.assertNumQueries(0):
+            check_loan_eligibility(customer, Decimal('100000'), Decimal('10'), 12)
+
+
+class CreditProfileTest(TestCase):
+    def setUp(self):
+        self.customer = Customer.objects.create(
+            first_name='Test',
+            last_name='User',
+            age=30,
+            phone_number=1234567890,
+            monthly_salary=50000,
+            approved_limit=1800000,
+            current_debt=0
+        )
+
+    def _create_loan(self, **overrides):
+        fields = {
+            'customer': self.customer,
+            'loan_amount': 100000,
+            'tenure': 12,
+            'interest_rate': 10,
+            'monthly_repayment': 8792,
+            'emis_paid_on_time': 6,
+            'start_date': date(2023, 3, 1),
+            'end_date': date(2024, 3, 1),
+        }
+        fields.update(overrides)
+        return Loan.objects.create(**fields)
+
+    def _assert_profile_matches_loans(self):
+        profile = CustomerCreditProfile.objects.get(customer=self.customer)
+        for year in (2022, 2023, 2024, 2025):
+            assert_aggregates_match(
+                self, aggregates_from_profile(profile, year), aggregate_loans(self.customer, year)
+            )
+
+    def test_profile_created_with_customer(self):
+        profile = CustomerCreditProfile.objects.get(customer=self.customer)
+        self.assertEqual(profile.loan_count, 0)
+        self.assertEqual(profile.activity_by_year, {})
+
+    def test_profile_tracks_loan_changes(self):
+        loan = self._create_loan()
+        self._create_loan(loan_amount=50000, emis_paid_on_time=12, start_date=date(2024, 6, 1),
+                          end_date=date(2025, 6, 1))
+        self._assert_profile_matches_loans()
+
+        loan.emis_paid_on_time = 12
+        loan.start_date = date(2022, 1, 1)
+        loan.save()
+        self._assert_profile_matches_loans()
+
+        loan.delete()
+        self._assert_profile_matches_loans()
+
+    def test_rebuild_command(self):
+        self._create_loan()
+        self._create_loan(tenure=24, emis_paid_on_time=30)
+        CustomerCreditProfile.objects.all().delete()
+        call_command('rebuild_credit_profiles', stdout=StringIO())
+        self._assert_profile_matches_loans()
+
+    def test_on_time_ratio_sum_does_not_drift(self):
+        loan = self._create_loan(emis_paid_on_time=4)
+        self._create_loan(tenure=9, emis_paid_on_time=7)
+        for emis_paid_on_time in [1, 5, 11, 3, 7] * 20:
+            loan.emis_paid_on_time = emis_paid_on_time
+            loan.save()
+        loan.delete()
+
+        profile = CustomerCreditProfile.objects.get(customer=self.customer)
+        self.assertEqual(profile.on_time_ratio_sum, on_time_ratio(7, 9))
+        self.assertEqual(rebuild_credit_profiles([self.customer.customer_id])[0].on_time_ratio_sum, on_time_ratio(7, 9))
+
+    def test_new_loan_skips_previous_state_lookup(self):
+        loan = Loan(customer=self.customer, loan_amount=100000, tenure=12, interest_rate=10,
+                    monthly_repayment=8792, emis_paid_on_time=6,
+                    start_date=date(2023, 3, 1), end_date=date(2024, 3, 1))
+        with self.assertNumQueries(0):
+            remember_previous_loan_state(Loan, loan)
+        self.assertIsNone(loan._previous_profile_state)
+
+
+class CreditCacheTest(TestCase):
+    def setUp(self):
+        self.customer = Customer.objects.create(
+            first_name='Test',
+            last_name='User',
+            age=30,
+            phone_number=1234567890,
+            monthly_salary=50000,
+            approved_limit=1800000,
+            current_debt=0
+        )
+        reset_cache_stats()
+
+    def _fresh_customer(self):
+        return Customer.objects.select_related('credit_profile').get(pk=self.customer.pk)
+
+    def test_repeated_scoring_hits_cache(self):
+        calculate_credit_score(self._fresh_customer())
+        customer = self._fresh_customer()
+        with self.assertNumQueries(0):
+            check_loan_eligibility(customer, Decimal('100000'), Decimal('10'), 12)
+            check_loan_eligibility(customer, Decimal('200000'), Decimal('12'), 24)
+        stats = get_cache_stats()
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['hits'], 2)
+
+    def test_loan_changes_invalidate_cache(self):
+        self.assertEqual(calculate_credit_score(self._fresh_customer()), 50)
+        loan = Loan.objects.create(
+            customer=self.customer,
+            loan_amount=2000000,
+            tenure=12,
+            interest_rate=10,
+            monthly_repayment=8792,
+            emis_paid_on_time=12,
+            start_date=date(2015, 1, 1),
+            end_date=date(2016, 1, 1)
+        )
+        self.assertEqual(calculate_credit_score(self._fresh_customer()), 0)
+
+        loan.loan_amount = 100000
+        loan.save()
+        self.assertGreater(calculate_credit_score(self._fresh_customer()), 0)
+
+        loan.delete()
+        self.assertEqual(calculate_credit_score(self._fresh_customer()), 50)
+        self.assertEqual(get_cache_stats()['hits'], 0)
+
+    def test_customer_changes_invalidate_cache(self):
+        Loan.objects.create(
+            customer=self.customer,
+            loan_amount=1000000,
+            tenure=12,
+            interest_rate=10,
+            monthly_repayment=8792,
+            emis_paid_on_time=12,
+            start_date=date(2015, 1, 1),
+            end_date=date(2016, 1, 1)
+        )
+        self.assertGreater(calculate_credit_score(self._fresh_customer()), 0)
+        self.customer.approved_limit = 500000
+        self.customer.save()
+        self.assertEqual(calculate_credit_score(self._fresh_customer()), 0)
+
+    @override_settings(CACHE_VERSION_TTL=60)
+    def test_bumped_versions_expire(self):
+        bump_customer_version(self.customer.customer_id)
+        bump_generation()
+        version = get_customer_version(self.customer.customer_id)
+        self.assertEqual(get_customer_version(self.customer.customer_id), version)
+        later = time.time() + 61
+        with mock.patch('django.core.cache.backends.locmem.time.time', return_value=later):
+            self.assertNotEqual(get_customer_version(self.customer.customer_id), version)
+
+    def test_cache_timeout_stops_at_year_end(self):
+        self.assertEqual(credit_cache_timeout(datetime(2024, 12, 31, 23, 59, 0)), 60)
+        self.assertLessEqual(credit_cache_timeout(datetime(2024, 6, 1)), 3600)
+
 
 class EMICalculationTest(TestCase):
     def test_emi_calculation(self):
@@ -83,6 +369,219 @@ class EMICalculationTest(TestCase):
         self.assertGreater(emi, 0)
         self.assertIsInstance(emi, Decimal)
 
+    def test_batch_emi_matches_decimal_path(self):
+        rng = random.Random(42)
+        loan_amounts = [Decimal(rng.randint(0, 10 ** 9)) / 100 for _ in range(5000)]
+        interest_rates = [Decimal(rng.randint(0, 3000)) / 100 for _ in range(5000)]
+        tenures = [rng.randint(0, 360) for _ in range(5000)]
+
+        installments = calculate_monthly_installments(loan_amounts, interest_rates, tenures)
+        expected = [
+            round(calculate_monthly_installment(*quote), 2)
+            for quote in zip(loan_amounts, interest_rates, tenures)
+        ]
+        self.assertEqual(installments, expected)
+
+    def test_batch_emi_edge_cases(self):
+        installments = calculate_monthly_installments(
+            [Decimal('100000'), Decimal('100000'), Decimal('0')],
+            [Decimal('0'), Decimal('10'), Decimal('10')],
+            [12, 0, 12],
+        )
+        self.assertEqual(installments, [Decimal('8333.33'), Decimal('0'), Decimal('0')])
+        # Only the batch API rounds zero-rate installments to the paisa
+        self.assertEqual(calculate_monthly_installment(100000, 0, 12), Decimal('100000') / 12)
+        self.assertEqual(installments[0], round(calculate_monthly_installment(100000, 0, 12), 2))
+
+
+class AmortizationTest(TestCase):
+    def test_schedule_repays_principal(self):
+        loan_amounts = [Decimal('100000'), Decimal('50000'), Decimal('250000')]
+        interest_rates = [Decimal('10'), Decimal('0'), Decimal('14.5')]
+        tenures = [12, 10, 240]
+        installments = calculate_monthly_installments(loan_amounts, interest_rates, tenures)
+        months = list(range(1, 241))
+
+        schedule = amortization_schedules(loan_amounts, interest_rates, installments, tenures, months)
+        self.assertEqual(schedule.principal.sum(axis=1).tolist(), [10000000, 5000000, 25000000])
+        self.assertEqual(schedule.balance[:, -1].tolist(), [0, 0, 0])
+        # Installments are the stored EMI until the last one, which clears the balance
+        self.assertEqual(set(schedule.payment[0, :11].tolist()), {879159})
+        self.assertLessEqual(abs(schedule.payment[0, 11] - 879159), 10)
+        self.assertEqual(schedule.payment[0, 12:].tolist(), [0] * 228)
+        self.assertEqual(schedule.interest[0, 0], 83333)
+        self.assertEqual(schedule.interest[1].tolist(), [0] * 240)
+
+        paid = [3, 10, 100]
+        outstanding = outstanding_principal_cents(loan_amounts, interest_rates, installments, tenures, paid)
+        self.assertEqual(
+            outstanding.tolist(), [schedule.balance[i, paid[i] - 1] for i in range(3)]
+        )
+
+    def test_due_dates(self):
+        self.assertEqual(
+            installment_due_dates(date(2024, 1, 31), [1, 2, 13]),
+            [date(2024, 2, 29), date(2024, 3, 31), date(2025, 2, 28)]
+        )
+
+    def test_loan_save_tracks_outstanding_principal(self):
+        customer = Customer.objects.create(
+            first_name='Test', last_name='User', age=30, phone_number=1234567890,
+            monthly_salary=50000, approved_limit=1800000, current_debt=0
+        )
+        loan = Loan.objects.create(
+            customer=customer, loan_amount=100000, tenure=12, interest_rate=10,
+            monthly_repayment=Decimal('8791.59'), emis_paid_on_time=0,
+            start_date=date(2024, 1, 31), end_date=date(2025, 1, 31)
+        )
+        loan.refresh_from_db()
+        self.assertEqual(loan.outstanding_principal, Decimal('100000.00'))
+
+        loan.emis_paid_on_time = 3
+        loan.save(update_fields=['emis_paid_on_time'])
+        loan.refresh_from_db()
+        self.assertEqual(loan.outstanding_principal, Decimal('75925.72'))
+
+        loan.emis_paid_on_time = 12
+        loan.save()
+        self.assertEqual(Loan.objects.aggregate(total=Sum('outstanding_principal'))['total'], 0)
+
+
+class LoanScheduleAPITest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        customer = Customer.objects.create(
+            first_name='Test', last_name='User', age=30, phone_number=1234567890,
+            monthly_salary=50000, approved_limit=1800000, current_debt=0
+        )
+        self.loan = Loan.objects.create(
+            customer=customer, loan_amount=100000, tenure=12, interest_rate=10,
+            monthly_repayment=Decimal('8791.59'), emis_paid_on_time=2,
+            start_date=date(2024, 1, 31), end_date=date(2025, 1, 31)
+        )
+
+    def test_schedule(self):
+        response = self.client.get(f'/loan-schedule/{self.loan.loan_id}')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['schedule']), 12)
+        self.assertEqual(response.data['repayments_left'], 10)
+        self.assertEqual(response.data['next_due_date'], date(2024, 4, 30))
+        self.assertEqual(response.data['outstanding_principal'], response.data['schedule'][1]['balance'])
+        self.assertEqual(response.data['schedule'][-1]['balance'], 0)
+
+    def test_range(self):
+        full = self.client.get(f'/loan-schedule/{self.loan.loan_id}').data['schedule']
+        response = self.client.get(f'/loan-schedule/{self.loan.loan_id}?start=2&end=3')
+        self.assertEqual(response.data['schedule'], full[1:3])
+        self.assertEqual([row['paid'] for row in response.data['schedule']], [True, False])
+
+        response = self.client.get(f'/loan-schedule/{self.loan.loan_id}?start=11&end=100')
+        self.assertEqual([row['installment'] for row in response.data['schedule']], [11, 12])
+
+    def test_invalid_requests(self):
+        response = self.client.get(f'/loan-schedule/{self.loan.loan_id}?start=3&end=2')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get('/loan-schedule/999999').status_code, status.HTTP_404_NOT_FOUND)
+
+
+class EMIGridAPITest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_emi_grid(self):
+        response = self.client.get('/emi-grid?loan_amount=100000&interest_rates=8,10,12&tenures=12,24')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['tenures'], [12, 24])
+        self.assertEqual(response.data['interest_rates'], [8.0, 10.0, 12.0])
+        self.assertEqual(len(response.data['monthly_installments']), 2)
+        self.assertEqual(
+            response.data['monthly_installments'][1][1],
+            float(calculate_monthly_installment(Decimal('100000'), Decimal('10'), 24))
+        )
+
+    def test_emi_grid_validation(self):
+        response = self.client.get('/emi-grid?loan_amount=100000&interest_rates=8')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('tenures', response.data)
+
+
+class EligibilityEnvelopeTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.customer = Customer.objects.create(
+            first_name='Test',
+            last_name='User',
+            age=30,
+            phone_number=1234567890,
+            monthly_salary=50000,
+            approved_limit=1800000,
+            current_debt=0
+        )
+
+    def envelope(self, query=''):
+        return self.client.get(f'/eligibility-envelope/{self.customer.customer_id}{query}')
+
+    def test_max_loan_amounts_are_exact(self):
+        response = self.envelope('?interest_rates=0,10,14.5&tenures=1,12,60')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['credit_score'], 50)
+        self.assertEqual(response.data['minimum_interest_rate'], 12.0)
+        self.assertEqual(response.data['emi_headroom'], 25000.0)
+        self.assertEqual(response.data['corrected_interest_rates'], [12.0, 12.0, 14.5])
+
+        customer = Customer.objects.select_related('credit_profile').get(pk=self.customer.pk)
+        for tenure, row in zip([1, 12, 60], response.data['max_loan_amounts']):
+            for rate, amount in zip(['0', '10', '14.5'], row):
+                amount = Decimal(str(amount))
+                self.assertTrue(check_loan_eligibility(customer, amount, Decimal(rate), tenure)[0])
+                self.assertFalse(check_loan_eligibility(customer, amount + Decimal('0.01'), Decimal(rate), tenure)[0])
+
+    def test_quotes_match_check_eligibility(self):
+        envelope = get_eligibility_envelope(self.customer.customer_id)
+        customer = Customer.objects.select_related('credit_profile').get(pk=self.customer.pk)
+        rng = random.Random(5)
+        for _ in range(50):
+            quote = (
+                Decimal(rng.randrange(0, 10 ** 8)) / 100, Decimal(rng.choice(['0', '8', '12', '15.5', '20'])),
+                rng.randint(1, 120)
+            )
+            self.assertEqual(envelope.quote(*quote), check_loan_eligibility(customer, *quote))
+
+    def test_cached_per_customer_version(self):
+        self.envelope()
+        with self.assertNumQueries(0):
+            response = self.envelope('?tenures=24')
+        self.assertEqual(len(response.data['max_loan_amounts']), 1)
+        self.assertEqual(len(response.data['max_loan_amounts'][0]), 7)
+
+        # A new loan uses up part of the headroom
+        self.client.post('/create-loan', {
+            'customer_id': self.customer.customer_id, 'loan_amount': 100000, 'interest_rate': 12, 'tenure': 12
+        }, format='json')
+        self.assertEqual(self.envelope().data['emi_headroom'], 16115.12)
+
+    def test_no_approvable_amount(self):
+        Loan.objects.create(
+            customer=self.customer,
+            loan_amount=2000000,
+            tenure=12,
+            interest_rate=10,
+            monthly_repayment=8792,
+            emis_paid_on_time=12,
+            start_date=date(2015, 1, 1),
+            end_date=date(2016, 1, 1)
+        )
+        response = self.envelope('?tenures=12,24&interest_rates=10')
+        self.assertFalse(response.data['approvable'])
+        self.assertIsNone(response.data['minimum_interest_rate'])
+        self.assertEqual(response.data['max_loan_amounts'], [[None], [None]])
+
+    def test_errors(self):
+        self.assertEqual(self.client.get('/eligibility-envelope/999999').status_code, status.HTTP_404_NOT_FOUND)
+        response = self.envelope('?tenures=0')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('tenures', response.data)
+
 
 class CheckEligibilityAPITest(TestCase):
     def setUp(self):
@@ -108,6 +607,87 @@ class CheckEligibilityAPITest(TestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertIn('approval', response.data)
 
+    def test_check_eligibility_query_count(self):
+        data = {
+            'customer_id': self.customer.customer_id,
+            'loan_amount': 100000,
+            'interest_rate': 10,
+            'tenure': 12
+        }
+        # The credit profile is joined onto the customer lookup
+        with self.assertNumQueries(1):
+            response = self.client.post('/check-eligibility', data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class CheckEligibilityBatchAPITest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.customers = [
+            Customer.objects.create(
+                first_name='Test',
+                last_name=f'User{i}',
+                age=30,
+                phone_number=1234567890 + i,
+                monthly_salary=50000,
+                approved_limit=1800000,
+                current_debt=0
+            )
+            for i in range(3)
+        ]
+        Loan.objects.create(
+            customer=self.customers[1],
+            loan_amount=1500000,
+            tenure=12,
+            interest_rate=10,
+            monthly_repayment=20000,
+            emis_paid_on_time=2,
+            start_date=date(2015, 1, 1),
+            end_date=date(2016, 1, 1)
+        )
+
+    def test_batch_matches_single_endpoint(self):
+        quotes = [
+            {'customer_id': customer.customer_id, 'loan_amount': amount, 'interest_rate': rate, 'tenure': 12}
+            for customer in self.customers
+            for amount, rate in ((100000, 8), (300000, 14))
+        ]
+        response = self.client.post('/check-eligibility/batch', quotes, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), len(quotes))
+
+        for quote, result in zip(quotes, response.data):
+            single = self.client.post('/check-eligibility', quote, format='json')
+            self.assertEqual(result, single.data)
+
+    def test_batch_reports_item_errors(self):
+        quotes = [
+            {'customer_id': self.customers[0].customer_id, 'loan_amount': 100000, 'interest_rate': 10, 'tenure': 12},
+            {'customer_id': self.customers[0].customer_id, 'loan_amount': 100000, 'tenure': 0},
+            {'customer_id': 999999, 'loan_amount': 100000, 'interest_rate': 10, 'tenure': 12},
+        ]
+        response = self.client.post('/check-eligibility/batch', quotes, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('approval', response.data[0])
+        self.assertEqual(response.data[1]['status'], status.HTTP_400_BAD_REQUEST)
+        self.assertIn('interest_rate', response.data[1]['errors'])
+        self.assertIn('tenure', response.data[1]['errors'])
+        self.assertEqual(response.data[2]['status'], status.HTTP_404_NOT_FOUND)
+
+    def test_batch_query_count_is_constant(self):
+        quotes = [
+            {'customer_id': customer.customer_id, 'loan_amount': 100000 + i, 'interest_rate': 10, 'tenure': 12}
+            for i in range(20)
+            for customer in self.customers
+        ]
+        with self.assertNumQueries(1):
+            response = self.client.post('/check-eligibility/batch', quotes, format='json')
+        self.assertEqual(len(response.data), 60)
+
+    def test_batch_rejects_non_list(self):
+        response = self.client.post('/check-eligibility/batch', {'customer_id': 1}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
 
 class CreateLoanAPITest(TestCase):
     def setUp(self):
@@ -134,6 +714,305 @@ class CreateLoanAPITest(TestCase):
         self.assertTrue(response.data['loan_approved'])
         self.assertIsNotNone(response.data['loan_id'])
 
+    def test_create_loan_keeps_debt_and_emi_limit(self):
+        data = {
+            'customer_id': self.customer.customer_id,
+            'loan_amount': 100000,
+            'interest_rate': 10,
+            'tenure': 12
+        }
+        responses = [self.client.post('/create-loan', data, format='json') for _ in range(5)]
+        self.assertIn(False, [response.data['loan_approved'] for response in responses])
+        assert_loan_invariants(self, self.customer)
+
+
+def assert_loan_invariants(test, customer):
+    """
+    The customer's debt matches their loans and their EMIs stay within half
+    of their salary
+    """
+    customer.refresh_from_db()
+    loans = Loan.objects.filter(customer=customer)
+    test.assertEqual(customer.current_debt, sum(loan.loan_amount for loan in loans))
+    test.assertLessEqual(
+        sum(loan.monthly_repayment for loan in loans), customer.monthly_salary * Decimal('0.5')
+    )
+
+
+class CreateLoanLockTest(TestCase):
+    """
+    The locking path of /create-loan, checked on every database;
+    CreateLoanConcurrencyTest races real requests where rows can be locked
+    """
+    def setUp(self):
+        self.customer = Customer.objects.create(
+            first_name='Test',
+            last_name='User',
+            age=30,
+            phone_number=1234567890,
+            monthly_salary=50000,
+            approved_limit=1800000,
+            current_debt=0
+        )
+        self.loan = {
+            'customer_id': self.customer.customer_id,
+            'loan_amount': 200000,
+            'interest_rate': 12,
+            'tenure': 12
+        }
+
+    def test_aggregates_read_after_customer_lock(self):
+        calls = []
+        select_for_update = QuerySet.select_for_update
+
+        def record_lock(queryset, *args, **kwargs):
+            calls.append(('lock', queryset.model))
+            return select_for_update(queryset, *args, **kwargs)
+
+        def record_aggregates(customer, year=None):
+            calls.append(('aggregates', customer.customer_id))
+            return get_loan_aggregates(customer, year)
+
+        with mock.patch.object(QuerySet, 'select_for_update', autospec=True, side_effect=record_lock), \
+                mock.patch('loans.views.get_loan_aggregates', side_effect=record_aggregates):
+            response = APIClient().post('/create-loan', self.loan, format='json')
+        self.assertTrue(response.data['loan_approved'])
+        self.assertEqual(calls[:2], [('lock', Customer), ('aggregates', self.customer.customer_id)])
+
+    def test_stale_credit_cache_cannot_approve(self):
+        # A cached snapshot from before the first loan, as a request queued
+        # on the lock could still find it
+        stale = (LoanAggregates(), CreditScore(score=50))
+        with mock.patch('loans.utils.get_credit_snapshot', return_value=stale):
+            first = APIClient().post('/create-loan', self.loan, format='json')
+            second = APIClient().post('/create-loan', self.loan, format='json')
+        self.assertTrue(first.data['loan_approved'])
+        self.assertFalse(second.data['loan_approved'])
+        assert_loan_invariants(self, self.customer)
+
+
+@skipUnless(connection.features.has_select_for_update, 'Needs row-level locking')
+class CreateLoanConcurrencyTest(TransactionTestCase):
+    THREADS = 8
+
+    def setUp(self):
+        self.customer = Customer.objects.create(
+            first_name='Test',
+            last_name='User',
+            age=30,
+            phone_number=1234567890,
+            monthly_salary=50000,
+            approved_limit=1800000,
+            current_debt=0
+        )
+
+    def test_parallel_create_loan_calls(self):
+        barrier = threading.Barrier(self.THREADS)
+        results = []
+
+        def create_loan():
+            try:
+                barrier.wait()
+                response = APIClient().post('/create-loan', {
+                    'customer_id': self.customer.customer_id,
+                    'loan_amount': 100000,
+                    'interest_rate': 10,
+                    'tenure': 12
+                }, format='json')
+                results.append(response.status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=create_loan) for _ in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(results), self.THREADS)
+        self.assertIn(status.HTTP_200_OK, results)  # Some loans must be rejected
+        assert_loan_invariants(self, self.customer)
+
+
+class IdempotencyKeyTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.customer = Customer.objects.create(
+            first_name='Test',
+            last_name='User',
+            age=30,
+            phone_number=1234567890,
+            monthly_salary=50000,
+            approved_limit=1800000,
+            current_debt=0
+        )
+        self.loan = {
+            'customer_id': self.customer.customer_id,
+            'loan_amount': 100000,
+            'interest_rate': 10,
+            'tenure': 12
+        }
+
+    def create_loan(self, data, key='retry-1'):
+        return self.client.post('/create-loan', data, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_replays_the_stored_response(self):
+        first = self.create_loan(self.loan)
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertNotIn('Idempotent-Replayed', first)
+
+        with mock.patch('loans.views.check_loan_eligibility') as check, self.assertNumQueries(1):
+            retry = self.create_loan(self.loan)
+        check.assert_not_called()
+        self.assertEqual(retry.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(Loan.objects.filter(customer=self.customer).count(), 1)
+        assert_loan_invariants(self, self.customer)
+
+        # Another key creates another loan
+        self.assertNotEqual(self.create_loan(self.loan, key='retry-2').data['loan_id'], first.data['loan_id'])
+        self.assertEqual(Loan.objects.filter(customer=self.customer).count(), 2)
+
+    def test_key_is_scoped_to_one_request(self):
+        self.create_loan(self.loan)
+        response = self.create_loan(dict(self.loan, loan_amount=200000))
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+        # Keys are per endpoint
+        response = self.client.post('/register', {
+            'first_name': 'New', 'last_name': 'Customer', 'age': 30,
+            'monthly_income': 50000, 'phone_number': 9876543210,
+        }, format='json', HTTP_IDEMPOTENCY_KEY='retry-1')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.create_loan(self.loan, key='x' * 256).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_server_error_releases_the_key(self):
+        with mock.patch('loans.views.check_loan_eligibility', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.create_loan(self.loan)
+        self.assertFalse(IdempotencyKey.objects.exists())
+        self.assertEqual(self.create_loan(self.loan).status_code, status.HTTP_201_CREATED)
+
+    def test_expired_keys(self):
+        first = self.create_loan(self.loan)
+        IdempotencyKey.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        retry = self.create_loan(self.loan)
+        self.assertNotEqual(retry.data['loan_id'], first.data['loan_id'])
+        self.assertEqual(IdempotencyKey.objects.count(), 1)
+
+        IdempotencyKey.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(purge_idempotency_keys(), 1)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    @override_settings(IDEMPOTENCY_CACHE=True)
+    def test_cached_responses(self):
+        cache.clear()
+        first = self.create_loan(self.loan)
+        with self.assertNumQueries(0):
+            retry = self.create_loan(self.loan)
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(self.create_loan(dict(self.loan, tenure=24)).status_code, 422)
+
+    def test_failed_store_rolls_back_the_loan(self):
+        with mock.patch('loans.idempotency.JSONRenderer.render', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.create_loan(self.loan)
+        self.assertFalse(Loan.objects.exists())
+        self.assertFalse(IdempotencyKey.objects.exists())
+        assert_loan_invariants(self, self.customer)
+
+    def test_duplicate_of_a_running_request(self):
+        IdempotencyKey.objects.create(
+            scope='create-loan', key='retry-1', request_hash=idempotency.request_hash(mock.Mock(
+                method='POST', path='/create-loan', data=self.loan
+            )),
+            expires_at=timezone.now() + timedelta(seconds=60),
+        )
+        with override_settings(IDEMPOTENCY_WAIT_SECONDS=0), mock.patch('loans.idempotency.time.sleep') as sleep:
+            response = self.create_loan(self.loan)
+        sleep.assert_not_called()
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response['Retry-After'], '1')
+
+        with override_settings(IDEMPOTENCY_WAIT_SECONDS=0.05):
+            self.assertEqual(self.create_loan(self.loan).status_code, status.HTTP_409_CONFLICT)
+
+        # The wait never outlasts the claim it is waiting on
+        with override_settings(IDEMPOTENCY_WAIT_SECONDS=30, IDEMPOTENCY_LOCK_SECONDS=0), \
+                mock.patch('loans.idempotency.time.sleep') as sleep:
+            self.assertEqual(self.create_loan(self.loan).status_code, status.HTTP_409_CONFLICT)
+        sleep.assert_not_called()
+
+        # A claim left by a request that died expires
+        IdempotencyKey.objects.update(expires_at=timezone.now())
+        self.assertEqual(self.create_loan(self.loan).status_code, status.HTTP_201_CREATED)
+
+    def test_duplicate_waits_for_the_running_request(self):
+        claim = IdempotencyKey.objects.create(
+            scope='create-loan', key='retry-1', request_hash=idempotency.request_hash(mock.Mock(
+                method='POST', path='/create-loan', data=self.loan
+            )),
+            expires_at=timezone.now() + timedelta(seconds=60),
+        )
+        first_response = {'loan_id': 42, 'customer_id': self.customer.customer_id, 'loan_approved': True}
+
+        def first_request_finishes(seconds):
+            IdempotencyKey.objects.filter(pk=claim.pk).update(
+                status_code=status.HTTP_201_CREATED, response_body=first_response,
+                expires_at=timezone.now() + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL),
+            )
+
+        # Default settings: the duplicate polls instead of answering 409
+        with mock.patch('loans.idempotency.time.sleep', side_effect=first_request_finishes) as sleep:
+            response = self.create_loan(self.loan)
+        sleep.assert_called_once()
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.json(), first_response)
+        self.assertEqual(response['Idempotent-Replayed'], 'true')
+        self.assertFalse(Loan.objects.exists())
+
+
+@skipUnless(connection.vendor != 'sqlite', 'SQLite locks whole tables under concurrent writers')
+class IdempotencyConcurrencyTest(TransactionTestCase):
+    THREADS = 6
+
+    def test_concurrent_duplicates_wait_for_the_first_request(self):
+        customer = Customer.objects.create(
+            first_name='Test', last_name='User', age=30, phone_number=1234567890,
+            monthly_salary=50000, approved_limit=1800000, current_debt=0
+        )
+        check_loan_eligibility = views.check_loan_eligibility
+
+        def slow_check(*args, **kwargs):
+            time.sleep(0.1)
+            return check_loan_eligibility(*args, **kwargs)
+
+        barrier = threading.Barrier(self.THREADS)
+        responses = []
+
+        def create_loan():
+            try:
+                barrier.wait()
+                responses.append(APIClient().post('/create-loan', {
+                    'customer_id': customer.customer_id, 'loan_amount': 100000, 'interest_rate': 10, 'tenure': 12
+                }, format='json', HTTP_IDEMPOTENCY_KEY='mobile-retry'))
+            finally:
+                connection.close()
+
+        with mock.patch('loans.views.check_loan_eligibility', side_effect=slow_check) as check:
+            threads = [threading.Thread(target=create_loan) for _ in range(self.THREADS)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(check.call_count, 1)
+        self.assertEqual(Loan.objects.count(), 1)
+        self.assertEqual({response.status_code for response in responses}, {status.HTTP_201_CREATED})
+        self.assertEqual({response.json()['loan_id'] for response in responses}, {Loan.objects.get().loan_id})
+        self.assertEqual(sum(response.has_header('Idempotent-Replayed') for response in responses), self.THREADS - 1)
+
 
 class ViewLoanAPITest(TestCase):
     def setUp(self):
@@ -167,3 +1046,1051 @@ class ViewLoanAPITest(TestCase):
         response = self.client.get(f'/view-loans/{self.customer.customer_id}')
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertIsInstance(response.data, list)
+
+    def _add_loans(self, count):
+        Loan.objects.bulk_create([
+            Loan(
+                customer=self.customer, loan_amount=1000 + i, tenure=12, interest_rate=10,
+                monthly_repayment=Decimal('87.92'), emis_paid_on_time=i % 13,
+                start_date=date.today(), end_date=date.today() + timedelta(days=365)
+            )
+            for i in range(count)
+        ])
+
+    def test_view_loans_cursor_pagination(self):
+        self._add_loans(24)
+        url = f'/view-loans/{self.customer.customer_id}?page_size=10'
+        loan_ids = []
+        pages = 0
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertLessEqual(len(response.data['results']), 10)
+            loan_ids.extend(loan['loan_id'] for loan in response.data['results'])
+            url = response.data['next']
+            pages += 1
+
+        self.assertEqual(pages, 3)
+        self.assertEqual(loan_ids, sorted(Loan.objects.values_list('loan_id', flat=True)))
+
+    def test_view_loans_rejects_bad_page_size(self):
+        response = self.client.get(f'/view-loans/{self.customer.customer_id}?page_size=0')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_view_loan_fast_path_matches_serializer(self):
+        self.customer.first_name = 'Zoë\u2028'
+        self.customer.save()
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/view-loan/{self.loan.loan_id}')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.content, JSONRenderer().render(LoanSerializer(self.loan).data))
+        self.assertEqual(self.client.get('/view-loan/999999').status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_view_loans_fast_path_matches_serializer(self):
+        self._add_loans(5)
+        expected = JSONRenderer().render(
+            LoanListSerializer(Loan.objects.filter(customer=self.customer), many=True).data
+        )
+        response = self.client.get(f'/view-loans/{self.customer.customer_id}')
+        self.assertEqual(response.content, expected)
+
+        # The stdlib fallback renders the same bytes
+        with mock.patch.object(renderers, 'orjson', None):
+            response = self.client.get(f'/view-loans/{self.customer.customer_id}')
+        self.assertEqual(response.content, expected)
+
+    def test_view_loans_stream_matches_serializer(self):
+        self._add_loans(5)
+        response = self.client.get(f'/view-loans/{self.customer.customer_id}?stream=true')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        expected = self.client.get(f'/view-loans/{self.customer.customer_id}').data
+        self.assertEqual([json.loads(line) for line in lines], json.loads(json.dumps(expected)))
+
+
+class LoanViewETagTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.customer = Customer.objects.create(
+            first_name='Test',
+            last_name='User',
+            age=30,
+            phone_number=1234567890,
+            monthly_salary=50000,
+            approved_limit=1800000,
+            current_debt=0
+        )
+        self.loan = Loan.objects.create(
+            customer=self.customer,
+            loan_amount=100000,
+            tenure=12,
+            interest_rate=10,
+            monthly_repayment=8792,
+            emis_paid_on_time=0,
+            start_date=date.today(),
+            end_date=date.today() + timedelta(days=365)
+        )
+        self.loans_url = f'/view-loans/{self.customer.customer_id}'
+        self.loan_url = f'/view-loan/{self.loan.loan_id}'
+
+    def test_view_loans_not_modified(self):
+        response = self.client.get(self.loans_url)
+        etag = response['ETag']
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self.loans_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b'')
+
+        # Paginated responses have their own ETag
+        self.assertNotEqual(self.client.get(self.loans_url + '?page_size=1')['ETag'], etag)
+
+    def test_create_loan_changes_etag(self):
+        etag = self.client.get(self.loans_url)['ETag']
+        self.client.post('/create-loan', {
+            'customer_id': self.customer.customer_id, 'loan_amount': 10000,
+            'interest_rate': 10, 'tenure': 12
+        }, format='json')
+
+        response = self.client.get(self.loans_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data), 2)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_bulk_load_changes_etag(self):
+        etag = self.client.get(self.loans_url)['ETag']
+        Ingestor().finish()
+        response = self.client.get(self.loans_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_view_loan_not_modified(self):
+        # Saving a loan records its customer, so the first request gets an ETag
+        etag = self.client.get(self.loan_url)['ETag']
+
+        with self.assertNumQueries(0):
+            response = self.client.get(self.loan_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.loan.delete()
+        response = self.client.get(self.loan_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_view_loan_learns_owner(self):
+        # Loans loaded without signals: the first request learns the
+        # loan's customer, the second gets an ETag
+        forget_loan_owner(self.loan.loan_id)
+        self.assertNotIn('ETag', self.client.get(self.loan_url))
+        self.assertIn('ETag', self.client.get(self.loan_url))
+
+    @override_settings(LOAN_OWNER_CACHE_TTL=60, CACHE_VERSION_TTL=60)
+    def test_owner_and_version_keys_expire(self):
+        cache.clear()
+        self.client.get(self.loan_url)
+        etag = self.client.get(self.loan_url)['ETag']
+        later = time.time() + 61
+        with mock.patch('django.core.cache.backends.locmem.time.time', return_value=later):
+            # The owner is looked up again and the customer gets a new version
+            response = self.client.get(self.loan_url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn('ETag', response)
+            self.assertNotEqual(self.client.get(self.loan_url)['ETag'], etag)
+
+    def test_response_cache(self):
+        with self.settings(LOAN_RESPONSE_CACHE_TTL=60):
+            expected = self.client.get(self.loans_url).content
+            with self.assertNumQueries(0):
+                response = self.client.get(self.loans_url)
+            self.assertEqual(response.content, expected)
+
+            self.customer.first_name = 'Renamed'
+            self.customer.save()
+            with self.assertNumQueries(2):
+                self.client.get(self.loans_url)
+
+
+class AsyncViewsTest(TestCase):
+    def setUp(self):
+        self.customer = Customer.objects.create(
+            first_name='Test',
+            last_name='User',
+            age=30,
+            phone_number=1234567890,
+            monthly_salary=50000,
+            approved_limit=1800000,
+            current_debt=0
+        )
+        self.loans = Loan.objects.bulk_create([
+            Loan(
+                customer=self.customer, loan_amount=10000 + i, tenure=12, interest_rate=10,
+                monthly_repayment=Decimal('879.16'), emis_paid_on_time=i,
+                start_date=date.today(), end_date=date.today() + timedelta(days=365)
+            )
+            for i in range(3)
+        ])
+
+    def _async_request(self, method, url, data=None, headers=None):
+        """Request url from the async views (as served with ASYNC_VIEWS=True)"""
+        with override_settings(ROOT_URLCONF='loans.async_urls'):
+            async def request():
+                if method == 'post':
+                    return await AsyncClient().post(url, data, content_type='application/json')
+                return await AsyncClient().get(url, headers=headers)
+            return async_to_sync(request)()
+
+    def _assert_same_response(self, method, url, data=None):
+        client = APIClient()
+        if method == 'post':
+            sync_response = client.post(url, data, format='json')
+        else:
+            sync_response = client.get(url)
+        async_response = self._async_request(method, url, data)
+        self.assertEqual(async_response.status_code, sync_response.status_code)
+        self.assertEqual(async_response.content, sync_response.content)
+        return async_response
+
+    def test_check_eligibility(self):
+        self._assert_same_response('post', '/check-eligibility', {
+            'customer_id': self.customer.customer_id,
+            'loan_amount': 50000, 'interest_rate': 10, 'tenure': 12
+        })
+        self._assert_same_response('post', '/check-eligibility', {'customer_id': 999999})
+        self._assert_same_response('post', '/check-eligibility', {
+            'customer_id': 999999, 'loan_amount': 50000, 'interest_rate': 10, 'tenure': 12
+        })
+
+    def test_view_loan(self):
+        url = f'/view-loan/{self.loans[0].loan_id}'
+        self._assert_same_response('get', url)
+        response = self._assert_same_response('get', url)
+        response = self._async_request('get', url, headers={'If-None-Match': response['ETag']})
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self._assert_same_response('get', '/view-loan/999999')
+
+    def test_view_loans(self):
+        url = f'/view-loans/{self.customer.customer_id}'
+        response = self._assert_same_response('get', url)
+        self._assert_same_response('get', url + '?page_size=2')
+        self._assert_same_response('get', '/view-loans/999999')
+
+        response = self._async_request('get', url, headers={'If-None-Match': response['ETag']})
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        async def read_stream():
+            response = await AsyncClient().get(url + '?stream=true')
+            return b''.join([line async for line in response.streaming_content])
+
+        with override_settings(ROOT_URLCONF='loans.async_urls'):
+            content = async_to_sync(read_stream)()
+        self.assertEqual(content, b''.join(self.client.get(url + '?stream=true').streaming_content))
+
+
+class ReplicaRoutingTest(TestCase):
+    def setUp(self):
+        # Sticky windows left by other tests' writes
+        cache.clear()
+        patcher = mock.patch.object(routers, 'replica_configured', return_value=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.customer = Customer.objects.create(
+            first_name='Test',
+            last_name='User',
+            age=30,
+            phone_number=1234567890,
+            monthly_salary=50000,
+            approved_limit=1800000,
+            current_debt=0
+        )
+        self.other = Customer.objects.create(
+            first_name='Other',
+            last_name='User',
+            age=40,
+            phone_number=1234567891,
+            monthly_salary=60000,
+            approved_limit=2200000,
+            current_debt=0
+        )
+
+    def test_sticky_after_write(self):
+        # Both customers were just created
+        self.assertEqual(routers.replica_alias(self.customer.customer_id), routers.PRIMARY)
+        cache.clear()
+        self.assertEqual(routers.replica_alias(self.customer.customer_id), routers.REPLICA)
+
+        Loan.objects.create(
+            customer=self.customer, loan_amount=10000, tenure=12, interest_rate=10,
+            monthly_repayment=879, emis_paid_on_time=0,
+            start_date=date.today(), end_date=date.today() + timedelta(days=365)
+        )
+        self.assertEqual(routers.replica_alias(self.customer.customer_id), routers.PRIMARY)
+        self.assertEqual(routers.replica_alias(self.other.customer_id), routers.REPLICA)
+        self.assertEqual(
+            routers.replica_alias_for_customers([self.customer.customer_id, self.other.customer_id]),
+            routers.PRIMARY
+        )
+
+        # Bulk loads keep everyone on the primary
+        Ingestor().finish()
+        self.assertEqual(routers.replica_alias(self.other.customer_id), routers.PRIMARY)
+        self.assertEqual(routers.replica_alias(), routers.PRIMARY)
+
+    def test_router(self):
+        router = routers.ReplicaRouter()
+        self.assertIsNone(router.db_for_read(Loan))
+        with routers.read_from(routers.REPLICA):
+            self.assertEqual(router.db_for_read(Loan), routers.REPLICA)
+            self.assertEqual(router.db_for_write(Loan), routers.PRIMARY)
+        self.assertIsNone(router.db_for_read(Loan))
+        self.assertFalse(router.allow_migrate(routers.REPLICA, 'loans'))
+
+    def test_views_choose_replica(self):
+        cache.clear()
+        chosen = []
+
+        def record(alias):
+            # Run the queries on the primary, this test has no replica
+            chosen.append(alias)
+            return routers.read_from(routers.PRIMARY)
+
+        client = APIClient()
+        quote = {
+            'customer_id': self.customer.customer_id,
+            'loan_amount': 50000, 'interest_rate': 10, 'tenure': 12
+        }
+        with mock.patch.object(views, 'read_from', record):
+            client.post('/check-eligibility', quote, format='json')
+            client.get(f'/view-loans/{self.customer.customer_id}')
+            self.assertEqual(chosen, [routers.REPLICA, routers.REPLICA])
+
+            response = client.post('/create-loan', quote, format='json')
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            self.assertEqual(chosen, [routers.REPLICA, routers.REPLICA])
+
+            # The customer's reads follow their write to the primary
+            client.get(f'/view-loan/{response.data["loan_id"]}')
+            client.get(f'/view-loans/{self.customer.customer_id}')
+            self.assertEqual(chosen[2:], [routers.PRIMARY, routers.PRIMARY])
+
+            client.post('/check-eligibility', dict(quote, customer_id=self.other.customer_id), format='json')
+            self.assertEqual(chosen[4:], [routers.REPLICA])
+
+
+# Celery reads its configuration from the Django settings, so tasks run
+# in-process without a broker
+@override_settings(CELERY_TASK_ALWAYS_EAGER=True, CELERY_TASK_EAGER_PROPAGATES=True)
+class ScoringJobTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.customers = []
+        for i in range(3):
+            customer = Customer.objects.create(
+                first_name='Test',
+                last_name=f'User {i}',
+                age=30,
+                phone_number=1234567890 + i,
+                monthly_salary=50000,
+                approved_limit=1800000,
+                current_debt=0
+            )
+            for j in range(i):
+                Loan.objects.create(
+                    customer=customer, loan_amount=200000, tenure=12, interest_rate=10,
+                    monthly_repayment=17584, emis_paid_on_time=12,
+                    start_date=date.today(), end_date=date.today() + timedelta(days=365)
+                )
+            self.customers.append(customer)
+
+    def _submit(self, data):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/scoring-jobs', data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        return self.client.get(f'/scoring-jobs/{response.data["job_id"]}').data
+
+    def test_score_all_customers(self):
+        job = self._submit({'chunk_size': 2})
+        self.assertEqual(job['status'], ScoringJob.COMPLETED)
+        self.assertEqual(job['progress'], 1.0)
+        self.assertEqual((job['total_customers'], job['scored_customers']), (3, 3))
+        self.assertEqual((job['total_chunks'], job['completed_chunks']), (2, 2))
+
+        for customer in self.customers:
+            stored = CustomerScore.objects.get(customer=customer)
+            self.assertEqual(stored.score, calculate_credit_score(customer))
+            self.assertEqual(stored.job_id, job['job_id'])
+
+    def test_filtered_rescore(self):
+        self._submit({})
+        CustomerCreditProfile.objects.filter(customer=self.customers[0]).delete()
+        job = self._submit({'customer_ids': [self.customers[0].customer_id, 999999]})
+        self.assertEqual((job['total_customers'], job['scored_customers']), (1, 1))
+
+        # Customers without a profile are scored from their loans
+        self.assertEqual(
+            dict(CustomerScore.objects.values_list('customer_id', 'job_id')),
+            {
+                self.customers[0].customer_id: job['job_id'],
+                self.customers[1].customer_id: job['job_id'] - 1,
+                self.customers[2].customer_id: job['job_id'] - 1,
+            }
+        )
+
+        job = self._submit({'updated_since': '2999-01-01T00:00:00Z'})
+        self.assertEqual(job['status'], ScoringJob.COMPLETED)
+        self.assertEqual(job['total_customers'], 0)
+
+    def test_failed_chunk_fails_job(self):
+        job = ScoringJob.objects.create(chunk_size=10)
+        with mock.patch('loans.tasks.score_customers', side_effect=ValueError('boom')):
+            with self.assertRaises(ValueError):
+                run_scoring_job(job.pk)
+        job.refresh_from_db()
+        self.assertEqual(job.status, ScoringJob.FAILED)
+        self.assertIn('boom', job.error)
+
+    def test_invalid_requests(self):
+        response = self.client.post('/scoring-jobs', {'chunk_size': 0}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post('/scoring-jobs', {'customer_ids': []}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get('/scoring-jobs/999999').status_code, status.HTTP_404_NOT_FOUND)
+
+
+class PortfolioTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.customers = []
+        for i in range(2):
+            customer = Customer.objects.create(
+                first_name='Test', last_name=f'User {i}', age=30, phone_number=1234567890 + i,
+                monthly_salary=50000, approved_limit=1800000, current_debt=0
+            )
+            self.customers.append(customer)
+        loans = [
+            (self.customers[0], 100000, Decimal('9.5'), 12, 3, date(2022, 5, 1)),
+            (self.customers[0], 200000, Decimal('13'), 24, 24, date(2023, 1, 15)),
+            (self.customers[1], 300000, Decimal('21'), 36, 10, date(2023, 7, 1)),
+        ]
+        for customer, amount, rate, tenure, paid, start in loans:
+            Loan.objects.create(
+                customer=customer, loan_amount=amount, tenure=tenure, interest_rate=rate,
+                monthly_repayment=calculate_monthly_installment(Decimal(amount), rate, tenure),
+                emis_paid_on_time=paid, start_date=start, end_date=start + timedelta(days=tenure * 30)
+            )
+        CustomerScore.objects.create(customer=self.customers[0], score=40, scored_at=timezone.now())
+
+    def test_summary(self):
+        response = self.client.get('/portfolio/summary')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        summary = response.data
+        self.assertEqual((summary['customers'], summary['loans'], summary['active_loans']), (2, 3, 2))
+        self.assertEqual(summary['total_loan_amount'], 600000)
+
+        exposure = Loan.objects.aggregate(total=Sum('outstanding_principal'))['total']
+        self.assertAlmostEqual(summary['outstanding_principal'], float(exposure), places=2)
+        active_emi = sum(
+            float(loan.monthly_repayment) for loan in Loan.objects.all() if loan.repayments_left
+        )
+        self.assertAlmostEqual(summary['monthly_emi'], active_emi, places=2)
+        self.assertAlmostEqual(summary['emi_to_income'], active_emi / 100000)
+        self.assertEqual(summary['scored_customers'], 1)
+        self.assertEqual(
+            [band['customers'] for band in summary['score_distribution']], [0, 0, 1, 0]
+        )
+
+    def test_distributions(self):
+        vintage = self.client.get('/portfolio/distribution').data
+        self.assertEqual(vintage['by'], 'vintage')
+        self.assertEqual([bucket['bucket'] for bucket in vintage['buckets']], ['2022', '2023'])
+        self.assertEqual([bucket['loans'] for bucket in vintage['buckets']], [1, 2])
+        self.assertAlmostEqual(vintage['buckets'][-1]['cumulative_share'], 1.0)
+        self.assertAlmostEqual(sum(bucket['exposure_share'] for bucket in vintage['buckets']), 1.0)
+
+        rates = self.client.get('/portfolio/distribution?by=interest_band').data
+        self.assertEqual([bucket['bucket'] for bucket in rates['buckets']], ['8-10', '12-14', '20+'])
+        # The 13% loan is paid off
+        self.assertEqual(rates['buckets'][1]['outstanding_principal'], 0)
+
+        scores = self.client.get('/portfolio/distribution?by=score_band').data
+        self.assertEqual(
+            [(bucket['bucket'], bucket['loans']) for bucket in scores['buckets']],
+            [('unscored', 1), ('31-50', 2)]
+        )
+
+        response = self.client.get('/portfolio/distribution?by=tenure')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_results_are_cached_until_refreshed(self):
+        before = self.client.get('/portfolio/summary').data
+        Loan.objects.filter(loan_id=Loan.objects.first().loan_id).delete()
+        self.assertEqual(self.client.get('/portfolio/summary').data, before)
+
+        refresh_portfolio()
+        self.assertEqual(self.client.get('/portfolio/summary').data['loans'], 2)
+        self.assertEqual(
+            sum(bucket['loans'] for bucket in self.client.get('/portfolio/distribution').data['buckets']), 2
+        )
+
+
+@override_settings(METRICS_SAMPLE_RATE=1, SLOW_QUERY_MS=10000)
+class RequestMetricsTest(TestCase):
+    def setUp(self):
+        metrics.reset_metrics()
+        self.client = APIClient()
+        self.customer = Customer.objects.create(
+            first_name='Test', last_name='User', age=30, phone_number=1234567890,
+            monthly_salary=50000, approved_limit=1800000, current_debt=0
+        )
+        Loan.objects.create(
+            customer=self.customer, loan_amount=100000, tenure=12, interest_rate=10,
+            monthly_repayment=Decimal('8791.59'), emis_paid_on_time=3,
+            start_date=date.today(), end_date=date.today() + timedelta(days=360)
+        )
+
+    def _check_eligibility(self):
+        return self.client.post('/check-eligibility', {
+            'customer_id': self.customer.customer_id, 'loan_amount': 50000, 'interest_rate': 12, 'tenure': 12
+        }, format='json')
+
+    def test_server_timing(self):
+        cache.clear()
+        response = self._check_eligibility()
+        timing = {entry.split(';')[0]: entry for entry in response['Server-Timing'].split(', ')}
+        self.assertEqual(set(timing), {'db', 'credit_score', 'emi', 'serialize', 'total'})
+        self.assertRegex(timing['db'], r'desc="[1-9]\d* queries"')
+
+        response = self.client.get(f'/view-loans/{self.customer.customer_id}')
+        self.assertIn('serialize;dur=', response['Server-Timing'])
+
+    def test_prometheus_metrics(self):
+        self._check_eligibility()
+        self._check_eligibility()
+        self.client.get('/view-loan/999999')
+
+        response = self.client.get('/metrics')
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        text = response.content.decode()
+        self.assertIn('http_requests_total{view="check-eligibility",method="POST",status="200"} 2', text)
+        self.assertIn('http_requests_total{view="view-loan",method="GET",status="404"} 1', text)
+        self.assertIn('# TYPE http_request_duration_seconds histogram', text)
+        self.assertIn('http_request_duration_seconds_bucket{view="check-eligibility",le="+Inf"} 2', text)
+        self.assertIn('http_request_duration_seconds_count{view="check-eligibility"} 2', text)
+        self.assertIn('http_request_span_duration_seconds_count{view="check-eligibility",span="emi"} 2', text)
+
+    def test_unsampled_requests_are_only_counted(self):
+        with override_settings(METRICS_SAMPLE_RATE=0):
+            response = self._check_eligibility()
+        self.assertNotIn('Server-Timing', response)
+        text = metrics.render_metrics()
+        self.assertIn('http_request_duration_seconds_count{view="check-eligibility"} 1', text)
+        self.assertNotIn('http_request_db_queries_count{view="check-eligibility"}', text)
+
+        with override_settings(METRICS_ENABLED=False):
+            self._check_eligibility()
+        self.assertIn('http_request_duration_seconds_count{view="check-eligibility"} 1', metrics.render_metrics())
+
+    def test_slow_query_log(self):
+        with override_settings(SLOW_QUERY_MS=0), self.assertLogs('loans.slow_queries', 'WARNING') as logs:
+            self.client.get(f'/view-loans/{self.customer.customer_id}')
+        self.assertIn('in view-loans on default', logs.output[0])
+        self.assertIn('db_slow_queries_total{view="view-loans"}', metrics.render_metrics())
+
+    def test_nested_spans_count_once(self):
+        @metrics.span('outer')
+        def outer():
+            time.sleep(0.02)
+            return inner()
+
+        @metrics.span('outer')
+        def inner():
+            time.sleep(0.02)
+            return 1
+
+        request = mock.Mock(resolver_match=None)
+        token = metrics.start_request(request, sampled=True)
+        outer()
+        recorded = metrics._current.get().spans['outer']
+        metrics._current.reset(token)
+        # Counted twice it would be at least 0.06
+        self.assertGreaterEqual(recorded, 0.04)
+        self.assertLess(recorded, 0.06)
+
+
+class InlineExecutor:
+    """ProcessPoolExecutor stand-in running each task in the calling process"""
+    def __init__(self, max_workers=None, mp_context=None):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def submit(self, fn, *args):
+        future = Future()
+        try:
+            future.set_result(fn(*args))
+        except Exception as exc:
+            future.set_exception(exc)
+        return future
+
+
+class IngestDataTest(TestCase):
+    CUSTOMER_HEADER = 'Customer ID,First Name,Last Name,Age,Phone Number,Monthly Salary,Approved Limit\n'
+    LOAN_HEADER = (
+        'Customer ID,Loan ID,Loan Amount,Tenure,Interest Rate,Monthly payment,'
+        'EMIs paid on Time,Date of Approval,End Date\n'
+    )
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        cache_settings = self.settings(INGEST_CACHE_DIR=os.path.join(self.tmpdir.name, 'cache'))
+        cache_settings.enable()
+        self.addCleanup(cache_settings.disable)
+        self.customers_file = self._write('customers.csv', self.CUSTOMER_HEADER + (
+            '1,Aaron,Garcia,63,9629317944,50000,4500000\n'
+            '2,Abbey,Rios,33,9180258290,33000,1400000\n'
+        ))
+        self.loans_file = self._write('loans.csv', self.LOAN_HEADER + (
+            '1,101,900000,138,16.47,16000,120,2018-11-09,2030-04-09\n'
+            '1,102,100000,12,9.2,8750,12,2015-01-01,2016-01-01\n'
+            '1,102,999999,12,9.2,8750,12,2015-01-01,2016-01-01\n'
+            '3,103,100000,12,9.2,8750,12,2015-01-01,2016-01-01\n'
+        ))
+
+    def _write(self, name, content):
+        path = os.path.join(self.tmpdir.name, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def _ingest(self, *args):
+        out = StringIO()
+        call_command(
+            'ingest_data', '--customers-file', self.customers_file,
+            '--loans-file', self.loans_file, '--batch-size', '1', *args, stdout=out
+        )
+        return out.getvalue()
+
+    def test_ingest_is_idempotent(self):
+        output = self._ingest()
+        self.assertIn('Created 2 customers', output)
+        self.assertIn('Created 2 loans', output)
+        self.assertIn('rows/s', output)
+        self.assertEqual(Loan.objects.get(loan_id=102).loan_amount, 100000)
+
+        output = self._ingest('--force')
+        self.assertIn('Created 0 customers', output)
+        self.assertIn('Created 0 loans', output)
+        self.assertEqual(Loan.objects.count(), 2)
+
+    def test_unchanged_files_are_skipped(self):
+        output = self._ingest()
+        self.assertIn('Converted customers.csv into the staging cache', output)
+        self.assertEqual(IngestedFile.objects.count(), 2)
+
+        output = self._ingest()
+        self.assertIn('Nothing to ingest', output)
+
+        self._write('loans.csv', self.LOAN_HEADER + '2,104,50000,12,9.2,4400,12,2015-01-01,2016-01-01\n')
+        output = self._ingest()
+        self.assertIn('Customers file unchanged since last ingestion, skipping', output)
+        self.assertIn('Converted loans.csv into the staging cache', output)
+        self.assertIn('Created 1 loans', output)
+
+    def test_forced_run_reads_staging_cache(self):
+        self._ingest()
+        output = self._ingest('--force', '--upsert')
+        self.assertIn('Reading loans.csv from the staging cache', output)
+        self.assertIn('Created 0 loans, updated 0', output)
+
+    def test_dry_run_writes_nothing(self):
+        output = self._ingest('--dry-run')
+        self.assertIn('Loans: 4 rows parsed', output)
+        self.assertEqual(Customer.objects.count(), 0)
+        self.assertEqual(IngestedFile.objects.count(), 0)
+
+    def test_ingest_maintains_credit_profiles(self):
+        self._ingest()
+        customer = Customer.objects.get(customer_id=1)
+        assert_aggregates_match(
+            self, aggregates_from_profile(customer.credit_profile, 2015), aggregate_loans(customer, 2015)
+        )
+        self.assertEqual(customer.credit_profile.loan_count, 2)
+
+    def test_upsert_updates_changed_rows(self):
+        self._ingest()
+        self.customers_file = self._write('customers.csv', self.CUSTOMER_HEADER + (
+            '1,Aaron,Garcia,63,9629317944,60000,4500000\n'
+            '2,Abbey,Rios,33,9180258290,33000,1400000\n'
+        ))
+        self.loans_file = self._write('loans.csv', self.LOAN_HEADER + (
+            '1,101,900000,138,16.47,16000,130,2018-11-09,2030-04-09\n'
+            '1,102,100000,12,9.2,8750,12,2015-01-01,2016-01-01\n'
+        ))
+
+        output = self._ingest('--upsert')
+        self.assertIn('Created 0 customers, updated 1', output)
+        self.assertIn('Created 0 loans, updated 1', output)
+        self.assertEqual(Customer.objects.get(customer_id=1).monthly_salary, 60000)
+        self.assertEqual(Loan.objects.get(loan_id=101).emis_paid_on_time, 130)
+
+    def test_phone_number_conflicts_are_skipped(self):
+        Customer.objects.create(
+            customer_id=50, first_name='Jane', last_name='Smith', age=25, phone_number=9180258290,
+            monthly_salary=60000, approved_limit=2200000
+        )
+        self.customers_file = self._write('customers.csv', self.CUSTOMER_HEADER + (
+            '1,Aaron,Garcia,63,9629317944,50000,4500000\n'
+            '2,Abbey,Rios,33,9180258290,33000,1400000\n'
+            '4,Abel,Rios,41,9629317944,33000,1400000\n'
+        ))
+
+        output = self._ingest()
+        self.assertIn('Skipping 2 customers with a phone number already in use', output)
+        self.assertIn('Created 1 customers', output)
+        self.assertEqual(Customer.objects.filter(phone_number=9629317944).get().customer_id, 1)
+
+    def test_partitioned_reads_cover_file_once(self):
+        self.assertEqual(partition_rows(10, 3), [(0, 4), (4, 7), (7, 10)])
+        self.assertEqual(partition_rows(2, 8), [(0, 1), (1, 2)])
+        self.assertEqual(count_rows(self.loans_file), 4)
+
+        loan_ids = []
+        for start, stop in partition_rows(count_rows(self.loans_file), 3):
+            for frame in read_frames(self.loans_file, 1, start, stop):
+                loan_ids.extend(frame['Loan ID'].tolist())
+        self.assertEqual(loan_ids, [101, 102, 102, 103])
+
+    def test_failed_partition_rebuilds_committed_profiles(self):
+        self.loans_file = self._write('loans.csv', self.LOAN_HEADER + (
+            '1,101,900000,138,16.47,16000,120,2018-11-09,2030-04-09\n'
+            '2,201,100000,12,9.2,8750,12,2015-01-01,2016-01-01\n'
+        ))
+        ingest_loans = Ingestor.ingest_loans
+
+        def fail_second_partition(ingestor, file_path, start=0, stop=None):
+            if start > 0:
+                raise RuntimeError('worker died')
+            return ingest_loans(ingestor, file_path, start, stop)
+
+        with mock.patch('loans.ingestion.ProcessPoolExecutor', InlineExecutor), \
+                mock.patch.object(Ingestor, 'ingest_loans', fail_second_partition):
+            with self.assertRaisesMessage(RuntimeError, 'worker died'):
+                self._ingest('--workers', '2')
+
+        # The committed partition is reflected in its customer's profile, and
+        # the file is left to be ingested again
+        self.assertEqual(list(Loan.objects.values_list('loan_id', flat=True)), [101])
+        self.assertEqual(CustomerCreditProfile.objects.get(customer_id=1).loan_count, 1)
+        self.assertFalse(IngestedFile.objects.exists())
+
+        with mock.patch('loans.ingestion.ProcessPoolExecutor', InlineExecutor):
+            output = self._ingest('--workers', '2')
+        self.assertIn('Created 1 loans', output)
+        self.assertEqual(CustomerCreditProfile.objects.get(customer_id=1).loan_count, 1)
+        self.assertEqual(CustomerCreditProfile.objects.get(customer_id=2).loan_count, 1)
+        self.assertEqual(IngestedFile.objects.count(), 2)
+
+    def test_create_loan_after_ingest_gets_fresh_id(self):
+        self._ingest()
+        response = APIClient().post('/create-loan', {
+            'customer_id': 2, 'loan_amount': 10000, 'interest_rate': 10, 'tenure': 12
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertGreater(response.data['loan_id'], 102)
+
+
+@override_settings(CELERY_TASK_ALWAYS_EAGER=True)
+class IngestionJobTest(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        data_settings = self.settings(
+            INGEST_DATA_DIR=self.tmpdir.name,
+            INGEST_CACHE_DIR=os.path.join(self.tmpdir.name, 'cache'),
+        )
+        data_settings.enable()
+        self.addCleanup(data_settings.disable)
+        self.client = APIClient()
+        with open(os.path.join(self.tmpdir.name, 'customers.csv'), 'w') as f:
+            f.write(IngestDataTest.CUSTOMER_HEADER + ''.join(
+                f'{i},First,Last,30,{9000000000 + i},50000,1800000\n' for i in range(1, 6)
+            ))
+        with open(os.path.join(self.tmpdir.name, 'loans.csv'), 'w') as f:
+            f.write(IngestDataTest.LOAN_HEADER + ''.join(
+                f'{i % 5 + 1},{100 + i},100000,12,9.2,8750,12,2015-01-01,2016-01-01\n' for i in range(7)
+            ))
+
+    def _submit(self, **data):
+        data = {'customers_file': 'customers.csv', 'loans_file': 'loans.csv', 'chunk_size': 2, **data}
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/ingestion-jobs', data, format='json')
+        return response, self.client.get(f'/ingestion-jobs/{response.data["job_id"]}').data
+
+    def test_job_loads_in_checkpoints(self):
+        response, job = self._submit()
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(job['status'], IngestionJob.COMPLETED)
+        self.assertEqual((job['rows_done'], job['total_rows'], job['progress']), (12, 12, 1.0))
+        self.assertEqual(job['rows_created'], 12)
+        self.assertEqual(job['eta_seconds'], 0.0)
+        self.assertEqual(Loan.objects.count(), 7)
+        self.assertEqual(CustomerCreditProfile.objects.get(customer_id=1).loan_count, 2)
+        self.assertEqual(IngestedFile.objects.count(), 2)
+
+        # The files are recorded as ingested, so a new job has nothing to do
+        response, job = self._submit()
+        self.assertEqual(job['status'], IngestionJob.COMPLETED)
+        self.assertEqual(job['total_rows'], 0)
+
+    def test_failed_job_resumes_from_watermark(self):
+        calls = []
+        ingest_loans = Ingestor.ingest_loans
+
+        def fail_second_checkpoint(ingestor, *args):
+            calls.append(args)
+            if len(calls) == 2:
+                raise ValueError('worker lost')
+            return ingest_loans(ingestor, *args)
+
+        with mock.patch.object(Ingestor, 'ingest_loans', fail_second_checkpoint):
+            _, job = self._submit()
+        self.assertEqual(job['status'], IngestionJob.FAILED)
+        self.assertIn('worker lost', job['error'])
+        # Customers and the first loan checkpoint are committed
+        self.assertEqual((job['customers_done'], job['loans_done']), (5, 2))
+        self.assertEqual(Loan.objects.count(), 2)
+
+        response, resumed = self._submit()
+        self.assertEqual(resumed['job_id'], job['job_id'])
+        self.assertEqual(resumed['status'], IngestionJob.COMPLETED)
+        self.assertEqual(resumed['rows_created'], 12)
+        self.assertEqual(resumed['rows_skipped'], 0)
+        self.assertEqual(Loan.objects.count(), 7)
+
+    def test_resumable_command(self):
+        out = StringIO()
+        call_command(
+            'ingest_data', '--resumable', '--chunk-size', '3',
+            '--customers-file', os.path.join(self.tmpdir.name, 'customers.csv'),
+            '--loans-file', os.path.join(self.tmpdir.name, 'loans.csv'), stdout=out
+        )
+        self.assertIn('completed: created 12 rows', out.getvalue())
+        self.assertEqual(IngestionJob.objects.get().loans_done, 7)
+
+    def test_background_command_skips_running_job(self):
+        arguments = [
+            'ingest_data', '--background',
+            '--customers-file', os.path.join(self.tmpdir.name, 'customers.csv'),
+            '--loans-file', os.path.join(self.tmpdir.name, 'loans.csv'),
+        ]
+        with mock.patch('loans.management.commands.ingest_data.run_ingestion_job') as task:
+            call_command(*arguments, stdout=StringIO())
+            task.delay.assert_called_once()
+
+            IngestionJob.objects.update(status=IngestionJob.RUNNING)
+            out = StringIO()
+            call_command(*arguments, stdout=out)
+        task.delay.assert_called_once()
+        self.assertIn('already running', out.getvalue())
+
+    def test_background_command_skips_queued_job(self):
+        arguments = [
+            'ingest_data', '--background',
+            '--customers-file', os.path.join(self.tmpdir.name, 'customers.csv'),
+            '--loans-file', os.path.join(self.tmpdir.name, 'loans.csv'),
+        ]
+        with mock.patch('loans.management.commands.ingest_data.run_ingestion_job') as task:
+            call_command(*arguments, stdout=StringIO())
+            # Restarted before a worker picked the job up
+            out = StringIO()
+            call_command(*arguments, stdout=out)
+        task.delay.assert_called_once()
+        self.assertEqual(IngestionJob.objects.get().status, IngestionJob.PENDING)
+        self.assertIn('already queued', out.getvalue())
+        self.assertNotIn('Queued', out.getvalue())
+
+        # A failed job is queued again to resume
+        IngestionJob.objects.update(status=IngestionJob.FAILED)
+        with mock.patch('loans.management.commands.ingest_data.run_ingestion_job') as task:
+            call_command(*arguments, stdout=StringIO())
+        task.delay.assert_called_once()
+
+    def test_invalid_requests(self):
+        response = self.client.post('/ingestion-jobs', {
+            'customers_file': '../customers.csv', 'loans_file': 'missing.csv'
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(set(response.data), {'customers_file', 'loans_file'})
+        self.assertEqual(self.client.get('/ingestion-jobs/999999').status_code, status.HTTP_404_NOT_FOUND)
+
+
+class SyntheticDataTest(TestCase):
+    def test_generated_data_is_consistent(self):
+        load_synthetic_data(customers=20, loans=200, seed=7, chunk_size=64)
+        self.assertEqual(Customer.objects.count(), 20)
+        self.assertEqual(Loan.objects.count(), 200)
+
+        for loan in Loan.objects.all()[:50]:
+            self.assertEqual(
+                loan.monthly_repayment,
+                calculate_monthly_installment(loan.loan_amount, loan.interest_rate, loan.tenure)
+            )
+            self.assertLessEqual(loan.emis_paid_on_time, loan.tenure)
+            self.assertEqual(loan.end_date, loan.start_date + timedelta(days=loan.tenure * 30))
+            # Bulk inserts bypass Loan.save(), so the frame carries the column
+            self.assertEqual(loan.outstanding_principal, outstanding_principal(
+                loan.loan_amount, loan.interest_rate, loan.monthly_repayment,
+                loan.tenure, loan.emis_paid_on_time
+            ))
+
+        customer = Customer.objects.first()
+        assert_aggregates_match(self, aggregates_from_profile(customer.credit_profile), aggregate_loans(customer))
+
+    def test_same_seed_generates_same_rows(self):
+        rng_a, rng_b = np.random.default_rng(3), np.random.default_rng(3)
+        customers = synthetic_customers(5, rng_a)
+        self.assertTrue(customers.equals(synthetic_customers(5, rng_b)))
+        loans = synthetic_loans(50, customers['customer_id'], rng_a, today=date(2024, 6, 1))
+        self.assertTrue(loans.equals(
+            synthetic_loans(50, customers['customer_id'], rng_b, today=date(2024, 6, 1))
+        ))
+
+    def test_loans_over_stored_customers_follow_customer_ids(self):
+        # Phone numbers run against the IDs, so an index on them does not
+        # hand back the customers in ID order
+        for customer_id in range(1, 6):
+            Customer.objects.create(
+                customer_id=customer_id, first_name='Test', last_name='User', age=30,
+                phone_number=9000000000 - customer_id, monthly_salary=50000, approved_limit=1800000
+            )
+        load_synthetic_data(customers=0, loans=30, seed=4)
+
+        expected = synthetic_loans(30, np.arange(1, 6), np.random.default_rng(4))
+        self.assertEqual(
+            list(Loan.objects.order_by('loan_id').values_list('customer_id', flat=True)),
+            expected['customer_id'].tolist()
+        )
+
+    def test_connection_benchmark_restores_settings(self):
+        load_synthetic_data(customers=5, loans=20, seed=1)
+        max_age = connection.settings_dict['CONN_MAX_AGE']
+        out = StringIO()
+        call_command('benchmark_connections', '--requests', '3', stdout=out)
+        self.assertIn('saved per request', out.getvalue())
+        self.assertEqual(connection.settings_dict['CONN_MAX_AGE'], max_age)
+
+    def test_benchmark_command_reports_plans(self):
+        out = StringIO()
+        call_command('benchmark_queries', '--generate-loans', '100', '--samples', '5', stdout=out)
+        output = out.getvalue()
+        self.assertIn('credit score aggregates', output)
+        self.assertIn('loans_customer_dates_idx', output)
+
+
+class BenchmarkSuiteTest(TransactionTestCase):
+    def test_generate_dataset_is_reproducible(self):
+        call_command('generate_dataset', '--loans', '200', '--loans-per-customer', '10', stdout=StringIO())
+        self.assertEqual((Customer.objects.count(), Loan.objects.count()), (20, 200))
+        first = list(Loan.objects.order_by('loan_id').values_list('customer_id', 'loan_amount', 'start_date'))
+
+        call_command('generate_dataset', '--loans', '200', '--customers', '20', '--flush', stdout=StringIO())
+        self.assertEqual(
+            list(Loan.objects.order_by('loan_id').values_list('customer_id', 'loan_amount', 'start_date')), first
+        )
+        self.assertEqual(Customer.objects.order_by('customer_id').first().customer_id, 1)
+
+    def test_benchmark_in_process(self):
+        load_synthetic_data(customers=10, loans=30, seed=2)
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'results.json')
+            out = StringIO()
+            call_command(
+                'benchmark_api', '--concurrency', '2', '--requests', '60', '--warmup', '0',
+                '--output', output, stdout=out
+            )
+            with open(output) as file:
+                results = json.load(file)
+        self.assertEqual(set(results['endpoints']), set(DEFAULT_MIX))
+        self.assertEqual(results['overall']['requests'] + results['overall']['errors'], 60)
+        self.assertGreater(results['endpoints']['view-loan']['queries_per_request'], 0)
+        self.assertIn('p95', out.getvalue())
+
+
+
+class ReplayRequestsTest(TransactionTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def write_traffic(self, *records):
+        path = os.path.join(self.directory, 'traffic.jsonl')
+        with open(path, 'w') as file:
+            for record in records:
+                file.write((record if isinstance(record, str) else json.dumps(record)) + '\n')
+        return path
+
+    def test_replay_checks_expectations(self):
+        load_synthetic_data(customers=5, loans=10, seed=3)
+        loan_id = Loan.objects.first().loan_id
+        traffic = self.write_traffic(
+            {'path': '/emi-grid?loan_amount=100000&interest_rates=10&tenures=24', 'expect': {
+                'status': 200,
+                'body': {'monthly_installments': [[float(calculate_monthly_installment(
+                    Decimal('100000'), Decimal('10'), 24
+                ))]]},
+            }},
+            {'path': f'/view-loan/{loan_id}', 'expect': {'status': 200, 'body': {'loan_id': loan_id}}},
+            '',
+            {'method': 'post', 'path': '/check-eligibility', 'body': {'customer_id': 999999999}, 'expect': {
+                'status': 400,
+            }},
+        )
+        output = os.path.join(self.directory, 'outcomes.jsonl')
+        out = StringIO()
+        call_command('replay_requests', traffic, '--concurrency', '2', '--output', output, stdout=out)
+        self.assertIn('All responses matched', out.getvalue())
+        with open(output) as file:
+            outcomes = sorted((json.loads(line) for line in file), key=lambda outcome: outcome['line'])
+        self.assertEqual([outcome['line'] for outcome in outcomes], [1, 2, 4])
+        self.assertEqual([outcome['status'] for outcome in outcomes], [200, 200, 400])
+
+        traffic = self.write_traffic(
+            {'path': f'/view-loan/{loan_id}', 'expect': {'status': 200, 'body': {'loan_id': loan_id + 1}}},
+        )
+        out = StringIO()
+        with self.assertRaisesMessage(CommandError, '1 responses did not match'):
+            call_command('replay_requests', traffic, '--rate', '100', stdout=out)
+        self.assertIn(f'body.loan_id: {loan_id}, expected {loan_id + 1}', out.getvalue())
+
+    def test_record_and_replay_with_asyncio(self):
+        traffic = self.write_traffic(
+            {'name': 'grid', 'path': '/emi-grid?loan_amount=50000&interest_rates=8,12&tenures=6', 'at': 0.0},
+            {'path': '/view-loan/999999999', 'at': 0.05},
+        )
+        recorded = os.path.join(self.directory, 'recorded.jsonl')
+        call_command('replay_requests', traffic, '--timestamps', '--speed', '5', '--record', recorded, stdout=StringIO())
+        with open(recorded) as file:
+            records = [json.loads(line) for line in file]
+        self.assertEqual([record['at'] for record in records], [0.0, 0.05])
+        self.assertEqual(records[0]['name'], 'grid')
+        self.assertEqual(len(records[0]['expect']['body']['monthly_installments'][0]), 2)
+        self.assertEqual(records[1]['expect']['status'], 404)
+
+        out = StringIO()
+        call_command('replay_requests', recorded, '--mode', 'asyncio', '--rate', '50', stdout=out)
+        self.assertIn('All responses matched', out.getvalue())
+        self.assertIn('grid', out.getvalue())
+        self.assertIn('404: 1', out.getvalue())
+
+    def test_invalid_traffic(self):
+        traffic = self.write_traffic({'path': '/emi-grid'}, '{"method": "GET"}')
+        with self.assertRaisesMessage(CommandError, 'Line 2'):
+            call_command('replay_requests', traffic, stdout=StringIO())
+        traffic = self.write_traffic({'path': '/emi-grid'})
+        with self.assertRaisesMessage(CommandError, '"at" offset'):
+            call_command('replay_requests', traffic, '--timestamps', '--mode', 'asyncio', stdout=StringIO())
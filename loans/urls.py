@@ -4,7 +4,18 @@ from . import views
 urlpatterns = [
     path('register', views.register_customer, name='register'),
     path('check-eligibility', views.check_eligibility, name='check-eligibility'),
+    path('check-eligibility/batch', views.check_eligibility_batch, name='check-eligibility-batch'),
+    path('emi-grid', views.emi_grid, name='emi-grid'),
+    path('eligibility-envelope/<int:customer_id>', views.eligibility_envelope, name='eligibility-envelope'),
     path('create-loan', views.create_loan, name='create-loan'),
     path('view-loan/<int:loan_id>', views.view_loan, name='view-loan'),
     path('view-loans/<int:customer_id>', views.view_loans_by_customer, name='view-loans'),
+    path('loan-schedule/<int:loan_id>', views.loan_schedule, name='loan-schedule'),
+    path('portfolio/summary', views.portfolio_summary, name='portfolio-summary'),
+    path('portfolio/distribution', views.portfolio_distribution, name='portfolio-distribution'),
+    path('scoring-jobs', views.submit_scoring_job, name='scoring-jobs'),
+    path('scoring-jobs/<int:job_id>', views.view_scoring_job, name='scoring-job'),
+    path('ingestion-jobs', views.submit_ingestion_job, name='ingestion-jobs'),
+    path('ingestion-jobs/<int:job_id>', views.view_ingestion_job, name='ingestion-job'),
+    path('metrics', views.metrics, name='metrics'),
 ]
@@ -1,87 +1,334 @@
+from dataclasses import dataclass
 from datetime import datetime
 from decimal import Decimal
-from django.db.models import Sum, Count, Q
-from .models import Loan
+import numpy as np
+from django.core.cache import cache
+from django.db.models import Sum, Count, Q, FloatField, Value
+from django.db.models.functions import Cast, Least
+from .amortization import as_float_array
+from .cache import (
+    get_customer_version, aget_customer_version, get_customer_versions, credit_cache_timeout,
+    record_hit, record_miss
+)
+from .metrics import span
+from .models import Loan, CustomerCreditProfile
 
 
-def calculate_credit_score(customer):
+CREDIT_SNAPSHOT_KEY = 'credit:snapshot:{customer_id}:{version}:{year}'
+
+
+@dataclass(frozen=True)
+class LoanAggregates:
+    """
+    Per-customer loan totals shared by the credit score and the EMI check
+    """
+    loan_count: int = 0
+    total_loan_amount: Decimal = Decimal('0')
+    total_monthly_repayment: Decimal = Decimal('0')
+    on_time_ratio_sum: float = 0.0
+    current_year_loans: int = 0
+
+
+@dataclass(frozen=True)
+class CreditScore:
+    """
+    Credit score together with the points awarded by each component
+    """
+    score: int
+    past_loans_points: float = 0.0
+    loan_count_points: int = 0
+    current_year_points: int = 0
+    approved_volume_points: int = 0
+    over_approved_limit: bool = False
+
+
+def on_time_ratio_expression():
+    """
+    Per-loan share of EMIs paid on time, capped at 1
+    """
+    return Least(
+        Cast('emis_paid_on_time', FloatField()) / Cast('tenure', FloatField()),
+        Value(1.0),
+        output_field=FloatField(),
+    )
+
+
+def _loan_aggregate_expressions(year):
+    return {
+        'loan_count': Count('loan_id'),
+        'total_loan_amount': Sum('loan_amount'),
+        'total_monthly_repayment': Sum('monthly_repayment'),
+        'on_time_ratio_sum': Sum(on_time_ratio_expression(), filter=Q(tenure__gt=0)),
+        'current_year_loans': Count(
+            'loan_id',
+            filter=Q(start_date__year=year) | Q(end_date__year=year)
+        ),
+    }
+
+
+def _aggregates_from_totals(totals):
+    return LoanAggregates(
+        loan_count=totals['loan_count'],
+        total_loan_amount=totals['total_loan_amount'] or Decimal('0'),
+        total_monthly_repayment=totals['total_monthly_repayment'] or Decimal('0'),
+        on_time_ratio_sum=totals['on_time_ratio_sum'] or 0.0,
+        current_year_loans=totals['current_year_loans'],
+    )
+
+
+def aggregate_loans(customer, year=None):
+    """
+    Fetch every input of the credit score and EMI check in a single
+    conditional-aggregation query over the customer's loans
+    """
+    if year is None:
+        year = datetime.now().year
+
+    totals = Loan.objects.filter(customer=customer).aggregate(**_loan_aggregate_expressions(year))
+    return _aggregates_from_totals(totals)
+
+
+async def aaggregate_loans(customer, year=None):
+    """Async variant of aggregate_loans"""
+    if year is None:
+        year = datetime.now().year
+
+    totals = await Loan.objects.filter(customer=customer).aaggregate(
+        **_loan_aggregate_expressions(year)
+    )
+    return _aggregates_from_totals(totals)
+
+
+def aggregate_loans_for_customers(customer_ids, year=None):
+    """
+    Grouped variant of aggregate_loans: one query returning
+    {customer_id: LoanAggregates} for many customers
+    """
+    if year is None:
+        year = datetime.now().year
+
+    rows = Loan.objects.filter(customer_id__in=customer_ids).values('customer_id').annotate(
+        **_loan_aggregate_expressions(year)
+    ).order_by()
+
+    aggregates = {customer_id: LoanAggregates() for customer_id in customer_ids}
+    for row in rows:
+        aggregates[row['customer_id']] = _aggregates_from_totals(row)
+    return aggregates
+
+
+def aggregates_from_profile(profile, year=None):
+    """
+    Build loan aggregates from a materialized credit profile
     """
-    Calculate credit score based on:
+    if year is None:
+        year = datetime.now().year
+
+    return LoanAggregates(
+        loan_count=profile.loan_count,
+        total_loan_amount=Decimal(profile.total_loan_amount),
+        total_monthly_repayment=Decimal(profile.total_monthly_repayment),
+        on_time_ratio_sum=float(profile.on_time_ratio_sum),
+        current_year_loans=profile.activity_by_year.get(str(year), 0),
+    )
+
+
+def get_loan_aggregates(customer, year=None):
+    """
+    Return the customer's loan aggregates, read from the materialized credit
+    profile when one exists and computed from the loans table otherwise
+    """
+    try:
+        profile = customer.credit_profile
+    except CustomerCreditProfile.DoesNotExist:
+        return aggregate_loans(customer, year)
+    return aggregates_from_profile(profile, year)
+
+
+async def aget_loan_aggregates(customer, year=None):
+    """
+    Async variant of get_loan_aggregates. The customer must be loaded with
+    select_related('credit_profile'), since the profile cannot be fetched
+    lazily from async code.
+    """
+    try:
+        profile = customer.credit_profile
+    except CustomerCreditProfile.DoesNotExist:
+        return await aaggregate_loans(customer, year)
+    return aggregates_from_profile(profile, year)
+
+
+@span('credit_score')
+def compute_credit_score(customer, aggregates):
+    """
+    Calculate credit score from pre-fetched loan aggregates based on:
     i. Past Loans paid on time
     ii. Number of loans taken in past
     iii. Loan activity in current year
     iv. Loan approved volume
     v. Current loans vs approved limit
     """
-    
-    # Get all loans for the customer
-    loans = Loan.objects.filter(customer=customer)
-    
-    if not loans.exists():
-        return 50  # Default score for new customers
-    
+    total_loans = aggregates.loan_count
+
+    if total_loans == 0:
+        return CreditScore(score=50)  # Default score for new customers
+
     # Check if sum of current loans > approved limit
-    current_loans_sum = loans.aggregate(
-        total=Sum('loan_amount')
-    )['total'] or Decimal('0')
-    
-    if current_loans_sum > customer.approved_limit:
-        return 0
-    
-    score = 0
-    total_loans = loans.count()
-    
+    if aggregates.total_loan_amount > customer.approved_limit:
+        return CreditScore(score=0, over_approved_limit=True)
+
     # Component 1: Past Loans paid on time (40 points)
-    if total_loans > 0:
-        on_time_payments = sum([
-            min(loan.emis_paid_on_time / loan.tenure, 1.0) 
-            for loan in loans if loan.tenure > 0
-        ]) / total_loans
-        score += on_time_payments * 40
-    
+    past_loans_points = aggregates.on_time_ratio_sum / total_loans * 40
+
     # Component 2: Number of loans (20 points)
     # Optimal: 2-5 loans. Too few or too many reduces score
-    if total_loans == 0:
-        loan_count_score = 0
-    elif 2 <= total_loans <= 5:
-        loan_count_score = 20
+    if 2 <= total_loans <= 5:
+        loan_count_points = 20
     elif total_loans == 1:
-        loan_count_score = 10
+        loan_count_points = 10
     elif 6 <= total_loans <= 10:
-        loan_count_score = 15
+        loan_count_points = 15
     else:
-        loan_count_score = 5
-    score += loan_count_score
-    
+        loan_count_points = 5
+
     # Component 3: Loan activity in current year (20 points)
-    current_year = datetime.now().year
-    current_year_loans = loans.filter(
-        Q(start_date__year=current_year) | Q(end_date__year=current_year)
-    ).count()
-    
-    if current_year_loans > 0:
-        score += min(current_year_loans * 5, 20)
-    
+    current_year_points = min(aggregates.current_year_loans * 5, 20)
+
     # Component 4: Loan approved volume (20 points)
-    total_approved_volume = loans.aggregate(
-        total=Sum('loan_amount')
-    )['total'] or Decimal('0')
-    
+    approved_volume_points = 0
     if customer.approved_limit > 0:
-        utilization_ratio = float(total_approved_volume / customer.approved_limit)
+        utilization_ratio = float(aggregates.total_loan_amount / customer.approved_limit)
         # Optimal utilization: 30-70%
         if 0.3 <= utilization_ratio <= 0.7:
-            score += 20
+            approved_volume_points = 20
         elif 0.1 <= utilization_ratio < 0.3:
-            score += 15
+            approved_volume_points = 15
         elif 0.7 < utilization_ratio <= 0.9:
-            score += 10
+            approved_volume_points = 10
         else:
-            score += 5
-    
-    return min(round(score), 100)
+            approved_volume_points = 5
+
+    score = (
+        past_loans_points + loan_count_points
+        + current_year_points + approved_volume_points
+    )
 
+    return CreditScore(
+        score=min(round(score), 100),
+        past_loans_points=past_loans_points,
+        loan_count_points=loan_count_points,
+        current_year_points=current_year_points,
+        approved_volume_points=approved_volume_points,
+    )
 
+
+@span('credit_score')
+def get_credit_snapshot(customer):
+    """
+    Return (loan_aggregates, credit_score) for a customer, served from the
+    per-customer versioned cache when the customer's data has not changed
+    """
+    year = datetime.now().year
+    key = CREDIT_SNAPSHOT_KEY.format(
+        customer_id=customer.customer_id,
+        version=get_customer_version(customer.customer_id),
+        year=year,
+    )
+
+    snapshot = cache.get(key)
+    if snapshot is not None:
+        record_hit()
+        return snapshot
+
+    record_miss()
+    aggregates = get_loan_aggregates(customer, year)
+    snapshot = (aggregates, compute_credit_score(customer, aggregates))
+    cache.set(key, snapshot, credit_cache_timeout())
+    return snapshot
+
+
+@span('credit_score')
+async def aget_credit_snapshot(customer):
+    """Async variant of get_credit_snapshot"""
+    year = datetime.now().year
+    key = CREDIT_SNAPSHOT_KEY.format(
+        customer_id=customer.customer_id,
+        version=await aget_customer_version(customer.customer_id),
+        year=year,
+    )
+
+    snapshot = await cache.aget(key)
+    if snapshot is not None:
+        record_hit()
+        return snapshot
+
+    record_miss()
+    aggregates = await aget_loan_aggregates(customer, year)
+    snapshot = (aggregates, compute_credit_score(customer, aggregates))
+    await cache.aset(key, snapshot, credit_cache_timeout())
+    return snapshot
+
+
+@span('credit_score')
+def get_credit_snapshots(customers):
+    """
+    Batch variant of get_credit_snapshot returning {customer_id: snapshot}
+    with a constant number of cache round trips and database queries.
+    Customers should be loaded with select_related('credit_profile').
+    """
+    year = datetime.now().year
+    customers = {customer.customer_id: customer for customer in customers}
+    versions = get_customer_versions(customers)
+    keys = {
+        customer_id: CREDIT_SNAPSHOT_KEY.format(
+            customer_id=customer_id, version=versions[customer_id], year=year
+        )
+        for customer_id in customers
+    }
+
+    cached = cache.get_many(list(keys.values()))
+    snapshots = {}
+    missing_profiles = []
+    for customer_id, customer in customers.items():
+        if keys[customer_id] in cached:
+            record_hit()
+            snapshots[customer_id] = cached[keys[customer_id]]
+            continue
+
+        record_miss()
+        try:
+            aggregates = aggregates_from_profile(customer.credit_profile, year)
+        except CustomerCreditProfile.DoesNotExist:
+            missing_profiles.append(customer_id)
+            continue
+        snapshots[customer_id] = (aggregates, compute_credit_score(customer, aggregates))
+
+    if missing_profiles:
+        for customer_id, aggregates in aggregate_loans_for_customers(missing_profiles, year).items():
+            customer = customers[customer_id]
+            snapshots[customer_id] = (aggregates, compute_credit_score(customer, aggregates))
+
+    fresh = {
+        keys[customer_id]: snapshot
+        for customer_id, snapshot in snapshots.items()
+        if keys[customer_id] not in cached
+    }
+    if fresh:
+        cache.set_many(fresh, credit_cache_timeout())
+    return snapshots
+
+
+def calculate_credit_score(customer, aggregates=None):
+    """
+    Calculate credit score for a customer, using the credit cache unless
+    loan aggregates are supplied by the caller
+    """
+    if aggregates is None:
+        return get_credit_snapshot(customer)[1].score
+    return compute_credit_score(customer, aggregates).score
+
+
+@span('emi')
 def calculate_monthly_installment(loan_amount, interest_rate, tenure):
     """
     Calculate monthly installment using compound interest formula
@@ -110,6 +357,50 @@ def calculate_monthly_installment(loan_amount, interest_rate, tenure):
     return round(emi, 2)
 
 
+@span('emi')
+def monthly_installment_cents(loan_amounts, interest_rates, tenures):
+    """
+    Vectorized calculate_monthly_installment over equally sized sequences of
+    loan amounts, annual interest rates and tenures, returning installments
+    in paise as an int64 array. Installments are computed in float64; the
+    values too close to a half-paisa boundary for float precision are
+    recomputed with the Decimal formula, so results always match the scalar
+    function rounded to the paisa (it leaves zero-rate installments
+    unrounded).
+    """
+    P = as_float_array(loan_amounts)
+    r = as_float_array(interest_rates) / 12 / 100
+    n = as_float_array(tenures)
+
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        # (1 + r)^n - 1 via expm1/log1p keeps precision for small rates
+        growth = np.expm1(n * np.log1p(r))
+        emi = np.where(r == 0, P / n, P * r * (growth + 1) / growth)
+    emi = np.where(n == 0, 0.0, emi)
+
+    cents = emi * 100
+    finite = np.isfinite(cents)
+    rounded_cents = np.where(finite, np.round(cents), 0).astype(np.int64)
+    distance_to_half = np.abs(cents - np.floor(cents) - 0.5)
+    tolerance = np.maximum(np.abs(cents) * 1e-12, 1e-9)
+    ambiguous = ~finite | (distance_to_half < tolerance)
+
+    for index in np.flatnonzero(ambiguous).tolist():
+        installment = calculate_monthly_installment(
+            loan_amounts[index], interest_rates[index], tenures[index]
+        )
+        rounded_cents[index] = int(round(installment, 2).scaleb(2))
+    return rounded_cents
+
+
+def calculate_monthly_installments(loan_amounts, interest_rates, tenures):
+    """
+    Batch calculate_monthly_installment returning a list of Decimals
+    """
+    cents = monthly_installment_cents(loan_amounts, interest_rates, tenures)
+    return [Decimal(value).scaleb(-2) for value in cents.tolist()]
+
+
 def get_corrected_interest_rate(credit_score, requested_rate):
     """
     Return corrected interest rate based on credit score
@@ -128,30 +419,55 @@ def get_corrected_interest_rate(credit_score, requested_rate):
         return requested_rate
 
 
-def check_loan_eligibility(customer, loan_amount, interest_rate, tenure):
+def decide_eligibility(customer, aggregates, credit_score, monthly_installment):
     """
-    Check if loan can be approved based on credit score and EMI ratio
-    Returns: (approval_status, corrected_interest_rate, monthly_installment, message)
+    Apply the approval rules to an already computed installment
+    Returns: (approval_status, message)
     """
-    credit_score = calculate_credit_score(customer)
-    corrected_rate = get_corrected_interest_rate(credit_score, Decimal(str(interest_rate)))
-    
-    # Calculate monthly installment with corrected rate
-    monthly_installment = calculate_monthly_installment(loan_amount, corrected_rate, tenure)
-    
     # Check if credit score allows loan
     if credit_score <= 10:
-        return False, corrected_rate, monthly_installment, "Credit score too low for loan approval"
-    
+        return False, "Credit score too low for loan approval"
+
     # Check if sum of all current EMIs > 50% of monthly salary
-    current_emis = Loan.objects.filter(customer=customer).aggregate(
-        total_emi=Sum('monthly_repayment')
-    )['total_emi'] or Decimal('0')
-    
-    total_emi_with_new_loan = current_emis + monthly_installment
-    
+    total_emi_with_new_loan = aggregates.total_monthly_repayment + monthly_installment
+
     if total_emi_with_new_loan > (customer.monthly_salary * Decimal('0.5')):
-        return False, corrected_rate, monthly_installment, "Sum of EMIs exceeds 50% of monthly salary"
-    
+        return False, "Sum of EMIs exceeds 50% of monthly salary"
+
     # Loan approved
-    return True, corrected_rate, monthly_installment, "Loan approved"
+    return True, "Loan approved"
+
+
+def check_loan_eligibility(customer, loan_amount, interest_rate, tenure, aggregates=None):
+    """
+    Check if loan can be approved based on credit score and EMI ratio
+    Returns: (approval_status, corrected_interest_rate, monthly_installment, message)
+    """
+    if aggregates is None:
+        aggregates, breakdown = get_credit_snapshot(customer)
+    else:
+        breakdown = compute_credit_score(customer, aggregates)
+    return eligibility_from_snapshot(customer, aggregates, breakdown, loan_amount, interest_rate, tenure)
+
+
+async def acheck_loan_eligibility(customer, loan_amount, interest_rate, tenure):
+    """Async variant of check_loan_eligibility, reading the credit cache"""
+    aggregates, breakdown = await aget_credit_snapshot(customer)
+    return eligibility_from_snapshot(customer, aggregates, breakdown, loan_amount, interest_rate, tenure)
+
+
+def eligibility_from_snapshot(customer, aggregates, breakdown, loan_amount, interest_rate, tenure):
+    """
+    Correct the interest rate, compute the installment and apply the
+    approval rules for an already scored customer
+    Returns: (approval_status, corrected_interest_rate, monthly_installment, message)
+    """
+    corrected_rate = get_corrected_interest_rate(breakdown.score, Decimal(str(interest_rate)))
+
+    # Calculate monthly installment with corrected rate
+    monthly_installment = calculate_monthly_installment(loan_amount, corrected_rate, tenure)
+
+    approval, message = decide_eligibility(
+        customer, aggregates, breakdown.score, monthly_installment
+    )
+    return approval, corrected_rate, monthly_installment, message
@@ -1,22 +1,46 @@
 from decimal import Decimal
 from datetime import date, timedelta
 from rest_framework import status
-from rest_framework.decorators import api_view
+from rest_framework.decorators import api_view, renderer_classes
 from rest_framework.response import Response
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.http import parse_etags
 
-from .models import Customer, Loan
+from .amortization import amortization_schedules, installment_due_dates
+from .cache import (
+    get_loan_owner, remember_loan_owner, response_etag, get_cached_response, cache_response
+)
+from .envelope import get_eligibility_envelope
+from .idempotency import idempotent
+from .ingestion import find_or_create_ingestion_job
+from .metrics import render_metrics
+from .models import Customer, Loan, IngestionJob, ScoringJob
 from .serializers import (
-    RegisterSerializer, CheckEligibilitySerializer, CreateLoanSerializer,
-    CustomerSerializer, LoanSerializer, LoanListSerializer
+    RegisterSerializer, CheckEligibilitySerializer, CreateLoanSerializer, EligibilityEnvelopeQuerySerializer,
+    EMIGridSerializer, LoanListQuerySerializer, LoanScheduleQuerySerializer, PortfolioDistributionQuerySerializer,
+    ScoringJobRequestSerializer, ScoringJobSerializer,
+    IngestionJobRequestSerializer, IngestionJobSerializer,
+    LOAN_DETAIL_VALUES, LOAN_LIST_VALUES, loan_detail_row, loan_list_row
 )
+from .pagination import LoanCursorPagination
+from .portfolio import get_portfolio_distribution, get_portfolio_summary
+from .renderers import FastJSONRenderer
+from .routers import read_from, replica_alias, replica_alias_for_customers
+from .tasks import run_ingestion_job, run_scoring_job
 from .utils import (
     calculate_monthly_installment, check_loan_eligibility,
-    calculate_credit_score
+    calculate_credit_score, get_credit_snapshots, get_corrected_interest_rate,
+    decide_eligibility, calculate_monthly_installments, monthly_installment_cents,
+    get_loan_aggregates
 )
 
 
 @api_view(['POST'])
+@idempotent
 def register_customer(request):
     """
     Register a new customer with approved limit calculation
@@ -29,12 +53,6 @@ def register_customer(request):
     
     data = serializer.validated_data
     
-    # Check if customer with this phone number already exists
-    if Customer.objects.filter(phone_number=data['phone_number']).exists():
-        return Response({
-            'error': 'Customer with this phone number already exists'
-        }, status=status.HTTP_400_BAD_REQUEST)
-    
     # Calculate approved limit
     monthly_income = Decimal(str(data['monthly_income']))
     approved_limit = monthly_income * 36
@@ -42,16 +60,26 @@ def register_customer(request):
     # Round to nearest lakh (100,000)
     approved_limit = round(approved_limit / 100000) * 100000
     
-    # Create customer
-    customer = Customer.objects.create(
-        first_name=data['first_name'],
-        last_name=data['last_name'],
-        age=data['age'],
-        phone_number=data['phone_number'],
-        monthly_salary=monthly_income,
-        approved_limit=approved_limit,
-        current_debt=0
-    )
+    # Create customer; the unique index on phone_number rejects duplicates
+    # without a separate lookup and without a check-then-insert race
+    try:
+        with transaction.atomic():
+            customer = Customer.objects.create(
+                first_name=data['first_name'],
+                last_name=data['last_name'],
+                age=data['age'],
+                phone_number=data['phone_number'],
+                monthly_salary=monthly_income,
+                approved_limit=approved_limit,
+                current_debt=0
+            )
+    except IntegrityError:
+        # Only a taken phone number is the client's fault
+        if not Customer.objects.filter(phone_number=data['phone_number']).exists():
+            raise
+        return Response({
+            'error': 'Customer with this phone number already exists'
+        }, status=status.HTTP_400_BAD_REQUEST)
     
     response_data = {
         'customer_id': customer.customer_id,
@@ -77,24 +105,106 @@ def check_eligibility(request):
     
     data = serializer.validated_data
     
-    try:
-        customer = Customer.objects.get(customer_id=data['customer_id'])
-    except Customer.DoesNotExist:
-        return Response(
-            {'error': 'Customer not found'},
-            status=status.HTTP_404_NOT_FOUND
+    # Nothing is written, so the customer and their loans can be read from
+    # the replica
+    with read_from(replica_alias(data['customer_id'])):
+        try:
+            customer = Customer.objects.select_related('credit_profile').get(
+                customer_id=data['customer_id']
+            )
+        except Customer.DoesNotExist:
+            return Response(
+                {'error': 'Customer not found'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        
+        loan_amount = data['loan_amount']
+        interest_rate = data['interest_rate']
+        tenure = data['tenure']
+        
+        # Check eligibility
+        approval, corrected_rate, monthly_installment, message = check_loan_eligibility(
+            customer, loan_amount, interest_rate, tenure
         )
     
-    loan_amount = data['loan_amount']
-    interest_rate = data['interest_rate']
-    tenure = data['tenure']
-    
-    # Check eligibility
-    approval, corrected_rate, monthly_installment, message = check_loan_eligibility(
-        customer, loan_amount, interest_rate, tenure
+    response_data = eligibility_response_data(
+        customer, approval, interest_rate, corrected_rate, tenure, monthly_installment
     )
     
-    response_data = {
+    return Response(response_data, status=status.HTTP_200_OK)
+
+
+@api_view(['POST'])
+def check_eligibility_batch(request):
+    """
+    Check loan eligibility for an array of quotes in one call.
+    Customers and their credit data are loaded in a constant number of
+    queries; each entry is answered (or rejected) independently.
+    """
+    if not isinstance(request.data, list):
+        return Response(
+            {'error': 'Expected a list of eligibility requests'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    if len(request.data) > settings.ELIGIBILITY_BATCH_MAX_SIZE:
+        return Response(
+            {'error': f'At most {settings.ELIGIBILITY_BATCH_MAX_SIZE} requests per batch'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    results = [None] * len(request.data)
+    valid = []
+
+    for index, item in enumerate(request.data):
+        serializer = CheckEligibilitySerializer(data=item)
+        if serializer.is_valid():
+            valid.append((index, serializer.validated_data))
+        else:
+            results[index] = {'status': status.HTTP_400_BAD_REQUEST, 'errors': serializer.errors}
+
+    customer_ids = {data['customer_id'] for _, data in valid}
+    with read_from(replica_alias_for_customers(customer_ids)):
+        customers = Customer.objects.select_related('credit_profile').in_bulk(customer_ids)
+        snapshots = get_credit_snapshots(customers.values())
+
+    quotes = []
+    for index, data in valid:
+        customer = customers.get(data['customer_id'])
+        if customer is None:
+            results[index] = {'status': status.HTTP_404_NOT_FOUND, 'error': 'Customer not found'}
+            continue
+
+        breakdown = snapshots[customer.customer_id][1]
+        corrected_rate = get_corrected_interest_rate(breakdown.score, data['interest_rate'])
+        quotes.append((index, data, customer, corrected_rate))
+
+    # All installments are computed together
+    installments = calculate_monthly_installments(
+        [data['loan_amount'] for _, data, _, _ in quotes],
+        [corrected_rate for _, _, _, corrected_rate in quotes],
+        [data['tenure'] for _, data, _, _ in quotes],
+    )
+
+    for (index, data, customer, corrected_rate), monthly_installment in zip(quotes, installments):
+        aggregates, breakdown = snapshots[customer.customer_id]
+        approval, message = decide_eligibility(
+            customer, aggregates, breakdown.score, monthly_installment
+        )
+        results[index] = eligibility_response_data(
+            customer, approval, data['interest_rate'], corrected_rate,
+            data['tenure'], monthly_installment
+        )
+
+    return Response(results, status=status.HTTP_200_OK)
+
+
+def eligibility_response_data(customer, approval, interest_rate, corrected_rate, tenure,
+                              monthly_installment):
+    """
+    Response body shared by the single and batch eligibility endpoints
+    """
+    return {
         'customer_id': customer.customer_id,
         'approval': approval,
         'interest_rate': float(interest_rate),
@@ -102,11 +212,91 @@ def check_eligibility(request):
         'tenure': tenure,
         'monthly_installment': float(monthly_installment)
     }
-    
-    return Response(response_data, status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+def eligibility_envelope(request, customer_id):
+    """
+    Largest approvable loan amount for each tenure and interest rate of a
+    grid, with the minimum rate and installment headroom they follow from.
+    Rows follow `tenures` and columns `interest_rates`. Served from the
+    customer's cached envelope, so repeated calls need no database access.
+    """
+    params = request.query_params
+    query = {}
+    if params.get('interest_rates'):
+        query['interest_rates'] = [rate for rate in params['interest_rates'].split(',') if rate]
+    if params.get('tenures'):
+        query['tenures'] = [tenure for tenure in params['tenures'].split(',') if tenure]
+    serializer = EligibilityEnvelopeQuerySerializer(data=query)
+
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    envelope = get_eligibility_envelope(customer_id)
+    if envelope is None:
+        return Response(
+            {'error': 'Customer not found'},
+            status=status.HTTP_404_NOT_FOUND
+        )
+
+    interest_rates = serializer.validated_data['interest_rates']
+    tenures = serializer.validated_data['tenures']
+    minimum_rate = envelope.minimum_interest_rate
+    amounts = envelope.max_loan_amounts(interest_rates, tenures)
+
+    return Response({
+        'customer_id': envelope.customer_id,
+        'credit_score': envelope.credit_score,
+        'approvable': envelope.approvable,
+        'minimum_interest_rate': None if minimum_rate is None else float(minimum_rate),
+        'emi_headroom': float(envelope.emi_headroom),
+        'interest_rates': [float(rate) for rate in interest_rates],
+        'corrected_interest_rates': [
+            float(get_corrected_interest_rate(envelope.credit_score, Decimal(str(rate))))
+            for rate in interest_rates
+        ],
+        'tenures': tenures,
+        'max_loan_amounts': [[None if amount is None else float(amount) for amount in row] for row in amounts],
+    }, status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+def emi_grid(request):
+    """
+    Monthly installments for a loan amount over a grid of tenures and rates.
+    Rows follow the requested tenures and columns the requested interest rates.
+    """
+    params = request.query_params
+    serializer = EMIGridSerializer(data={
+        'loan_amount': params.get('loan_amount'),
+        'interest_rates': [rate for rate in params.get('interest_rates', '').split(',') if rate],
+        'tenures': [tenure for tenure in params.get('tenures', '').split(',') if tenure],
+    })
+
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    data = serializer.validated_data
+    interest_rates = data['interest_rates']
+    tenures = data['tenures']
+
+    cents = monthly_installment_cents(
+        [data['loan_amount']] * (len(tenures) * len(interest_rates)),
+        interest_rates * len(tenures),
+        [tenure for tenure in tenures for _ in interest_rates],
+    ).reshape(len(tenures), len(interest_rates))
+
+    return Response({
+        'loan_amount': float(data['loan_amount']),
+        'interest_rates': [float(rate) for rate in interest_rates],
+        'tenures': tenures,
+        'monthly_installments': (cents / 100).tolist(),
+    }, status=status.HTTP_200_OK)
 
 
 @api_view(['POST'])
+@idempotent
 def create_loan(request):
     """
     Process a new loan based on eligibility
@@ -117,51 +307,61 @@ def create_loan(request):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
     data = serializer.validated_data
-    
-    try:
-        customer = Customer.objects.get(customer_id=data['customer_id'])
-    except Customer.DoesNotExist:
-        return Response(
-            {'error': 'Customer not found'},
-            status=status.HTTP_404_NOT_FOUND
-        )
-    
     loan_amount = data['loan_amount']
     interest_rate = data['interest_rate']
     tenure = data['tenure']
     
-    # Check eligibility
-    approval, corrected_rate, monthly_installment, message = check_loan_eligibility(
-        customer, loan_amount, interest_rate, tenure
-    )
-    
-    if not approval:
-        return Response({
-            'loan_id': None,
-            'customer_id': customer.customer_id,
-            'loan_approved': False,
-            'message': message,
-            'monthly_installment': float(monthly_installment)
-        }, status=status.HTTP_200_OK)
-    
-    # Create loan
-    start_date = date.today()
-    end_date = start_date + timedelta(days=tenure * 30)  # Approximate
-    
-    loan = Loan.objects.create(
-        customer=customer,
-        loan_amount=loan_amount,
-        tenure=tenure,
-        interest_rate=corrected_rate,
-        monthly_repayment=monthly_installment,
-        emis_paid_on_time=0,
-        start_date=start_date,
-        end_date=end_date
-    )
-    
-    # Update customer's current debt
-    customer.current_debt += loan_amount
-    customer.save()
+    # Lock the customer row so concurrent requests for the same customer
+    # run the eligibility check and insert one after another; requests for
+    # other customers are not blocked
+    with transaction.atomic():
+        try:
+            customer = Customer.objects.select_for_update().get(
+                customer_id=data['customer_id']
+            )
+        except Customer.DoesNotExist:
+            return Response(
+                {'error': 'Customer not found'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        
+        # Read the loan totals after the lock is held rather than from the
+        # score cache, which can briefly lag a loan committed by the request
+        # that held the lock before us
+        aggregates = get_loan_aggregates(customer)
+        
+        # Check eligibility
+        approval, corrected_rate, monthly_installment, message = check_loan_eligibility(
+            customer, loan_amount, interest_rate, tenure, aggregates=aggregates
+        )
+        
+        if not approval:
+            return Response({
+                'loan_id': None,
+                'customer_id': customer.customer_id,
+                'loan_approved': False,
+                'message': message,
+                'monthly_installment': float(monthly_installment)
+            }, status=status.HTTP_200_OK)
+        
+        # Create loan
+        start_date = date.today()
+        end_date = start_date + timedelta(days=tenure * 30)  # Approximate
+        
+        loan = Loan.objects.create(
+            customer=customer,
+            loan_amount=loan_amount,
+            tenure=tenure,
+            interest_rate=corrected_rate,
+            monthly_repayment=monthly_installment,
+            emis_paid_on_time=0,
+            start_date=start_date,
+            end_date=end_date
+        )
+        
+        # Update customer's current debt in the database, writing only that column
+        customer.current_debt = F('current_debt') + loan_amount
+        customer.save(update_fields=['current_debt'])
     
     return Response({
         'loan_id': loan.loan_id,
@@ -173,21 +373,239 @@ def create_loan(request):
 
 
 @api_view(['GET'])
+@renderer_classes([FastJSONRenderer])
 def view_loan(request, loan_id):
     """
-    View loan details by loan_id
+    View loan details by loan_id.
+    Once the loan's customer is known from the cache, a matching
+    If-None-Match is answered with 304 without querying the database.
     """
-    loan = get_object_or_404(Loan, loan_id=loan_id)
-    serializer = LoanSerializer(loan)
-    return Response(serializer.data, status=status.HTTP_200_OK)
+    owner = get_loan_owner(loan_id)
+    etag = None
+    if owner is not None:
+        etag = response_etag(owner, request.build_absolute_uri())
+        if etag_matches(request, etag):
+            return not_modified(etag)
+        data = get_cached_response(etag)
+        if data is not None:
+            return Response(data, status=status.HTTP_200_OK, headers={'ETag': etag})
+    
+    # One query joining the customer, rendered without LoanSerializer
+    with read_from(replica_alias(owner)):
+        loan = get_object_or_404(Loan.objects.values(*LOAN_DETAIL_VALUES), loan_id=loan_id)
+    data = loan_detail_row(loan)
+    
+    if owner != loan['customer__customer_id']:
+        # First request for this loan, or it moved to another customer
+        # since the owner was cached: the next request gets an ETag
+        remember_loan_owner(loan_id, loan['customer__customer_id'])
+        return Response(data, status=status.HTTP_200_OK)
+    
+    cache_response(etag, data)
+    return Response(data, status=status.HTTP_200_OK, headers={'ETag': etag})
 
 
 @api_view(['GET'])
+@renderer_classes([FastJSONRenderer])
 def view_loans_by_customer(request, customer_id):
     """
-    View all loans for a customer
+    View all loans for a customer.
+    With ?page_size and/or ?cursor the loans are returned a page at a time,
+    keyset-paginated on loan_id. With ?stream=true they are streamed as
+    newline-delimited JSON in constant memory.
+    """
+    query = LoanListQuerySerializer(data=request.query_params)
+    if not query.is_valid():
+        return Response(query.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    # The ETag is derived before reading any loans, so a response is never
+    # labelled with a version newer than its data
+    etag = response_etag(customer_id, request.build_absolute_uri())
+    if etag_matches(request, etag):
+        return not_modified(etag)
+    
+    alias = replica_alias(customer_id)
+    if query.validated_data['stream']:
+        with read_from(alias):
+            get_object_or_404(Customer.objects.only('customer_id'), customer_id=customer_id)
+        renderer = FastJSONRenderer()
+        # The rows are read while the response streams, outside read_from
+        rows = Loan.objects.using(alias).filter(customer_id=customer_id).values(*LOAN_LIST_VALUES).order_by(
+            'loan_id'
+        ).iterator(chunk_size=settings.VIEW_LOANS_STREAM_CHUNK_SIZE)
+        lines = (renderer.render(loan_list_row(row)) + b'\n' for row in rows)
+        response = StreamingHttpResponse(lines, content_type='application/x-ndjson')
+        response['ETag'] = etag
+        return response
+    
+    data = get_cached_response(etag)
+    if data is None:
+        with read_from(alias):
+            get_object_or_404(Customer.objects.only('customer_id'), customer_id=customer_id)
+            loans = Loan.objects.filter(customer_id=customer_id).values(*LOAN_LIST_VALUES)
+            if 'cursor' in query.validated_data or 'page_size' in query.validated_data:
+                paginator = LoanCursorPagination()
+                page = paginator.paginate_queryset(loans, request)
+                data = paginator.get_paginated_response([loan_list_row(row) for row in page]).data
+            else:
+                data = [loan_list_row(row) for row in loans]
+        cache_response(etag, data)
+    
+    return Response(data, status=status.HTTP_200_OK, headers={'ETag': etag})
+
+
+@api_view(['GET'])
+def loan_schedule(request, loan_id):
+    """
+    Amortization schedule of a loan, limited to installments ?start to ?end
+    (1-based, inclusive) when given. Only the requested installments are
+    computed.
+    """
+    query = LoanScheduleQuerySerializer(data=request.query_params)
+    if not query.is_valid():
+        return Response(query.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    with read_from(replica_alias(get_loan_owner(loan_id))):
+        loan = get_object_or_404(Loan, loan_id=loan_id)
+    
+    start = query.validated_data['start']
+    end = min(query.validated_data.get('end', loan.tenure), loan.tenure)
+    months = list(range(start, end + 1))
+    schedule = amortization_schedules(
+        [loan.loan_amount], [loan.interest_rate], [loan.monthly_repayment], [loan.tenure], months
+    )
+    due_dates = installment_due_dates(loan.start_date, months)
+    
+    next_installment = loan.emis_paid_on_time + 1
+    return Response({
+        'loan_id': loan.loan_id,
+        'customer_id': loan.customer_id,
+        'loan_amount': float(loan.loan_amount),
+        'interest_rate': float(loan.interest_rate),
+        'monthly_installment': float(loan.monthly_repayment),
+        'tenure': loan.tenure,
+        'emis_paid_on_time': loan.emis_paid_on_time,
+        'repayments_left': loan.repayments_left,
+        'outstanding_principal': float(loan.outstanding_principal),
+        'next_due_date': (
+            installment_due_dates(loan.start_date, [next_installment])[0]
+            if next_installment <= loan.tenure else None
+        ),
+        'schedule': [
+            {
+                'installment': month,
+                'due_date': due_date,
+                'payment': payment / 100,
+                'principal': principal / 100,
+                'interest': interest / 100,
+                'balance': balance / 100,
+                'paid': month <= loan.emis_paid_on_time,
+            }
+            for month, due_date, payment, principal, interest, balance in zip(
+                months, due_dates, schedule.payment[0].tolist(), schedule.principal[0].tolist(),
+                schedule.interest[0].tolist(), schedule.balance[0].tolist()
+            )
+        ],
+    }, status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+def portfolio_summary(request):
+    """
+    Portfolio totals: exposure, EMI burden and score distribution, served
+    from the cache refreshed by the refresh_portfolio task
+    """
+    return Response(get_portfolio_summary(), status=status.HTTP_200_OK)
+
+
+@api_view(['GET'])
+def portfolio_distribution(request):
+    """
+    Loans grouped ?by=vintage (default), interest_band or score_band, with
+    each bucket's share of the exposure
     """
-    customer = get_object_or_404(Customer, customer_id=customer_id)
-    loans = Loan.objects.filter(customer=customer)
-    serializer = LoanListSerializer(loans, many=True)
-    return Response(serializer.data, status=status.HTTP_200_OK)
+    query = PortfolioDistributionQuerySerializer(data=request.query_params)
+    if not query.is_valid():
+        return Response(query.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    return Response(get_portfolio_distribution(query.validated_data['by']), status=status.HTTP_200_OK)
+
+
+@api_view(['POST'])
+def submit_scoring_job(request):
+    """
+    Start rescoring all customers, or those in customer_ids and/or whose
+    credit profile changed since updated_since, in chunked Celery tasks.
+    Poll the returned job for progress.
+    """
+    serializer = ScoringJobRequestSerializer(data=request.data)
+    
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    data = serializer.validated_data
+    job = ScoringJob.objects.create(
+        customer_ids=data.get('customer_ids'),
+        updated_since=data.get('updated_since'),
+        chunk_size=data.get('chunk_size', settings.SCORING_CHUNK_SIZE),
+    )
+    transaction.on_commit(lambda: run_scoring_job.delay(job.pk))
+    
+    return Response(ScoringJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+
+@api_view(['GET'])
+def view_scoring_job(request, job_id):
+    """
+    Progress of a scoring job
+    """
+    job = get_object_or_404(ScoringJob, pk=job_id)
+    return Response(ScoringJobSerializer(job).data, status=status.HTTP_200_OK)
+
+
+@api_view(['POST'])
+def submit_ingestion_job(request):
+    """
+    Load customer and loan files from INGEST_DATA_DIR in a Celery task,
+    committing in checkpoints. Submitting the same files again resumes the
+    unfinished job instead of starting over.
+    """
+    serializer = IngestionJobRequestSerializer(data=request.data)
+    
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    data = serializer.validated_data
+    job, created = find_or_create_ingestion_job(
+        data['customers_file'], data['loans_file'],
+        upsert=data['upsert'], recompute_emi=data['recompute_emi'], force=data['force'],
+        chunk_size=data['chunk_size'],
+    )
+    if job.status == IngestionJob.RUNNING:
+        return Response(IngestionJobSerializer(job).data, status=status.HTTP_200_OK)
+    
+    transaction.on_commit(lambda: run_ingestion_job.delay(job.pk))
+    return Response(IngestionJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+
+@api_view(['GET'])
+def view_ingestion_job(request, job_id):
+    """
+    Progress of an ingestion job: rows done, rows/second and ETA
+    """
+    job = get_object_or_404(IngestionJob, pk=job_id)
+    return Response(IngestionJobSerializer(job).data, status=status.HTTP_200_OK)
+
+
+def etag_matches(request, etag):
+    """Whether the request's If-None-Match header lists etag"""
+    return etag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+
+
+def not_modified(etag):
+    return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+
+def metrics(request):
+    """Request metrics of this process in the Prometheus text format"""
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')